@@ -1,9 +1,13 @@
+import os
+
 from PySide2.QtCore import Qt, QSize
 from PySide2.QtGui import QIcon
+from PySide2.QtGui import QDoubleValidator
 from PySide2.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLineEdit, QComboBox, QHBoxLayout, QLabel, \
-    QColorDialog, QSlider
+    QColorDialog, QSlider, QCheckBox, QProgressBar
 
 from GUI.control_widgets.abstract_control_widget import AbstractControlWidget
+from vtk_rendering import TRANSFER_FUNCTION_PRESETS
 
 
 class VTKControlWidget(AbstractControlWidget):
@@ -92,6 +96,30 @@ class VTKControlWidget(AbstractControlWidget):
         self.color_layout.addWidget(self.set_color_button, 0, Qt.AlignRight)
         self.left_layout.addWidget(self.color_widget)
 
+        # level of detail widget
+        self.lod_widget = QWidget(self.left_content)
+        self.lod_layout = QHBoxLayout(self.lod_widget)
+        self.lod_layout.setSpacing(6)
+        self.lod_layout.setContentsMargins(0, 0, 0, 0)
+        #   checkbox to enable the level of detail for large meshes
+        self.lod_checkbox = QCheckBox(self.lod_widget)
+        self.lod_checkbox.setText("level of detail")
+        self.lod_checkbox.setChecked(True)
+        self.lod_checkbox.setStyleSheet("color: #ffffff")
+        self.lod_layout.addWidget(self.lod_checkbox)
+        #   line edit for the frame rate target
+        self.frame_rate_edit = QLineEdit(self.lod_widget)
+        self.frame_rate_edit.setPlaceholderText("target fps")
+        self.frame_rate_edit.setValidator(QDoubleValidator(0.1, 240, 1, self.frame_rate_edit))
+        self.frame_rate_edit.setStyleSheet(self.field_style)
+        self.lod_layout.addWidget(self.frame_rate_edit)
+        #   set frame rate button
+        self.frame_rate_button = QPushButton(self.lod_widget)
+        self.frame_rate_button.setText("set fps")
+        self.frame_rate_button.setStyleSheet(self.button_style)
+        self.lod_layout.addWidget(self.frame_rate_button, 0, Qt.AlignRight)
+        self.left_layout.addWidget(self.lod_widget)
+
         # reset camera button
         self.reset_camera_button = QPushButton(self.opacity_widget)
         self.reset_camera_button.setText("reset camera")
@@ -103,6 +131,13 @@ class VTKControlWidget(AbstractControlWidget):
         self.clear_button.setText("clear graph")
         self.clear_button.setStyleSheet(self.button_style)
         self.left_layout.addWidget(self.clear_button)
+
+        # progress of the pipelines that are prepared in the background
+        self.progress_bar = QProgressBar(self.left_content)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setStyleSheet("color: #ffffff")
+        self.progress_bar.setVisible(False)
+        self.left_layout.addWidget(self.progress_bar)
         ###############################################################################################################
         # right content
         ###############################################################################################################
@@ -136,8 +171,107 @@ class VTKControlWidget(AbstractControlWidget):
         self.erase_volume_button.setIcon(self.erase_icon)
         self.erase_volume_button.setStyleSheet(self.button_style)
         self.plot_volume_layout.addWidget(self.erase_volume_button)
+        #   transfer function preset combobox
+        self.transfer_function_combobox = QComboBox(self.plot_volume_widget)
+        self.transfer_function_combobox.setStyleSheet(self.field_style)
+        self.transfer_function_combobox.addItems(list(TRANSFER_FUNCTION_PRESETS))
+        self.plot_volume_layout.addWidget(self.transfer_function_combobox)
         # add the widget
         self.right_layout.addWidget(self.plot_volume_widget, 0, Qt.AlignTop)
+
+        # isosurface widget
+        self.isosurface_widget = QWidget(self.right_content)
+        self.isosurface_layout = QHBoxLayout(self.isosurface_widget)
+        self.isosurface_layout.setContentsMargins(0, 0, 0, 0)
+        #   line edit for the iso-value
+        self.iso_value_edit = QLineEdit(self.isosurface_widget)
+        self.iso_value_edit.setPlaceholderText("iso-value")
+        self.iso_value_edit.setStyleSheet(self.field_style)
+        self.isosurface_layout.addWidget(self.iso_value_edit)
+        #   line edit for the sub-volume
+        self.sub_volume_edit = QLineEdit(self.isosurface_widget)
+        self.sub_volume_edit.setPlaceholderText("x0,x1,y0,y1,z0,z1")
+        self.sub_volume_edit.setStyleSheet(self.field_style)
+        self.isosurface_layout.addWidget(self.sub_volume_edit)
+        #   isosurface button
+        self.isosurface_button = QPushButton(self.isosurface_widget)
+        self.isosurface_button.setText("isosurface")
+        self.isosurface_button.setStyleSheet(self.button_style)
+        self.isosurface_layout.addWidget(self.isosurface_button)
+        self.right_layout.addWidget(self.isosurface_widget, 0, Qt.AlignTop)
+
+        # region of interest widget
+        self.roi_widget = QWidget(self.right_content)
+        self.roi_layout = QHBoxLayout(self.roi_widget)
+        self.roi_layout.setContentsMargins(0, 0, 0, 0)
+        #   checkbox that shows the box widget
+        self.roi_checkbox = QCheckBox(self.roi_widget)
+        self.roi_checkbox.setText("ROI")
+        self.roi_checkbox.setStyleSheet("color: #ffffff")
+        self.roi_layout.addWidget(self.roi_checkbox)
+        #   crop button
+        self.crop_button = QPushButton(self.roi_widget)
+        self.crop_button.setText("crop")
+        self.crop_button.setStyleSheet(self.button_style)
+        self.roi_layout.addWidget(self.crop_button)
+        #   clip button
+        self.clip_button = QPushButton(self.roi_widget)
+        self.clip_button.setText("clip")
+        self.clip_button.setStyleSheet(self.button_style)
+        self.roi_layout.addWidget(self.clip_button)
+        #   reset button
+        self.reset_roi_button = QPushButton(self.roi_widget)
+        self.reset_roi_button.setText("reset")
+        self.reset_roi_button.setStyleSheet(self.button_style)
+        self.roi_layout.addWidget(self.reset_roi_button)
+        self.right_layout.addWidget(self.roi_widget, 0, Qt.AlignTop)
+
+        # reslice widget
+        self.reslice_widget = QWidget(self.right_content)
+        self.reslice_layout = QHBoxLayout(self.reslice_widget)
+        self.reslice_layout.setContentsMargins(0, 0, 0, 0)
+        #   show slices button
+        self.reslice_button = QPushButton(self.reslice_widget)
+        self.reslice_button.setText("show slices")
+        self.reslice_button.setStyleSheet(self.button_style)
+        self.reslice_layout.addWidget(self.reslice_button)
+        #   erase slices button
+        self.erase_slices_button = QPushButton(self.reslice_widget)
+        self.erase_slices_button.setIcon(self.erase_icon)
+        self.erase_slices_button.setStyleSheet(self.button_style)
+        self.reslice_layout.addWidget(self.erase_slices_button)
+        self.right_layout.addWidget(self.reslice_widget, 0, Qt.AlignTop)
+        #   a slider per slice orientation
+        self.slice_sliders = {}
+        for orientation in ("axial", "coronal", "sagittal"):
+            slice_widget = QWidget(self.right_content)
+            slice_layout = QHBoxLayout(slice_widget)
+            slice_layout.setContentsMargins(0, 0, 0, 0)
+            slice_label = QLabel(slice_widget)
+            slice_label.setText(orientation)
+            slice_label.setStyleSheet("color: #ffffff")
+            slice_layout.addWidget(slice_label)
+            slice_slider = QSlider(Qt.Horizontal, slice_widget)
+            slice_slider.setEnabled(False)
+            slice_layout.addWidget(slice_slider)
+            self.slice_sliders[orientation] = slice_slider
+            self.right_layout.addWidget(slice_widget, 0, Qt.AlignTop)
+
+        # snapshot export widget
+        self.export_widget = QWidget(self.right_content)
+        self.export_layout = QHBoxLayout(self.export_widget)
+        self.export_layout.setContentsMargins(0, 0, 0, 0)
+        #   line edit for the number of turntable frames
+        self.turntable_frames_edit = QLineEdit(self.export_widget)
+        self.turntable_frames_edit.setPlaceholderText("turntable frames")
+        self.turntable_frames_edit.setStyleSheet(self.field_style)
+        self.export_layout.addWidget(self.turntable_frames_edit)
+        #   export button
+        self.export_button = QPushButton(self.export_widget)
+        self.export_button.setText("export snapshots")
+        self.export_button.setStyleSheet(self.button_style)
+        self.export_layout.addWidget(self.export_button)
+        self.right_layout.addWidget(self.export_widget, 0, Qt.AlignTop)
         self.content_layout.addWidget(self.right_content, 0, Qt.AlignLeft)
 
     def showColorDialog(self) -> None:
@@ -183,6 +317,34 @@ class VTKControlWidget(AbstractControlWidget):
         if index != -1:  # If the string is found in the combobox
             dicom_volume_box.removeItem(index)
 
+    def set_slice_ranges(self, extent) -> None:
+        """
+        sets the range of the slice sliders to the extent of a volume and moves them to the middle slice.
+        :param extent: the extent of the volume (xmin, xmax, ymin, ymax, zmin, zmax), or None to disable the sliders
+        :return: None
+        """
+        for orientation, axis in (("axial", 2), ("coronal", 1), ("sagittal", 0)):
+            slider = self.slice_sliders[orientation]
+            slider.blockSignals(True)
+            if extent is None:
+                slider.setEnabled(False)
+            else:
+                slider.setRange(extent[2 * axis], extent[2 * axis + 1])
+                slider.setValue((extent[2 * axis] + extent[2 * axis + 1]) // 2)
+                slider.setEnabled(True)
+            slider.blockSignals(False)
+
+    def set_progress(self, filename: str, percentage: int) -> None:
+        """
+        shows the progress of the pipeline that is prepared for a file, the bar is hidden once it is done.
+        :param filename: the file that is prepared
+        :param percentage: the progress between 0 and 100
+        :return: None
+        """
+        self.progress_bar.setFormat(f"preparing {os.path.basename(filename)}: %p%")
+        self.progress_bar.setValue(percentage)
+        self.progress_bar.setVisible(percentage < 100)
+
     def get_mesh_color(self) -> str:
         """
         :return: The current picked mesh color as a string in hex representation.
@@ -208,6 +370,48 @@ class VTKControlWidget(AbstractControlWidget):
         """
         return self.plot_volume_button
 
+    def get_isosurface_button(self) -> QPushButton:
+        """
+        :return: the button for extracting an isosurface from the selected DICOM volume
+        """
+        return self.isosurface_button
+
+    def get_crop_button(self) -> QPushButton:
+        """
+        :return: the button for cropping the selected volume to the region of interest
+        """
+        return self.crop_button
+
+    def get_clip_button(self) -> QPushButton:
+        """
+        :return: the button for clipping the selected volume with the planes of the region of interest
+        """
+        return self.clip_button
+
+    def get_reset_roi_button(self) -> QPushButton:
+        """
+        :return: the button for removing the cropping and clipping of the selected volume
+        """
+        return self.reset_roi_button
+
+    def get_export_button(self) -> QPushButton:
+        """
+        :return: the button for rendering snapshots of a directory of datasets
+        """
+        return self.export_button
+
+    def get_reslice_button(self) -> QPushButton:
+        """
+        :return: the button for showing the axial, coronal and sagittal slices of the selected DICOM volume
+        """
+        return self.reslice_button
+
+    def get_erase_slices_button(self) -> QPushButton:
+        """
+        :return: the button for removing the slice views
+        """
+        return self.erase_slices_button
+
     def get_plot_button(self) -> QPushButton:
         """
         :return: the plot button used to plot all other data than DICOM volumes
@@ -226,6 +430,12 @@ class VTKControlWidget(AbstractControlWidget):
         """
         return self.set_color_button
 
+    def get_frame_rate_button(self) -> QPushButton:
+        """
+        :return: the button for setting the frame rate target during interaction
+        """
+        return self.frame_rate_button
+
     def get_reset_camera_button(self) -> QPushButton:
         """
         :return: the button for resetting the camera angle
@@ -257,6 +467,12 @@ class VTKControlWidget(AbstractControlWidget):
         """
         return self.dicom_combobox
 
+    def get_transfer_function_combo(self) -> QComboBox:
+        """
+        :return: the combo box containing the transfer function presets for volumes
+        """
+        return self.transfer_function_combobox
+
     # Qslider getter
     def get_opacity_slider(self):
         """
@@ -264,9 +480,54 @@ class VTKControlWidget(AbstractControlWidget):
         """
         return self.opacity_slider
 
+    def get_slice_slider(self, orientation: str) -> QSlider:
+        """
+        :param orientation: "axial", "coronal" or "sagittal"
+        :return: the slider that selects the slice in that orientation
+        """
+        return self.slice_sliders[orientation]
+
     # label getter
     def get_opacity_label(self):
         """
         :return: the label that displays the current value of the opacity slider
         """
         return self.opacity_label
+
+    # QCheckBox getter
+    def get_lod_checkbox(self) -> QCheckBox:
+        """
+        :return: the checkbox that enables the level of detail for large meshes
+        """
+        return self.lod_checkbox
+
+    def get_roi_checkbox(self) -> QCheckBox:
+        """
+        :return: the checkbox that shows the region of interest of the selected volume
+        """
+        return self.roi_checkbox
+
+    # QLineEdit getter
+    def get_frame_rate_edit(self) -> str:
+        """
+        :return: the frame rate target that is filled in
+        """
+        return self.frame_rate_edit.text()
+
+    def get_turntable_frames_edit(self) -> str:
+        """
+        :return: the number of turntable frames that is filled in
+        """
+        return self.turntable_frames_edit.text()
+
+    def get_iso_value_edit(self) -> str:
+        """
+        :return: the iso-value that is filled in
+        """
+        return self.iso_value_edit.text()
+
+    def get_sub_volume_edit(self) -> str:
+        """
+        :return: the sub-volume that is filled in, as comma separated voxel indices
+        """
+        return self.sub_volume_edit.text()
@@ -45,6 +45,16 @@ class ConnectionControlWidget(AbstractControlWidget):
         self.plot_label.setText("plot")
         self.plot_label.setStyleSheet("color:#ffffff")
         self.info_widget_layout.addWidget(self.plot_label, 1, Qt.AlignRight)
+        #       detect beats label
+        self.beats_label = QLabel(self.info_widget)
+        self.beats_label.setText("beats")
+        self.beats_label.setStyleSheet("color:#ffffff")
+        self.info_widget_layout.addWidget(self.beats_label, 0, Qt.AlignRight)
+        #       rms envelope label
+        self.rms_label = QLabel(self.info_widget)
+        self.rms_label.setText("rms")
+        self.rms_label.setStyleSheet("color:#ffffff")
+        self.info_widget_layout.addWidget(self.rms_label, 0, Qt.AlignRight)
         self.device_list_layout.addWidget(self.info_widget, 0, Qt.AlignTop)
 
         self.scroll_area.setWidget(self.device_list_widget)
@@ -117,10 +127,14 @@ class Device:
         self.label.setText(device_name)
         self.label.setStyleSheet("color:#ffffff;")
         self.checkbox = QCheckBox(self.main)
+        self.beats_checkbox = QCheckBox(self.main)
+        self.rms_checkbox = QCheckBox(self.main)
         self.main.setStyleSheet("background-color: #3a3b3d")
 
         self.layout.addWidget(self.label)
         self.layout.addWidget(self.checkbox, 0, Qt.AlignRight)
+        self.layout.addWidget(self.beats_checkbox, 0, Qt.AlignRight)
+        self.layout.addWidget(self.rms_checkbox, 0, Qt.AlignRight)
 
     def get_widget(self) -> QWidget:
         """
@@ -133,3 +147,15 @@ class Device:
         :return: True if the plot data checkbox is checked, else False
         """
         return self.checkbox.isChecked()
+
+    def is_detecting_beats(self) -> bool:
+        """
+        :return: True if the detect beats checkbox is checked, else False
+        """
+        return self.beats_checkbox.isChecked()
+
+    def is_computing_rms(self) -> bool:
+        """
+        :return: True if the rms envelope checkbox is checked, else False
+        """
+        return self.rms_checkbox.isChecked()
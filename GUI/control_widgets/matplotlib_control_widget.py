@@ -4,6 +4,7 @@ from PySide2.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLineEdit, QCom
 
 from GUI.control_widgets.abstract_control_widget import AbstractControlWidget
 from GUI.settings import FilterSettingsDialog
+from custom_math import ROLLING_STATISTICS
 
 
 class MatPlotLibControlWidget(AbstractControlWidget):
@@ -106,6 +107,23 @@ class MatPlotLibControlWidget(AbstractControlWidget):
         self.clear_button.setStyleSheet(self.button_style)
         self.left_layout.addWidget(self.clear_button)
 
+        # history widget to undo and redo operations on the selected data
+        self.history_widget = QWidget(self.left_content)
+        self.history_layout = QHBoxLayout(self.history_widget)
+        self.history_layout.setSpacing(6)
+        self.history_layout.setContentsMargins(0, 0, 0, 0)
+        #   undo button
+        self.undo_button = QPushButton(self.history_widget)
+        self.undo_button.setText("undo")
+        self.undo_button.setStyleSheet(self.button_style)
+        self.history_layout.addWidget(self.undo_button)
+        #   redo button
+        self.redo_button = QPushButton(self.history_widget)
+        self.redo_button.setText("redo")
+        self.redo_button.setStyleSheet(self.button_style)
+        self.history_layout.addWidget(self.redo_button)
+        self.left_layout.addWidget(self.history_widget)
+
 
 
         ###############################################################################################################
@@ -177,6 +195,67 @@ class MatPlotLibControlWidget(AbstractControlWidget):
         self.filter_layout.addWidget(self.filter_button)
         self.right_layout.addWidget(self.filter_widget, 0, Qt.AlignTop)
 
+        # spectral analysis widget to compute the frequency content of the data that is selected
+        self.spectral_widget = QWidget(self.right_content)
+        self.spectral_layout = QHBoxLayout(self.spectral_widget)
+        self.spectral_layout.setContentsMargins(0, 0, 0, 0)
+        #   combobox for the type of analysis
+        self.spectral_type = QComboBox(self.spectral_widget)
+        self.spectral_type.setStyleSheet(self.field_style)
+        self.spectral_type.addItems(['PSD', 'spectrogram', 'band power'])
+        self.spectral_layout.addWidget(self.spectral_type)
+        #   button to run the analysis
+        self.spectral_button = QPushButton(self.spectral_widget)
+        self.spectral_button.setText("analyse")
+        self.spectral_button.setStyleSheet(self.button_style)
+        self.spectral_layout.addWidget(self.spectral_button)
+        self.right_layout.addWidget(self.spectral_widget, 0, Qt.AlignTop)
+
+        # resample widget to change the sampling rate of the data that is selected
+        self.resample_widget = QWidget(self.right_content)
+        self.resample_layout = QHBoxLayout(self.resample_widget)
+        self.resample_layout.setSpacing(6)
+        self.resample_layout.setContentsMargins(0, 0, 0, 0)
+        #   rate field
+        self.resample_rate = QLineEdit(self.resample_widget)
+        self.resample_rate.setPlaceholderText("rate (Hz)")
+        self.resample_rate.setStyleSheet(self.field_style)
+        self.resample_layout.addWidget(self.resample_rate)
+        #   resample button
+        self.resample_button = QPushButton(self.resample_widget)
+        self.resample_button.setText("resample")
+        self.resample_button.setStyleSheet(self.button_style)
+        self.resample_layout.addWidget(self.resample_button)
+        self.right_layout.addWidget(self.resample_widget, 0, Qt.AlignTop)
+
+        # rolling statistics widget to compute envelopes of the data that is selected
+        self.rolling_widget = QWidget(self.right_content)
+        self.rolling_layout = QHBoxLayout(self.rolling_widget)
+        self.rolling_layout.setSpacing(6)
+        self.rolling_layout.setContentsMargins(0, 0, 0, 0)
+        #   combobox for the statistic
+        self.rolling_statistic = QComboBox(self.rolling_widget)
+        self.rolling_statistic.setStyleSheet(self.field_style)
+        self.rolling_statistic.addItems(ROLLING_STATISTICS)
+        self.rolling_layout.addWidget(self.rolling_statistic)
+        #   window field
+        self.rolling_window = QLineEdit(self.rolling_widget)
+        self.rolling_window.setPlaceholderText("window (s)")
+        self.rolling_window.setStyleSheet(self.field_style)
+        self.rolling_layout.addWidget(self.rolling_window)
+        #   rolling button
+        self.rolling_button = QPushButton(self.rolling_widget)
+        self.rolling_button.setText("rolling")
+        self.rolling_button.setStyleSheet(self.button_style)
+        self.rolling_layout.addWidget(self.rolling_button)
+        self.right_layout.addWidget(self.rolling_widget, 0, Qt.AlignTop)
+
+        # button to detect the heart beats in the data that is selected
+        self.detect_events_button = QPushButton(self.right_content)
+        self.detect_events_button.setText("detect R-peaks")
+        self.detect_events_button.setStyleSheet(self.button_style)
+        self.right_layout.addWidget(self.detect_events_button, 0, Qt.AlignTop)
+
         # add the content
         self.content_layout.addWidget(self.right_content, 0, Qt.AlignLeft)
 
@@ -266,6 +345,42 @@ class MatPlotLibControlWidget(AbstractControlWidget):
         """
         return self.filter_button
 
+    def get_spectral_button(self) -> QPushButton:
+        """
+        :return: the button to run the spectral analysis on the data selected in the combo box
+        """
+        return self.spectral_button
+
+    def get_resample_button(self) -> QPushButton:
+        """
+        :return: the button to resample the data selected in the combo box
+        """
+        return self.resample_button
+
+    def get_rolling_button(self) -> QPushButton:
+        """
+        :return: the button to compute a rolling statistic of the data selected in the combo box
+        """
+        return self.rolling_button
+
+    def get_undo_button(self) -> QPushButton:
+        """
+        :return: the button to undo the last operation on the selected data
+        """
+        return self.undo_button
+
+    def get_redo_button(self) -> QPushButton:
+        """
+        :return: the button to redo the last undone operation on the selected data
+        """
+        return self.redo_button
+
+    def get_detect_events_button(self) -> QPushButton:
+        """
+        :return: the button to detect R-peaks in the data selected in the combo box
+        """
+        return self.detect_events_button
+
     # QLineEdit getters
 
     def get_title_edit(self) -> str:
@@ -298,6 +413,18 @@ class MatPlotLibControlWidget(AbstractControlWidget):
         """
         return self.limit_max.text()
 
+    def get_resample_rate_edit(self) -> str:
+        """
+        :return: the field to get the new sampling rate
+        """
+        return self.resample_rate.text()
+
+    def get_rolling_window_edit(self) -> str:
+        """
+        :return: the field to get the length of the rolling window in seconds
+        """
+        return self.rolling_window.text()
+
     # QComboBox getters
 
     def get_choose_data_combo(self) -> QComboBox:
@@ -312,3 +439,15 @@ class MatPlotLibControlWidget(AbstractControlWidget):
         """
         return self.convolve_data
 
+    def get_spectral_type_combo(self) -> QComboBox:
+        """
+        :return: the combo box for choosing the type of spectral analysis
+        """
+        return self.spectral_type
+
+
+    def get_rolling_statistic_combo(self) -> QComboBox:
+        """
+        :return: the combo box for choosing the rolling statistic
+        """
+        return self.rolling_statistic
@@ -9,6 +9,9 @@ from GUI.popups import ErrorDialog
 from GUI.settings import PlotSettingsDialog
 
 from data_manager import Data
+from profiler import profiler
+from session import to_json_value
+from shared_ingest import ProcessIngest
 import custom_math as cm
 import matplotlib.style as mplstyle
 mplstyle.use('fast')
@@ -39,8 +42,14 @@ class MatPlotLibImageWidget(AbstractImageWidget):
     def __init__(self):
         super().__init__()
         self.loaded_data_dict = {}
+        # the y columns that are plotted per file and the files that are plotted as a spectrogram, for the session
+        self.plotted_columns: dict[str, list] = {}
+        self.spectrograms: set[str] = set()
         self.animator = None
         self.animations: list[Animation] = []
+        # devices that are read by an ingest process, their samples are read from shared memory every frame
+        self.shared_sources: dict[str, ProcessIngest] = {}
+        self.animation_length: int = 100
         self.setup()
 
     def setup(self) -> None:
@@ -92,44 +101,122 @@ class MatPlotLibImageWidget(AbstractImageWidget):
                 action.setIcon(QIcon("GUI/icons/search_white.svg"))
         layout.addWidget(self.toolbar)
 
-    def update_animation_data(self, filename: str, data:DataFrame) -> None:
+    def update_animation_data(self, filename: str, x: numpy.ndarray, y: numpy.ndarray) -> None:
         """
         updates the data inside the animations and keeps the last 100 values to improve efficiëncy
         :param filename: the filename of the data, which is also the name of the animation.
-        :param data: the dataframe containing the newly obtained data from the connection
+        :param x: the newly obtained x values from the connection
+        :param y: the newly obtained y values from the connection
         :return: None
         """
-        x = cm.df_column_to_numpy(data, 0)
-        y = cm.df_column_to_numpy(data, 1)
-        for animation in self.animations:
-            if animation.name == filename:
-                animation.x = numpy.append(animation.x, x)[-100:]
-                animation.y = numpy.append(animation.y, y)[-100:]
+        for ani in self.animations:
+            if ani.name == filename:
+                ani.x = numpy.append(ani.x, x)[-self.animation_length:]
+                ani.y = numpy.append(ani.y, y)[-self.animation_length:]
                 return
         # if no animation was found, add a new one
         new_animation = Animation(filename, x, y)
         self.animations.append(new_animation)
 
+    def set_animation_data(self, filename: str, x: numpy.ndarray, y: numpy.ndarray) -> None:
+        """
+        replaces the data of an animation, without copying it.
+        :param filename: the filename of the data, which is also the name of the animation.
+        :param x: the x values
+        :param y: the y values
+        :return: None
+        """
+        for ani in self.animations:
+            if ani.name == filename:
+                ani.x = x
+                ani.y = y
+                return
+        self.animations.append(Animation(filename, x, y))
+
+    def add_shared_source(self, name: str, source: ProcessIngest) -> None:
+        """
+        adds a device that is read by an ingest process. Its latest samples are copied from the shared memory and
+        plotted every frame.
+        :param name: the name of the device, which is also the name of the animation
+        :param source: the ingest process of the device
+        :return: None
+        """
+        self.shared_sources[name] = source
+
+    def remove_shared_source(self, name: str) -> None:
+        """
+        stops reading a device from shared memory. The animations keep their last samples, which are copies, so the
+        shared memory can be released afterwards.
+        :param name: the name of the device
+        :return: None
+        """
+        self.shared_sources.pop(name, None)
+
+    def read_shared_sources(self) -> None:
+        """
+        points the animations of the devices that are read by an ingest process to their latest samples in shared
+        memory, and updates their heart rate.
+        :return: None
+        """
+        for name, source in self.shared_sources.items():
+            if source.samples.get_count():
+                x, y = source.samples.get_latest(self.animation_length)
+                self.set_animation_data(name, x, y)
+            if source.rms_samples.get_count():
+                x, y = source.rms_samples.get_latest(self.animation_length)
+                self.set_animation_data(f"{name} rms", x, y)
+            self.update_heart_rate(name, source.get_heart_rate())
+
+    def update_heart_rate(self, filename: str, heart_rate) -> None:
+        """
+        updates the heart rate that is displayed next to an animation.
+        :param filename: the filename of the data, which is also the name of the animation.
+        :param heart_rate: the heart rate in beats per minute, or None if it is not known yet
+        :return: None
+        """
+        for ani in self.animations:
+            if ani.name == filename:
+                ani.heart_rate = heart_rate
+                return
+
     def animate(self, i) -> None:
         """
         callback for the FuncAnimator. this method plots the animations by updating the data in of the line.
         :param i:
         :return: None
         """
+        with profiler.measure("MatPlotLibImageWidget.animate", "plot"):
+            self.read_shared_sources()
+            self.update_animations()
+        with profiler.measure("canvas.draw", "plot"):
+            self.canvas.draw()
+
+    def update_animations(self) -> None:
+        """
+        updates the lines and heart rate labels of the animations with their latest data.
+        :return: None
+        """
         all_x = []
         all_y = []
 
-        for ani in self.animations:
+        for index, ani in enumerate(self.animations):
             if ani.line:
                 ani.line.set_data(ani.x, ani.y)
             else:
                 ani.line, = self.canvas.axes.plot(ani.x, ani.y)
+            if ani.heart_rate is not None:
+                label = f"{ani.name}: {ani.heart_rate:.0f} bpm"
+                if ani.rate_text is None:
+                    ani.rate_text = self.canvas.axes.text(0.01, 0.98 - 0.05 * index, label,
+                                                          transform=self.canvas.axes.transAxes, va="top",
+                                                          color=ani.line.get_color())
+                else:
+                    ani.rate_text.set_text(label)
             all_x.extend(ani.x)
             all_y.extend(ani.y)
 
         if all_x and all_y:
             self.rescale_axes()
-        self.canvas.draw()
 
     def plot(self, data_object: Data) -> None:
         """
@@ -161,14 +248,7 @@ class MatPlotLibImageWidget(AbstractImageWidget):
                 else:
                     y_label = dialog.get_selected_option()
 
-            # fetch the data points
-            x_data = cm.df_column_to_numpy(data, 0)  # always take the first column for x_data
-            y_column_index = data.columns.get_loc(y_label)  # get the index of the selected y_label
-            y_data = cm.df_column_to_numpy(data, y_column_index)
-
-            line, = self.canvas.axes.plot(x_data, y_data)
-            self.add_to_data_dict(line, filename)
-
+            self.plot_column(data_object, y_label)
             self.set_xlabel(x_label)
             self.set_ylabel(y_label)
             self.rescale_axes()
@@ -180,6 +260,47 @@ class MatPlotLibImageWidget(AbstractImageWidget):
         except Exception as e:
             ErrorDialog(f"An unexpected error occurred: {e}")
 
+    def plot_column(self, data_object: Data, y_label) -> None:
+        """
+        plots a column of a data object against its first column.
+        :param data_object: the data object containing the filename and the dataframe
+        :param y_label: the label of the column that is plotted
+        :return: None
+        """
+        data: DataFrame = data_object.data
+        x_data = cm.df_column_to_numpy(data, 0)  # always take the first column for x_data
+        y_column_index = data.columns.get_loc(y_label)  # get the index of the selected y_label
+        y_data = cm.df_column_to_numpy(data, y_column_index)
+
+        line, = self.canvas.axes.plot(x_data, y_data)
+        self.add_to_data_dict(line, data_object.filename)
+        self.plotted_columns.setdefault(data_object.filename, []).append(y_label)
+
+    def plot_spectrogram(self, data_object: Data) -> None:
+        """
+        plot a spectrogram as an image, with time on the x axis and frequency on the y axis.
+        :param data_object: the data object with the time in the first column and a column for every frequency bin
+        :return: None
+        """
+        data: DataFrame = data_object.data
+        filename: str = data_object.filename
+        if self.is_plotted(filename):
+            return
+        try:
+            times = cm.df_column_to_numpy(data, 0)
+            freqs = numpy.array([float(label.split(" ")[0]) for label in data.columns[1:]])
+            # decibels keep both the weak and the strong components visible
+            power_db = 10 * numpy.log10(data.iloc[:, 1:].to_numpy(dtype=numpy.float32).T + 1e-12)
+            image = self.canvas.axes.imshow(power_db, aspect="auto", origin="lower",
+                                            extent=(times[0], times[-1], freqs[0], freqs[-1]))
+            self.add_to_data_dict(image, filename)
+            self.spectrograms.add(filename)
+            self.set_xlabel("time (s)")
+            self.set_ylabel("frequency (Hz)")
+            self.canvas.draw()
+        except (IndexError, ValueError):
+            ErrorDialog(f"Error: {filename} is not a spectrogram.")
+
     def rescale_axes(self) -> None:
         """
         Automatically rescales the axes based on the current lines in the plot.
@@ -218,6 +339,23 @@ class MatPlotLibImageWidget(AbstractImageWidget):
         else:
             self.loaded_data_dict[filename] = [line]
 
+    def get_memory_usage(self, filename, shared=None) -> int:
+        """
+        :param filename: the file that is plotted
+        :param shared: the data of the file in the DataManager, the lines always hold their own copy of it
+        :return: the bytes held by the data of the lines of the file
+        """
+        return sum(numpy.asarray(line.get_xdata()).nbytes + numpy.asarray(line.get_ydata()).nbytes
+                   for line in self.loaded_data_dict.get(filename, []))
+
+    def get_animation_memory_usage(self) -> int:
+        """
+        :return: the bytes held by the buffers of the realtime animations, including the shared memory of the
+        devices that are read by an ingest process
+        """
+        return sum(ani.x.nbytes + ani.y.nbytes for ani in self.animations) + \
+            sum(source.get_memory_usage() for source in self.shared_sources.values())
+
     def remove_from_plot(self, filename) -> None:
         """
         remove a line from the plot.
@@ -228,6 +366,8 @@ class MatPlotLibImageWidget(AbstractImageWidget):
         if self.is_plotted(filename):
             try:
                 lines = self.loaded_data_dict.pop(filename)
+                self.plotted_columns.pop(filename, None)
+                self.spectrograms.discard(filename)
                 for line in lines:
                     line.remove()
                 self.rescale_axes()
@@ -249,6 +389,46 @@ class MatPlotLibImageWidget(AbstractImageWidget):
         :return: None
         """
         self.canvas.axes.clear()
+        self.plotted_columns.clear()
+        self.spectrograms.clear()
+        self.canvas.draw()
+
+    def get_session_state(self) -> dict:
+        """
+        :return: the plotted columns and spectrograms per file, and the title, labels and limits of the axes
+        """
+        axes = self.canvas.axes
+        return {"plots": {filename: [to_json_value(label) for label in labels]
+                          for filename, labels in self.plotted_columns.items()},
+                "spectrograms": sorted(self.spectrograms),
+                "title": axes.get_title(), "xlabel": axes.get_xlabel(), "ylabel": axes.get_ylabel(),
+                "xlim": list(axes.get_xlim()), "ylim": list(axes.get_ylim())}
+
+    def restore_session_state(self, state: dict, data_manager) -> None:
+        """
+        plots the files of a session again and restores the title, labels and limits of the axes.
+        :param state: the state returned by get_session_state
+        :param data_manager: the data manager that holds the files of the session
+        :return: None
+        """
+        for filename, labels in state.get("plots", {}).items():
+            data_object = data_manager.get_data_object_by_filename(filename)
+            if data_object is None or self.is_plotted(filename) or data_object.data is None:
+                continue
+            for label in labels:
+                if label in data_object.data.columns:
+                    self.plot_column(data_object, label)
+        for filename in state.get("spectrograms", []):
+            data_object = data_manager.get_data_object_by_filename(filename)
+            if data_object is not None and data_object.data is not None:
+                self.plot_spectrogram(data_object)
+        axes = self.canvas.axes
+        axes.set_title(state.get("title", ""))
+        axes.set_xlabel(state.get("xlabel", ""))
+        axes.set_ylabel(state.get("ylabel", ""))
+        if self.loaded_data_dict and "xlim" in state:
+            axes.set_xlim(state["xlim"])
+            axes.set_ylim(state["ylim"])
         self.canvas.draw()
 
     def set_figure_title(self, title: str) -> None:
@@ -295,3 +475,5 @@ class Animation:
         self.x = x
         self.y = y
         self.line = None
+        self.heart_rate = None
+        self.rate_text = None
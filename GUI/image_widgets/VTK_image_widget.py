@@ -1,18 +1,34 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Tuple, Optional, Callable, Iterator
+
 from vtkmodules.vtkCommonColor import vtkNamedColors
-from vtkmodules.vtkCommonDataModel import vtkPolyData, vtkUnstructuredGrid, vtkImageData, vtkStructuredGrid, \
-    vtkPiecewiseFunction
-from vtkmodules.vtkRenderingCore import vtkPolyDataMapper, vtkDataSetMapper, vtkImageActor, vtkActor, vtkVolumeProperty, \
-    vtkColorTransferFunction, vtkVolume
+from vtkmodules.vtkCommonDataModel import vtkPolyData, vtkUnstructuredGrid, vtkImageData, vtkStructuredGrid, vtkPlanes
+from vtkmodules.vtkFiltersCore import vtkQuadricDecimation, vtkTriangleFilter
+from vtkmodules.vtkImagingCore import vtkImageShrink3D, vtkExtractVOI
+from vtkmodules.vtkInteractionWidgets import vtkBoxWidget2, vtkBoxRepresentation
+from vtkmodules.vtkRenderingCore import vtkPolyDataMapper, vtkImageActor, vtkActor, vtkVolumeProperty, vtkVolume, \
+    vtkImageProperty
+from vtkmodules.vtkRenderingLOD import vtkLODActor
 from vtk import vtkRenderer
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 from vtkmodules.vtkRenderingVolumeOpenGL2 import vtkSmartVolumeMapper
 
-from data_manager import Data
+from data_manager import Data, VolumeStatistics
 
 from GUI.image_widgets.abstract_image_widget import AbstractImageWidget
+from PySide2.QtCore import QObject, Signal, QTimer
+from PySide2.QtGui import QGuiApplication
 from PySide2.QtWidgets import QWidget, QVBoxLayout, QSizePolicy
 
 from GUI.popups import ErrorDialog
+from profiler import profiler
+from memory_accounting import vtk_memory_usage
+from vtk_rendering import prepare_data, create_actor, build_volume_property, apply_transfer_function_preset, \
+    create_volume
 
 
 class VTKImageWidget(AbstractImageWidget):
@@ -23,6 +39,32 @@ class VTKImageWidget(AbstractImageWidget):
         super().__init__()
         self.loaded_actors = {}
         self.current_opacity_setting: float = 1
+        # level of detail settings for large meshes
+        self.lod_enabled: bool = True
+        self.lod_minimum_cells: int = 50000             # meshes with fewer cells are always drawn at full resolution
+        self.lod_cell_fractions: Tuple[float, ...] = (0.5, 0.1, 0.02)   # fraction of the cells kept at each level
+        self.target_frame_rate: float = 15.0
+        self.lod_signals = LODSignals()
+        self.lod_signals.finished.connect(self.add_lod_levels)
+        # volumes are drawn from a downsampled proxy while the camera moves, keyed by filename
+        self.volume_proxies: dict[str, VolumeProxy] = {}
+        self.interactive_voxel_budget: int = 2 ** 22     # the largest proxy volume that is rendered during interaction
+        # the axial, coronal and sagittal views of a volume, None when the reslice mode is off
+        self.slice_viewer: Optional[SliceViewer] = None
+        # pipelines are prepared in a background thread, these are the files that are waiting for their pipeline
+        # together with the method that adds the result to the renderer
+        self.pending_plots: dict[str, Callable[[str, dict], None]] = {}
+        # the properties and camera of a restored session, applied once the pipelines of its files are finished
+        self.restored_properties: dict[str, dict] = {}
+        self.restored_camera: Optional[dict] = None
+        # the statistics of every plotted volume, which the transfer function presets are derived from
+        self.volume_statistics: dict[str, VolumeStatistics] = {}
+        self.transfer_function_preset: str = "default"
+        # the box widget that selects the region of interest of a volume, None when it is hidden
+        self.roi_widget: Optional[vtkBoxWidget2] = None
+        self.roi_filename: Optional[str] = None
+        self.pipeline_signals = PipelineSignals()
+        self.pipeline_signals.finished.connect(self.finish_pipeline)
         self.initUI()
 
     def initUI(self) -> None:
@@ -43,8 +85,15 @@ class VTKImageWidget(AbstractImageWidget):
         self.renderer = vtkRenderer()
         self.renderer.SetBackground(colors.GetColor3d('DimGray'))
         self.canvas.GetRenderWindow().AddRenderer(self.renderer)
+        # renders are coalesced to at most one per refresh interval of the screen
+        screen = QGuiApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None and screen.refreshRate() > 0 else 60.0
+        self.render_scheduler = RenderScheduler(self.canvas.GetRenderWindow(), refresh_rate)
+        # choose between the proxy and the full resolution volumes right before every render
+        self.renderer.AddObserver("StartEvent", lambda caller, event: self.update_volume_resolution())
         # Initialize interactor
         self.interactor = self.canvas.GetRenderWindow().GetInteractor()
+        self.set_target_frame_rate(self.target_frame_rate)
         self.interactor.Initialize()
         self.interactor.Start()
 
@@ -61,38 +110,98 @@ class VTKImageWidget(AbstractImageWidget):
 
     def plot(self, data_object: Data) -> None:
         """
-        plots the data in the data object, by first looking at the data type and then creating the correct mapper and actor.
+        plots the data in the data object. The pipeline is prepared in a background thread, after which the correct
+        mapper and actor are created for the data type on the GUI thread.
         :param data_object: the data object containing the data and the filename
         :return: None
         """
         data = data_object.data
         filename = data_object.filename
-        if self.is_plotted(filename):
-            return
-        if isinstance(data, vtkPolyData):
-            mapper = vtkPolyDataMapper()
-        elif isinstance(data, (vtkUnstructuredGrid, vtkStructuredGrid)):
-            mapper = vtkDataSetMapper()
-        elif isinstance(data, vtkImageData):
-            actor = vtkImageActor()
-            actor.GetMapper().SetInputData(data)
-            self.renderer.AddActor(actor)
-            self.renderer.ResetCamera()
-            self.canvas.GetRenderWindow().Render()
-            self.add_to_actors(actor, filename)
+        if self.is_plotted(filename) or filename in self.pending_plots:
             return
-        else:
+        if not isinstance(data, (vtkPolyData, vtkUnstructuredGrid, vtkStructuredGrid, vtkImageData)):
             ErrorDialog(f"Unsupported data type: {type(data)}")
             return
+        self.start_pipeline(filename, lambda report: prepare_data(data, report), self.add_prepared_data)
+
+    def start_pipeline(self, filename: str, prepare: Callable[[Callable[[float], None]], dict],
+                       finish: Callable[[str, dict], None]) -> None:
+        """
+        prepares the pipeline of a file in a background thread.
+        :param filename: the file that is plotted
+        :param prepare: the function that does the work that does not need the renderer. It gets a function to report
+        its progress with, as a fraction between 0 and 1, and returns its results in a dictionary
+        :param finish: the method that is called on the GUI thread with the filename and the results
+        :return: None
+        """
+        self.pending_plots[filename] = finish
+        self.pipeline_signals.progress.emit(filename, 0)
+        PipelineBuilder(filename, prepare, self.pipeline_signals).start()
+
+    def finish_pipeline(self, filename: str, result: dict) -> None:
+        """
+        adds a prepared pipeline to the renderer. This is called on the GUI thread once the background thread is done.
+        :param filename: the file that was prepared
+        :param result: the results of the preparation, or a dictionary with an "error" message if it failed
+        :return: None
+        """
+        self.pipeline_signals.progress.emit(filename, 100)
+        finish = self.pending_plots.pop(filename, None)
+        if finish is None:
+            return  # the file was removed or the plot was cleared in the meantime
+        if "error" in result:
+            ErrorDialog(f"Could not plot {filename}: {result['error']}")
+        else:
+            finish(filename, result)
+            if filename in self.restored_properties:
+                self.apply_plot_state(filename, self.restored_properties.pop(filename))
+        if not self.pending_plots and self.restored_camera is not None:
+            self.apply_camera_state(self.restored_camera)
+            self.restored_camera = None
 
-        mapper.SetInputData(data)
-        actor = vtkActor()
-        actor.SetMapper(mapper)
-        actor.GetProperty().SetOpacity(self.current_opacity_setting)
+    def add_prepared_data(self, filename: str, result: dict) -> None:
+        """
+        creates the mapper and actor for prepared data and adds them to the renderer.
+        :param filename: the file the data came from
+        :param result: the result of prepare_data
+        :return: None
+        """
+        data = result["data"]
+        use_lod = self.lod_enabled and isinstance(data, vtkPolyData) and data.GetNumberOfCells() > self.lod_minimum_cells
+        actor = create_actor(data, self.current_opacity_setting, use_lod)
         self.renderer.AddActor(actor)
         self.renderer.ResetCamera()
         self.render()
         self.add_to_actors(actor, filename)
+        if use_lod:
+            MeshLODBuilder(filename, data, self.lod_cell_fractions, self.lod_signals).start()
+
+    def add_lod_levels(self, filename: str, levels: List[vtkPolyData]) -> None:
+        """
+        adds the decimated meshes as levels of detail to the actor of a file. This is called on the GUI thread once
+        the background thread has finished the decimation.
+        :param filename: the file the meshes were computed for
+        :param levels: the decimated meshes, from fine to coarse
+        :return: None
+        """
+        actor = self.loaded_actors.get(filename)
+        if not isinstance(actor, vtkLODActor):
+            return  # the file was removed from the plot in the meantime
+        for level in levels:
+            mapper = vtkPolyDataMapper()
+            mapper.SetInputData(level)
+            actor.AddLODMapper(mapper)
+
+    def set_target_frame_rate(self, frame_rate: float) -> None:
+        """
+        sets the frame rate that should be reached while the camera is moving. Large meshes switch to a coarser level
+        of detail to reach it, and are drawn at full resolution again once the interaction stops.
+        :param frame_rate: the frame rate in frames per second
+        :return: None
+        """
+        self.target_frame_rate = frame_rate
+        self.interactor.SetDesiredUpdateRate(frame_rate)
+        self.interactor.SetStillUpdateRate(0.001)   # no time limit when the camera is still
 
     def is_plotted(self, filename) -> bool:
         """
@@ -102,6 +211,25 @@ class VTKImageWidget(AbstractImageWidget):
         """
         return filename in self.loaded_actors
 
+    def get_memory_usage(self, filename: str, shared=None) -> int:
+        """
+        computes the memory held by the rendering of a file: the inputs of its mappers, such as the mesh with normals,
+        the levels of detail and the proxy of a volume.
+        :param filename: the file that is plotted
+        :param shared: the data object of the file in the DataManager, which is not counted when a mapper uses it
+        :return: the memory usage in bytes
+        """
+        actor = self.loaded_actors.get(filename)
+        if actor is None:
+            return 0
+        inputs = [actor.GetMapper().GetInput()]
+        if isinstance(actor, vtkLODActor):
+            lod_mappers = actor.GetLODMappers()
+            inputs.extend(lod_mappers.GetItemAsObject(i).GetInput() for i in range(lod_mappers.GetNumberOfItems()))
+        if filename in self.volume_proxies:
+            inputs.append(self.volume_proxies[filename].proxy_mapper.GetInput())
+        return vtk_memory_usage(data_object for data_object in inputs if data_object is not shared)
+
     def add_to_actors(self, actor, filename: str) -> None:
         """
         add a actor together with the file it came from to the actor list.
@@ -122,8 +250,6 @@ class VTKImageWidget(AbstractImageWidget):
         camera.SetViewUp(self.initial_camera_view_up)
         self.renderer.ResetCamera()
         self.render()
-        self.renderer.ResetCamera()
-        self.render()
 
     def set_mesh_color(self, filename: str, color: str) -> None:
         """
@@ -164,56 +290,307 @@ class VTKImageWidget(AbstractImageWidget):
         # Update the rendering
         self.render()
 
-    def plot_volume(self, volume, filename: str) -> None:
+    def plot_volume(self, data_object: Data) -> None:
         """
-        plots a DICOM volume
-        :param volume: the volumetric data
-        :param filename: the filename associated with the volume
+        plots a DICOM volume. The statistics, transfer functions and proxy volume are prepared in a background
+        thread, only the mapper and the first render are done on the GUI thread.
+        :param data_object: the data object containing the volume and the filename
         :return: None
         """
-        if self.is_plotted(filename):
+        filename = data_object.filename
+        if self.is_plotted(filename) or filename in self.pending_plots:
             return
+        self.start_pipeline(filename, lambda report: self.prepare_volume(data_object, report), self.add_prepared_volume)
+
+    def prepare_volume(self, data_object: Data, report: Callable[[float], None]) -> dict:
+        """
+        computes the statistics of a volume, which are cached in the data object, and builds its volume property
+        and proxy volume. This runs in a background thread.
+        :param data_object: the data object containing the volume
+        :param report: the function to report the progress with
+        :return: a dictionary with the "volume", its "statistics", its "property" and the "proxy" volume
+        """
+        volume = data_object.data
+        statistics = data_object.get_volume_statistics()
+        report(0.2)
+        volume_property = build_volume_property(statistics, self.transfer_function_preset)
+        report(0.3)
+        proxy_volume = self.build_proxy_volume(volume, lambda fraction: report(0.3 + 0.7 * fraction))
+        return {"volume": volume, "statistics": statistics, "property": volume_property, "proxy": proxy_volume}
 
-        # Create a volume mapper
-        volume_mapper = vtkSmartVolumeMapper()
-        volume_mapper.SetInputData(volume)
+    def set_transfer_function_preset(self, filename: str, preset: str) -> None:
+        """
+        switches a plotted volume to another transfer function preset. Volumes that are plotted afterwards also use
+        this preset.
+        :param filename: the filename associated with the volume
+        :param preset: the name of the preset in TRANSFER_FUNCTION_PRESETS
+        :return: None
+        """
+        self.transfer_function_preset = preset
+        if filename not in self.volume_statistics or not self.is_plotted(filename):
+            return
+        # the full resolution and the proxy property share their transfer functions
+        apply_transfer_function_preset(self.loaded_actors[filename].GetProperty(),
+                                            self.volume_statistics[filename], preset)
+        self.render()
 
-        # Create a volume property
-        volume_property = vtkVolumeProperty()
-        volume_property.ShadeOn()
-        volume_property.SetInterpolationTypeToLinear()
+    def add_prepared_volume(self, filename: str, result: dict) -> None:
+        """
+        creates the mapper and the volume for a prepared volume and adds them to the renderer.
+        :param filename: the filename associated with the volume
+        :param result: the result of prepare_volume
+        :return: None
+        """
+        self.volume_statistics[filename] = result["statistics"]
+        volume_actor = create_volume(result["volume"], result["property"])
 
-        # Create an opacity transfer function
-        opacity_transfer_function = vtkPiecewiseFunction()
-        min_scalar, max_scalar = volume.GetScalarRange()
-        opacity_transfer_function.AddPoint(min_scalar, 0.0)  # Fully transparent at min_scalar
-        opacity_transfer_function.AddPoint(min_scalar + (max_scalar - min_scalar) * 0.25,0.1)  # Slightly visible at 25% of the range
-        opacity_transfer_function.AddPoint(min_scalar + (max_scalar - min_scalar) * 0.5,0.3)   # More visible at 50% of the range
-        opacity_transfer_function.AddPoint(min_scalar + (max_scalar - min_scalar) * 0.75,0.6)  # More opaque at 75% of the range
-        opacity_transfer_function.AddPoint(max_scalar, 0.85)  # Mostly opaque at max_scalar
-        volume_property.SetScalarOpacity(opacity_transfer_function)
-
-        # Create a color transfer function
-        color_transfer_function = vtkColorTransferFunction()
-        color_transfer_function.AddRGBPoint(min_scalar, 0.0, 0.0, 0.0)  # Air, Black
-        color_transfer_function.AddRGBPoint(min_scalar + (max_scalar - min_scalar) * 0.2, 0.55, 0.25,0.15)  # Low-density tissue, Dark brownish-red
-        color_transfer_function.AddRGBPoint(min_scalar + (max_scalar - min_scalar) * 0.4, 0.75, 0.5,0.4)  # Soft tissue, Pinkish
-        color_transfer_function.AddRGBPoint(min_scalar + (max_scalar - min_scalar) * 0.6, 0.9, 0.75,0.6)  # Higher-density tissue, Light pink
-        color_transfer_function.AddRGBPoint(max_scalar, 1.0, 1.0, 1.0)  # Bone, White
-        volume_property.SetColor(color_transfer_function)
-
-        # Create the volume
-        volume_actor = vtkVolume()
-        volume_actor.SetMapper(volume_mapper)
-        volume_actor.SetProperty(volume_property)
+        # Use the downsampled proxy while the camera moves
+        if result["proxy"] is not None:
+            self.volume_proxies[filename] = VolumeProxy(volume_actor, volume_actor.GetMapper(), result["property"],
+                                                        result["proxy"])
 
         # Add the volume to the renderer
         self.renderer.AddVolume(volume_actor)
         self.renderer.ResetCamera()
-        self.canvas.GetRenderWindow().Render()
+        self.render()
 
         self.add_to_actors(volume_actor, filename)
 
+    def build_proxy_volume(self, volume: vtkImageData, report: Callable[[float], None] = lambda fraction: None):
+        """
+        builds a pyramid of downsampled volumes by averaging blocks of 2x2x2 voxels, until a level fits in the
+        interactive voxel budget. This keeps the interactive frame rate independent of the size of the series.
+        :param volume: the full resolution volume
+        :param report: the function to report the progress with
+        :return: the first level that fits in the budget, or None if the volume itself already fits
+        """
+        level = volume
+        # every level has about 8 times fewer voxels than the one before
+        expected_levels = max(1, math.ceil(math.log(max(volume.GetNumberOfPoints(), 1) / self.interactive_voxel_budget,
+                                                    8)))
+        level_index = 0
+        while level.GetNumberOfPoints() > self.interactive_voxel_budget:
+            dimensions = level.GetDimensions()
+            shrink = vtkImageShrink3D()
+            shrink.SetInputData(level)
+            shrink.SetShrinkFactors(*[2 if dimension > 1 else 1 for dimension in dimensions])
+            shrink.AveragingOn()
+            shrink.AddObserver("ProgressEvent", lambda caller, event, index=level_index:
+                               report(min((index + caller.GetProgress()) / expected_levels, 1.0)))
+            shrink.Update()
+            level = shrink.GetOutput()
+            level_index += 1
+            if level.GetDimensions() == dimensions:
+                break   # the volume cannot be reduced any further
+        return None if level is volume else level
+
+    def show_roi(self, filename: str, bounds: Tuple[float, ...]) -> None:
+        """
+        shows a box widget around a plotted volume to select the region of interest with. The box can be moved,
+        scaled and rotated.
+        :param filename: the filename associated with the volume
+        :param bounds: the bounds (xmin, xmax, ymin, ymax, zmin, zmax) the box starts with
+        :return: None
+        """
+        if not isinstance(self.loaded_actors.get(filename), vtkVolume):
+            ErrorDialog("please select a volume and plot it")
+            return
+        self.hide_roi()
+        representation = vtkBoxRepresentation()
+        representation.SetPlaceFactor(1.0)
+        representation.PlaceWidget(bounds)
+        self.roi_widget = vtkBoxWidget2()
+        self.roi_widget.SetInteractor(self.interactor)
+        self.roi_widget.SetRepresentation(representation)
+        self.roi_widget.On()
+        self.roi_filename = filename
+        self.render()
+
+    def hide_roi(self) -> None:
+        """
+        hides the box widget of the region of interest, without changing the cropping or clipping.
+        :return: None
+        """
+        if self.roi_widget is None:
+            return
+        self.roi_widget.Off()
+        self.roi_widget = None
+        self.roi_filename = None
+        self.render()
+
+    def crop_volume(self, filename: str, volume: vtkImageData) -> None:
+        """
+        crops a plotted volume to the axis aligned bounds of the region of interest. Only the voxels inside the
+        region are passed to the mapper, so the rendering cost scales with the size of the region. The cropped volume
+        and its proxy are prepared in a background thread.
+        :param filename: the filename associated with the volume
+        :param volume: the full volume
+        :return: None
+        """
+        if self.roi_widget is None or self.roi_filename != filename:
+            ErrorDialog("please show the region of interest of the volume first")
+            return
+        extent = self.bounds_to_extent(volume, self.roi_widget.GetRepresentation().GetBounds())
+        self.start_pipeline(filename, lambda report: self.prepare_crop(volume, extent, report),
+                            self.add_cropped_volume)
+
+    def clip_volume(self, filename: str) -> None:
+        """
+        clips a plotted volume with the six planes of the region of interest. Unlike cropping, this follows the
+        rotation of the box, and the clipped part is skipped by the ray caster.
+        :param filename: the filename associated with the volume
+        :return: None
+        """
+        if self.roi_widget is None or self.roi_filename != filename:
+            ErrorDialog("please show the region of interest of the volume first")
+            return
+        planes = vtkPlanes()
+        self.roi_widget.GetRepresentation().GetPlanes(planes)
+        mapper = self.get_full_resolution_mapper(filename)
+        mapper.SetClippingPlanes(planes)
+        if filename in self.volume_proxies:
+            self.volume_proxies[filename].proxy_mapper.SetClippingPlanes(mapper.GetClippingPlanes())
+        self.render()
+
+    def reset_roi(self, filename: str, volume: vtkImageData) -> None:
+        """
+        removes the cropping and the clipping planes of a plotted volume.
+        :param filename: the filename associated with the volume
+        :param volume: the full volume
+        :return: None
+        """
+        if not isinstance(self.loaded_actors.get(filename), vtkVolume):
+            return
+        self.get_full_resolution_mapper(filename).RemoveAllClippingPlanes()
+        if filename in self.volume_proxies:
+            self.volume_proxies[filename].proxy_mapper.RemoveAllClippingPlanes()
+        self.start_pipeline(filename, lambda report: self.prepare_crop(volume, volume.GetExtent(), report),
+                            self.add_cropped_volume)
+
+    def get_full_resolution_mapper(self, filename: str) -> vtkSmartVolumeMapper:
+        """
+        :param filename: the filename associated with a plotted volume
+        :return: the mapper of the full resolution volume, also while the proxy is shown
+        """
+        if filename in self.volume_proxies:
+            return self.volume_proxies[filename].full_mapper
+        return self.loaded_actors[filename].GetMapper()
+
+    @staticmethod
+    def bounds_to_extent(volume: vtkImageData, bounds: Tuple[float, ...]) -> Tuple[int, ...]:
+        """
+        converts bounds in world coordinates to the smallest extent of the volume that contains them.
+        :param volume: the volume
+        :param bounds: the bounds (xmin, xmax, ymin, ymax, zmin, zmax)
+        :return: the extent (xmin, xmax, ymin, ymax, zmin, zmax) in voxel indices
+        """
+        origin, spacing, extent = volume.GetOrigin(), volume.GetSpacing(), volume.GetExtent()
+        roi_extent = []
+        for axis in range(3):
+            first = math.floor((bounds[2 * axis] - origin[axis]) / spacing[axis])
+            last = math.ceil((bounds[2 * axis + 1] - origin[axis]) / spacing[axis])
+            first = min(max(first, extent[2 * axis]), extent[2 * axis + 1])
+            last = min(max(last, first), extent[2 * axis + 1])
+            roi_extent += [first, last]
+        return tuple(roi_extent)
+
+    def prepare_crop(self, volume: vtkImageData, extent: Tuple[int, ...], report: Callable[[float], None]) -> dict:
+        """
+        extracts the voxels inside an extent from a volume and builds the proxy for them. Only the region is
+        copied, the full volume is left untouched. This runs in a background thread.
+        :param volume: the full volume
+        :param extent: the extent to keep
+        :param report: the function to report the progress with
+        :return: a dictionary with the cropped "volume" and its "proxy"
+        """
+        cropped = volume
+        if tuple(extent) != tuple(volume.GetExtent()):
+            extract = vtkExtractVOI()
+            extract.SetInputData(volume)
+            extract.SetVOI(*extent)
+            extract.AddObserver("ProgressEvent", lambda caller, event: report(0.5 * caller.GetProgress()))
+            extract.Update()
+            cropped = vtkImageData()
+            cropped.ShallowCopy(extract.GetOutput())
+        report(0.5)
+        proxy_volume = self.build_proxy_volume(cropped, lambda fraction: report(0.5 + 0.5 * fraction))
+        return {"volume": cropped, "proxy": proxy_volume}
+
+    def add_cropped_volume(self, filename: str, result: dict) -> None:
+        """
+        replaces the input of a plotted volume by the cropped volume and its proxy. The volume property and the
+        clipping planes are kept.
+        :param filename: the filename associated with the volume
+        :param result: the result of prepare_crop
+        :return: None
+        """
+        volume_actor = self.loaded_actors.get(filename)
+        if not isinstance(volume_actor, vtkVolume):
+            return
+        full_mapper = self.get_full_resolution_mapper(filename)
+        proxy = self.volume_proxies.pop(filename, None)
+        if proxy is not None:
+            proxy.set_interactive(False)
+        full_property = volume_actor.GetProperty()
+        full_mapper.SetInputData(result["volume"])
+        if result["proxy"] is not None:
+            self.volume_proxies[filename] = VolumeProxy(volume_actor, full_mapper, full_property, result["proxy"])
+        self.render()
+
+    def update_volume_resolution(self) -> None:
+        """
+        switches every volume to its proxy while the camera is moving and back to full resolution when it stops.
+        The interactor raises the desired update rate of the render window during interaction, which is used to
+        detect it.
+        :return: None
+        """
+        if not self.volume_proxies:
+            return
+        interacting = self.canvas.GetRenderWindow().GetDesiredUpdateRate() >= self.interactor.GetDesiredUpdateRate()
+        for proxy in self.volume_proxies.values():
+            proxy.set_interactive(interacting)
+
+    def plot_slices(self, volume: vtkImageData, filename: str) -> Tuple[int, ...]:
+        """
+        shows the axial, coronal and sagittal slices through the middle of a volume next to the 3D view. The 3D view
+        is moved to the top left quarter of the window, the slices fill the other three quarters.
+        :param volume: the volumetric data
+        :param filename: the filename associated with the volume
+        :return: the extent of the volume (xmin, xmax, ymin, ymax, zmin, zmax), which holds the first and last slice
+        in every direction
+        """
+        self.remove_slices(render=False)
+        self.renderer.SetViewport(*SliceViewer.VIEWPORTS["volume"])
+        self.slice_viewer = SliceViewer(volume, filename, self.canvas.GetRenderWindow())
+        self.render()
+        return volume.GetExtent()
+
+    def set_slice(self, orientation: str, index: int) -> None:
+        """
+        moves one of the slice views to another slice.
+        :param orientation: "axial", "coronal" or "sagittal"
+        :param index: the index of the slice
+        :return: None
+        """
+        if self.slice_viewer is None:
+            return
+        self.slice_viewer.set_slice(orientation, index)
+        self.render()
+
+    def remove_slices(self, render: bool = True) -> None:
+        """
+        removes the slice views and gives the whole window back to the 3D view.
+        :param render: whether the window should be rendered afterwards
+        :return: None
+        """
+        if self.slice_viewer is None:
+            return
+        self.slice_viewer.remove()
+        self.slice_viewer = None
+        self.renderer.SetViewport(0, 0, 1, 1)
+        if render:
+            self.render()
+
     def set_mesh_opacity(self, filename: str, opacity: float) -> None:
         """
         sets the opacity of a mesh
@@ -236,6 +613,11 @@ class VTKImageWidget(AbstractImageWidget):
         :param filename: the file containing data that should be removed from the plot
         :return: None
         """
+        if self.slice_viewer is not None and self.slice_viewer.filename == filename:
+            self.remove_slices()
+        self.pending_plots.pop(filename, None)
+        if self.roi_filename == filename:
+            self.hide_roi()
         # Check if the filename exists in the dictionary
         if not self.is_plotted(filename):
             return
@@ -251,13 +633,103 @@ class VTKImageWidget(AbstractImageWidget):
 
         # Remove the actor from the dictionary
         del self.loaded_actors[filename]
+        self.volume_proxies.pop(filename, None)
+        self.volume_statistics.pop(filename, None)
+
+    def get_session_state(self) -> dict:
+        """
+        :return: the camera, the transfer function preset and the plotted files with their opacity and color
+        """
+        camera = self.renderer.GetActiveCamera()
+        plots = []
+        for filename, actor in self.loaded_actors.items():
+            plot = {"filename": filename, "volume": filename in self.volume_statistics}
+            if isinstance(actor, vtkActor):
+                plot["opacity"] = actor.GetProperty().GetOpacity()
+                plot["color"] = list(actor.GetProperty().GetColor())
+            plots.append(plot)
+        return {"camera": {"position": list(camera.GetPosition()), "focal_point": list(camera.GetFocalPoint()),
+                           "view_up": list(camera.GetViewUp()), "view_angle": camera.GetViewAngle(),
+                           "parallel_scale": camera.GetParallelScale()},
+                "preset": self.transfer_function_preset, "opacity": self.current_opacity_setting, "plots": plots}
+
+    def restore_session_state(self, state: dict, data_manager) -> None:
+        """
+        plots the files of a session again. The pipelines are prepared in the background as usual, their properties
+        and the camera are applied once they are finished.
+        :param state: the state returned by get_session_state
+        :param data_manager: the data manager that holds the files of the session
+        :return: None
+        """
+        self.transfer_function_preset = state.get("preset", self.transfer_function_preset)
+        self.current_opacity_setting = state.get("opacity", self.current_opacity_setting)
+        self.restored_camera = state.get("camera")
+        for plot in state.get("plots", []):
+            data_object = data_manager.get_data_object_by_filename(plot["filename"])
+            if data_object is None or self.is_plotted(plot["filename"]):
+                continue
+            self.restored_properties[plot["filename"]] = plot
+            if plot["volume"]:
+                self.plot_volume(data_object)
+            else:
+                self.plot(data_object)
+        if not self.pending_plots and self.restored_camera is not None:
+            self.apply_camera_state(self.restored_camera)
+            self.restored_camera = None
+
+    def apply_plot_state(self, filename: str, plot: dict) -> None:
+        """
+        sets the opacity and color of a restored mesh.
+        :param filename: the file that is plotted
+        :param plot: the state of the plot, see get_session_state
+        :return: None
+        """
+        actor = self.loaded_actors.get(filename)
+        if not isinstance(actor, vtkActor):
+            return
+        if "opacity" in plot:
+            actor.GetProperty().SetOpacity(plot["opacity"])
+        if "color" in plot:
+            actor.GetProperty().SetColor(plot["color"])
+        self.render()
+
+    def apply_camera_state(self, state: dict) -> None:
+        """
+        moves the camera to a stored position.
+        :param state: the camera state, see get_session_state
+        :return: None
+        """
+        camera = self.renderer.GetActiveCamera()
+        camera.SetPosition(state["position"])
+        camera.SetFocalPoint(state["focal_point"])
+        camera.SetViewUp(state["view_up"])
+        camera.SetViewAngle(state["view_angle"])
+        camera.SetParallelScale(state["parallel_scale"])
+        self.renderer.ResetCameraClippingRange()
+        self.render()
 
     def render(self) -> None:
         """
-        (re)renders the window
+        requests a (re)render of the window. Requests are coalesced, so a burst of changes is drawn in a single frame.
         :return: None
         """
-        self.canvas.GetRenderWindow().Render()
+        self.render_scheduler.request_render()
+
+    def batch_update(self):
+        """
+        context manager that holds back renders until all changes inside it are made, for example:
+        with image_widget.batch_update():
+            image_widget.set_mesh_color(filename, color)
+            image_widget.set_mesh_opacity(filename, opacity)
+        :return: the context manager
+        """
+        return self.render_scheduler.batch()
+
+    def get_render_statistics(self) -> dict:
+        """
+        :return: the number of render requests and renders, and the frame times, see RenderScheduler.get_statistics
+        """
+        return self.render_scheduler.get_statistics()
 
     def clear(self) -> None:
         """
@@ -265,5 +737,358 @@ class VTKImageWidget(AbstractImageWidget):
         :return: None
         """
         self.loaded_actors.clear()
+        self.volume_proxies.clear()
+        self.pending_plots.clear()
+        self.restored_properties.clear()
+        self.restored_camera = None
+        self.volume_statistics.clear()
+        self.remove_slices(render=False)
+        self.hide_roi()
         self.renderer.RemoveAllViewProps()
-        self.canvas.GetRenderWindow().Render()
+        self.render()
+
+
+class RenderScheduler:
+    """
+    Coalesces render requests, so a burst of changes results in at most one render per display refresh interval.
+    It also counts the renders and keeps the duration of the last frames, including the ones the interactor starts,
+    for profiling.
+    """
+    def __init__(self, render_window, refresh_rate: float = 60.0, frame_history: int = 240):
+        """
+        constructor for the scheduler
+        :param render_window: the render window that is rendered
+        :param refresh_rate: the refresh rate of the display in Hz, which limits the number of renders per second
+        :param frame_history: the number of frame times that are kept
+        """
+        self.render_window = render_window
+        self.frame_interval: float = 1.0 / refresh_rate
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+        self.batch_depth: int = 0
+        self.pending: bool = False
+        self.last_render_start: float = -math.inf
+        self.frame_start: Optional[float] = None
+        # profiling counters
+        self.request_count: int = 0
+        self.scheduled_render_count: int = 0
+        self.render_count: int = 0
+        self.frame_times: deque = deque(maxlen=frame_history)
+        render_window.AddObserver("StartEvent", lambda caller, event: self.start_frame())
+        render_window.AddObserver("EndEvent", lambda caller, event: self.end_frame())
+
+    def request_render(self) -> None:
+        """
+        requests a render. It is done once the current refresh interval has passed and no batch is open.
+        :return: None
+        """
+        self.request_count += 1
+        self.pending = True
+        self.schedule()
+
+    def schedule(self) -> None:
+        """
+        starts the timer for the next render, if a render is pending and it is not started yet.
+        :return: None
+        """
+        if not self.pending or self.batch_depth > 0 or self.timer.isActive():
+            return
+        delay = self.last_render_start + self.frame_interval - time.perf_counter()
+        self.timer.start(max(0, int(delay * 1000)))
+
+    def flush(self) -> None:
+        """
+        does the pending render right away.
+        :return: None
+        """
+        self.timer.stop()
+        if not self.pending:
+            return
+        self.pending = False
+        self.scheduled_render_count += 1
+        self.render_window.Render()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        context manager that holds back the renders that are requested inside it until it is closed. Batches can be
+        nested, the render is scheduled when the outermost batch is closed.
+        :return: None
+        """
+        self.batch_depth += 1
+        try:
+            yield
+        finally:
+            self.batch_depth -= 1
+            self.schedule()
+
+    def start_frame(self) -> None:
+        """
+        called by the render window when a frame starts.
+        :return: None
+        """
+        self.frame_start = time.perf_counter()
+        self.last_render_start = self.frame_start
+
+    def end_frame(self) -> None:
+        """
+        called by the render window when a frame is done.
+        :return: None
+        """
+        if self.frame_start is None:
+            return
+        duration = time.perf_counter() - self.frame_start
+        self.frame_times.append(duration)
+        profiler.add_complete_event("vtk render", "render", self.frame_start, duration)
+        self.frame_start = None
+        self.render_count += 1
+
+    def get_statistics(self) -> dict:
+        """
+        :return: the number of render requests, the renders done by the scheduler, the requests that were merged
+        into another render, all renders including the ones by the interactor, and the mean and maximum frame time
+        of the last frames in milliseconds
+        """
+        frame_times = list(self.frame_times)
+        return {"requests": self.request_count,
+                "scheduled renders": self.scheduled_render_count,
+                "coalesced requests": self.request_count - self.scheduled_render_count,
+                "renders": self.render_count,
+                "mean frame time (ms)": 1000 * sum(frame_times) / len(frame_times) if frame_times else 0.0,
+                "max frame time (ms)": 1000 * max(frame_times) if frame_times else 0.0}
+
+
+class VolumeProxy:
+    """
+    Holds the full resolution mapper of a volume together with a mapper for a downsampled proxy. The proxy has its own
+    property without shading, but shares the transfer functions so both look the same.
+    """
+    def __init__(self, volume_actor: vtkVolume, full_mapper: vtkSmartVolumeMapper, full_property: vtkVolumeProperty,
+                 proxy_volume: vtkImageData):
+        """
+        constructor for the volume proxy
+        :param volume_actor: the volume that is rendered
+        :param full_mapper: the mapper of the full resolution volume
+        :param full_property: the property of the full resolution volume
+        :param proxy_volume: the downsampled volume
+        """
+        self.volume_actor = volume_actor
+        self.full_mapper = full_mapper
+        self.full_property = full_property
+        # a separate mapper keeps the full resolution volume cached, so switching back does not upload it again
+        self.proxy_mapper = vtkSmartVolumeMapper()
+        self.proxy_mapper.SetInputData(proxy_volume)
+        self.proxy_mapper.AutoAdjustSampleDistancesOff()
+        self.proxy_mapper.SetSampleDistance(max(proxy_volume.GetSpacing()))
+        if full_mapper.GetClippingPlanes() is not None:
+            self.proxy_mapper.SetClippingPlanes(full_mapper.GetClippingPlanes())
+        self.proxy_property = vtkVolumeProperty()
+        self.proxy_property.ShadeOff()
+        self.proxy_property.SetInterpolationTypeToLinear()
+        self.proxy_property.SetScalarOpacity(full_property.GetScalarOpacity())
+        self.proxy_property.SetColor(full_property.GetRGBTransferFunction())
+        self.interactive = False
+
+    def set_interactive(self, interactive: bool) -> None:
+        """
+        switches the volume between the proxy and the full resolution volume.
+        :param interactive: True to render the proxy, False to render the full resolution volume
+        :return: None
+        """
+        if interactive == self.interactive:
+            return
+        self.interactive = interactive
+        if interactive:
+            self.volume_actor.SetMapper(self.proxy_mapper)
+            self.volume_actor.SetProperty(self.proxy_property)
+        else:
+            self.volume_actor.SetMapper(self.full_mapper)
+            self.volume_actor.SetProperty(self.full_property)
+
+
+class SliceViewer:
+    """
+    Shows three orthogonal slices of a volume, each in its own renderer. All image actors read from the same volume and
+    only select a slice through their display extent, so the volume is never copied and moving to another slice only
+    uploads that slice as a 2D texture.
+    """
+    # the axis that is sliced for each orientation, in the x, y, z order of vtkImageData
+    AXES = {"axial": 2, "coronal": 1, "sagittal": 0}
+    # the direction the camera looks from and its view up vector for each orientation
+    CAMERAS = {"axial": ((0, 0, -1), (0, -1, 0)), "coronal": ((0, -1, 0), (0, 0, 1)), "sagittal": ((1, 0, 0), (0, 0, 1))}
+    # the part of the render window (xmin, ymin, xmax, ymax) that each view uses
+    VIEWPORTS = {"volume": (0, 0.5, 0.5, 1), "axial": (0.5, 0.5, 1, 1), "coronal": (0, 0, 0.5, 0.5),
+                 "sagittal": (0.5, 0, 1, 0.5)}
+
+    def __init__(self, volume: vtkImageData, filename: str, render_window):
+        """
+        constructor for the slice viewer, which starts at the middle slice in every direction.
+        :param volume: the volume to slice
+        :param filename: the filename associated with the volume
+        :param render_window: the render window that the slice renderers are added to
+        """
+        self.volume = volume
+        self.filename = filename
+        self.render_window = render_window
+        self.extent = volume.GetExtent()
+        # one property for all views, so the window and level are the same everywhere
+        min_scalar, max_scalar = volume.GetScalarRange()
+        self.image_property = vtkImageProperty()
+        self.image_property.SetColorWindow(max(max_scalar - min_scalar, 1e-6))
+        self.image_property.SetColorLevel((max_scalar + min_scalar) / 2)
+        self.image_property.SetInterpolationTypeToLinear()
+        self.renderers: dict[str, vtkRenderer] = {}
+        self.actors: dict[str, vtkImageActor] = {}
+        self.slices: dict[str, int] = {}
+        for orientation, axis in self.AXES.items():
+            actor = vtkImageActor()
+            actor.GetMapper().SetInputData(volume)
+            actor.SetProperty(self.image_property)
+            renderer = vtkRenderer()
+            renderer.SetViewport(*self.VIEWPORTS[orientation])
+            renderer.SetBackground(0, 0, 0)
+            renderer.SetInteractive(False)  # the camera of a slice view stays fixed, the slider moves the slice
+            renderer.AddActor(actor)
+            render_window.AddRenderer(renderer)
+            self.renderers[orientation] = renderer
+            self.actors[orientation] = actor
+            self.set_slice(orientation, (self.extent[2 * axis] + self.extent[2 * axis + 1]) // 2)
+            self.reset_camera(orientation)
+
+    def set_slice(self, orientation: str, index: int) -> None:
+        """
+        shows another slice in one of the views by changing the display extent of its actor.
+        :param orientation: "axial", "coronal" or "sagittal"
+        :param index: the index of the slice, clipped to the extent of the volume
+        :return: None
+        """
+        axis = self.AXES[orientation]
+        index = min(max(index, self.extent[2 * axis]), self.extent[2 * axis + 1])
+        display_extent = list(self.extent)
+        display_extent[2 * axis] = display_extent[2 * axis + 1] = index
+        self.actors[orientation].SetDisplayExtent(*display_extent)
+        self.slices[orientation] = index
+
+    def reset_camera(self, orientation: str) -> None:
+        """
+        points the parallel camera of a view straight at its slice.
+        :param orientation: "axial", "coronal" or "sagittal"
+        :return: None
+        """
+        direction, view_up = self.CAMERAS[orientation]
+        center = self.volume.GetCenter()
+        camera = self.renderers[orientation].GetActiveCamera()
+        camera.ParallelProjectionOn()
+        camera.SetFocalPoint(center)
+        camera.SetPosition(*[c - d for c, d in zip(center, direction)])
+        camera.SetViewUp(view_up)
+        self.renderers[orientation].ResetCamera()
+
+    def remove(self) -> None:
+        """
+        removes the slice renderers from the render window.
+        :return: None
+        """
+        for renderer in self.renderers.values():
+            self.render_window.RemoveRenderer(renderer)
+        self.renderers.clear()
+        self.actors.clear()
+
+
+class PipelineSignals(QObject):
+    """
+    Signals used by the PipelineBuilder to report its progress and hand its results to the GUI thread.
+    """
+    progress = Signal(str, int)
+    finished = Signal(str, object)
+
+
+class PipelineBuilder(threading.Thread):
+    """
+    A thread that prepares the pipeline of a plot, so the GUI does not block on large datasets.
+    """
+    def __init__(self, filename: str, prepare: Callable[[Callable[[float], None]], dict], signals: PipelineSignals):
+        """
+        constructor for the builder
+        :param filename: the file that is prepared
+        :param prepare: the function that does the work, it gets a function to report its progress with
+        :param signals: the signals that the progress and the result are emitted with
+        """
+        super().__init__(daemon=True)
+        self.filename = filename
+        self.prepare = prepare
+        self.signals = signals
+        self.last_percentage = 0
+
+    def report(self, fraction: float) -> None:
+        """
+        emits the progress, but only when the percentage changes, since VTK filters report their progress very often.
+        :param fraction: the progress as a fraction between 0 and 1
+        :return: None
+        """
+        percentage = min(int(fraction * 100), 99)   # 100 is emitted by the GUI thread once the plot is added
+        if percentage != self.last_percentage:
+            self.last_percentage = percentage
+            self.signals.progress.emit(self.filename, percentage)
+
+    def run(self) -> None:
+        """
+        runs the preparation and emits the result, or the error message if it failed.
+        :return: None
+        """
+        try:
+            result = self.prepare(self.report)
+        except Exception as e:
+            result = {"error": str(e)}
+        self.signals.finished.emit(self.filename, result)
+
+
+class LODSignals(QObject):
+    """
+    Signals used by the MeshLODBuilder to hand its results to the GUI thread.
+    """
+    finished = Signal(str, list)
+
+
+class MeshLODBuilder(threading.Thread):
+    """
+    A thread that computes decimated versions of a mesh with quadric decimation, so the GUI does not block.
+    """
+    def __init__(self, filename: str, poly_data: vtkPolyData, cell_fractions: Tuple[float, ...], signals: LODSignals):
+        """
+        constructor for the builder
+        :param filename: the file the mesh belongs to
+        :param poly_data: the full resolution mesh
+        :param cell_fractions: the fraction of the cells that each level keeps, from fine to coarse
+        :param signals: the signals that the result is emitted with
+        """
+        super().__init__(daemon=True)
+        self.filename = filename
+        self.poly_data = poly_data
+        self.cell_fractions = cell_fractions
+        self.signals = signals
+
+    def run(self) -> None:
+        """
+        decimates the mesh level by level, each level starting from the previous one so the coarse levels are cheap.
+        Meshes with quads or other polygons are triangulated first, the decimation only works on triangles.
+        :return: None
+        """
+        levels = []
+        triangles = vtkTriangleFilter()
+        triangles.SetInputData(self.poly_data)
+        triangles.Update()
+        source = vtkPolyData()
+        source.ShallowCopy(triangles.GetOutput())
+        previous_fraction = 1.0
+        for fraction in sorted(self.cell_fractions, reverse=True):
+            decimate = vtkQuadricDecimation()
+            decimate.SetInputData(source)
+            decimate.SetTargetReduction(1.0 - fraction / previous_fraction)
+            decimate.Update()
+            source = vtkPolyData()
+            source.ShallowCopy(decimate.GetOutput())
+            levels.append(source)
+            previous_fraction = fraction
+        self.signals.finished.emit(self.filename, levels)
@@ -21,3 +21,26 @@ class AbstractImageWidget:
 
     def clear(self):
         raise NotImplemented
+
+    def get_memory_usage(self, filename, shared=None) -> int:
+        """
+        :param filename: the file that is plotted
+        :param shared: the data of the file in the DataManager, which is not counted when the plot uses it directly
+        :return: the bytes held by the plot of the file that are not part of the data in the DataManager
+        """
+        return 0
+
+    def get_session_state(self) -> dict:
+        """
+        :return: what is plotted and how, as JSON compatible values, so it can be restored with a session
+        """
+        return {}
+
+    def restore_session_state(self, state: dict, data_manager) -> None:
+        """
+        plots the files of a session again.
+        :param state: the state returned by get_session_state
+        :param data_manager: the data manager that holds the files of the session
+        :return: None
+        """
+        pass
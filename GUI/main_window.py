@@ -0,0 +1,18 @@
+from PySide2.QtWidgets import QMainWindow, QApplication
+
+from GUI.ui import UiMainWindow
+from settings_store import settings_store
+
+
+class MainWindow(QMainWindow):
+    """
+    creates the main window and sets up the ui. It also makes sure threads are stopped when the application is closed.
+    """
+    def __init__(self):
+        QMainWindow.__init__(self)
+        self.ui = UiMainWindow()
+        self.ui.setupUi(self)
+
+        QApplication.instance().aboutToQuit.connect(lambda: self.ui.stop_threads_upon_close())
+        QApplication.instance().aboutToQuit.connect(lambda: self.ui.save_last_session())
+        QApplication.instance().aboutToQuit.connect(lambda: settings_store.flush())
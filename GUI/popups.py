@@ -3,10 +3,13 @@ from PySide2.QtWidgets import QMessageBox
 
 class ErrorDialog:
     """
-    A dialog that will pop up when an error occurs.
+    A dialog that will pop up when an error occurs. By default it blocks until it is closed, a non-blocking dialog
+    lets the main thread continue, like the InfoDialog.
     """
-    def __init__(self, message):
+    def __init__(self, message, blocking=True):
         self.message = message
+        self.blocking = blocking
+        self.error_dialog = None
         self.open_window()
 
     def open_window(self):
@@ -14,12 +17,30 @@ class ErrorDialog:
         sets up the window with the provided error message and executes it.
         :return:
         """
-        error_dialog = QMessageBox()
-        error_dialog.setIcon(QMessageBox.Critical)
-        error_dialog.setText(self.message)
-        error_dialog.setWindowTitle('Error')
-        error_dialog.setStandardButtons(QMessageBox.Ok)
-        error_dialog.exec_()   # exec_() to claim the thread and stop the main program from running
+        self.error_dialog = QMessageBox()
+        self.error_dialog.setIcon(QMessageBox.Critical)
+        self.error_dialog.setText(self.message)
+        self.error_dialog.setWindowTitle('Error')
+        self.error_dialog.setStandardButtons(QMessageBox.Ok)
+        if self.blocking:
+            self.error_dialog.exec_()   # exec_() to claim the thread and stop the main program from running
+        else:
+            self.error_dialog.show()    # show() to allow the program thread to keep running
+
+    def is_open(self) -> bool:
+        """
+        :return: whether the dialog is still shown
+        """
+        return self.error_dialog is not None and self.error_dialog.isVisible()
+
+    def add_message(self, message) -> None:
+        """
+        adds another error to the dialog while it is shown.
+        :param message: the error message
+        :return: None
+        """
+        self.message += "\n" + message
+        self.error_dialog.setText(self.message)
 
 
 class InfoDialog:
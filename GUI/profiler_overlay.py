@@ -0,0 +1,76 @@
+import time
+from typing import Callable, Dict
+
+from PySide2.QtCore import Qt, QTimer
+from PySide2.QtWidgets import QLabel, QWidget
+
+from profiler import profiler, get_memory_usage
+
+
+class ProfilerOverlay(QLabel):
+    """
+    A small label on top of the main window that shows the frame rate and frame time of the plots, the depth of the
+    queues and the memory usage of the application, while profiling is switched on.
+    """
+    # the timers that count as a frame, with the name shown in the overlay
+    frame_timers = {"MatPlotLibImageWidget.animate": "mpl", "vtk render": "vtk"}
+
+    def __init__(self, parent: QWidget, queue_depths: Dict[str, Callable[[], int]] = None, interval: int = 500):
+        """
+        constructor for the overlay
+        :param parent: the widget the overlay is drawn on, it is placed in its top right corner
+        :param queue_depths: a function per queue that returns the number of items waiting in it
+        :param interval: the time between updates of the overlay in milliseconds
+        """
+        super().__init__(parent)
+        self.queue_depths = queue_depths or {}
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet("color: #ffffff; background-color: rgba(36, 37, 39, 200); padding: 4px; "
+                           "font-family: monospace")
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(lambda: self.update_text())
+        self.interval = interval
+        self.previous_totals: Dict[str, tuple] = {}
+        self.previous_time: float = time.perf_counter()
+        self.hide()
+
+    def set_visible(self, visible: bool) -> None:
+        """
+        shows or hides the overlay, it is only updated while it is visible.
+        :param visible: whether the overlay should be shown
+        :return: None
+        """
+        if visible:
+            self.previous_totals = profiler.get_timer_totals()
+            self.previous_time = time.perf_counter()
+            self.update_text()
+            self.timer.start(self.interval)
+            self.show()
+            self.raise_()
+        else:
+            self.timer.stop()
+            self.hide()
+
+    def update_text(self) -> None:
+        """
+        updates the overlay with the frames that were measured since the previous update.
+        :return: None
+        """
+        now = time.perf_counter()
+        elapsed = max(now - self.previous_time, 1e-6)
+        totals = profiler.get_timer_totals()
+        lines = []
+        for timer, label in self.frame_timers.items():
+            count, total = totals.get(timer, (0, 0.0))
+            previous_count, previous_total = self.previous_totals.get(timer, (0, 0.0))
+            frames = count - previous_count
+            frame_time = (total - previous_total) / frames if frames else 0.0
+            lines.append(f"{label}: {frames / elapsed:5.1f} fps {frame_time:6.1f} ms")
+        for name, depth in self.queue_depths.items():
+            lines.append(f"{name}: {depth()}")
+        lines.append(f"memory: {get_memory_usage() / 2 ** 20:.0f} MB")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        self.move(self.parentWidget().width() - self.width() - 10, 10)
+        self.previous_totals = totals
+        self.previous_time = now
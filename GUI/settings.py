@@ -1,30 +1,42 @@
-import json
 import socket
 
 from PySide2.QtGui import QIntValidator
 
 from PySide2.QtCore import Qt
 from PySide2.QtWidgets import QDialog, QHBoxLayout, QPushButton, QVBoxLayout, QLabel, QWidget, QLineEdit, QComboBox, \
-    QDialogButtonBox
+    QDialogButtonBox, QCheckBox
 
+from GUI.popups import ErrorDialog
+from profiler import profiler
+from settings_store import settings_store
 
-def update_json_file(file: str, new_settings: dict) -> None:
+
+def setting_text(key: str) -> str:
     """
-    universal method to update a json file with new content.
-    :param file: the path to the file
-    :param new_settings: the new settings.
-    :return: None
+    :param key: the key of the setting
+    :return: the value of the setting as it is shown in a field, an empty string if it is not set
     """
-    try:
-        with open(file, 'r') as f:
-            settings = json.load(f)
-    except FileNotFoundError:
-        settings = {}
+    value = settings_store.get(key)
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ", ".join(f"{item:g}" for item in value)
+    return f"{value:g}" if isinstance(value, float) else str(value)
 
-    settings.update(new_settings)
 
-    with open(file, 'w') as f:
-        json.dump(settings, f, indent=4)
+def update_settings(new_settings: dict) -> bool:
+    """
+    universal method to change settings from a dialog. Invalid values are shown in an error dialog and change none
+    of the settings.
+    :param new_settings: the new settings.
+    :return: whether the settings were changed
+    """
+    try:
+        settings_store.update(new_settings)
+    except ValueError as e:
+        ErrorDialog(str(e))
+        return False
+    return True
 
 
 class SettingsDialog(QDialog):
@@ -34,7 +46,6 @@ class SettingsDialog(QDialog):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Settings")
-        self.settings_file = 'settings.json'
 
         # Create layout and add widgets
         layout = QVBoxLayout(self)
@@ -58,6 +69,24 @@ class SettingsDialog(QDialog):
         self.port_layout.addWidget(self.port_edit)
         layout.addWidget(self.port_widget)
 
+        # reading devices in separate processes, which applies to the devices that are connected afterwards
+        self.ingest_checkbox = QCheckBox("ingest in worker processes")
+        layout.addWidget(self.ingest_checkbox)
+
+        # saving the session on quit and restoring it on the next start
+        self.restore_session_checkbox = QCheckBox("restore the last session on start")
+        layout.addWidget(self.restore_session_checkbox)
+
+        # profiling, which takes effect right away and is not saved
+        self.profiling_widget = QWidget(self)
+        self.profiling_layout = QHBoxLayout(self.profiling_widget)
+        self.profiling_checkbox = QCheckBox("profiling overlay")
+        self.profiling_checkbox.setChecked(profiler.enabled)
+        self.profiling_layout.addWidget(self.profiling_checkbox)
+        self.export_trace_button = QPushButton("export trace")
+        self.profiling_layout.addWidget(self.export_trace_button)
+        layout.addWidget(self.profiling_widget)
+
         # OK Button to close the dialog
         self.ok_button = QPushButton("OK")
         self.ok_button.clicked.connect(lambda: self.save_settings_on_close())
@@ -68,39 +97,50 @@ class SettingsDialog(QDialog):
 
     def save_settings_on_close(self) -> None:
         """
-        saves the settings upon closing the dialog
+        saves the settings upon closing the dialog, the dialog stays open if a setting is invalid
         :return:
         """
-        self.save_settings()
-        self.close()
+        if self.save_settings():
+            self.close()
 
-    def save_settings(self) -> None:
+    def get_profiling_checkbox(self) -> QCheckBox:
         """
-        fetches the settings from the dialog and writes them to the jason file
-        :return: None
+        :return: the checkbox that switches profiling and the overlay on or off
+        """
+        return self.profiling_checkbox
+
+    def get_export_trace_button(self) -> QPushButton:
+        """
+        :return: the button that exports the recorded profile as a Chrome trace
+        """
+        return self.export_trace_button
+
+    def save_settings(self) -> bool:
+        """
+        fetches the settings from the dialog and stores them in the settings store
+        :return: whether the settings were valid
         """
         ip_address = self.ip_line_edit.text()
         port = self.port_edit.text()
 
         new_settings = {
             "ip-address": ip_address,
-            "port": port
+            "port": port,
+            "process-ingest": self.ingest_checkbox.isChecked(),
+            "restore-last-session": self.restore_session_checkbox.isChecked()
         }
 
-        update_json_file(self.settings_file, new_settings)
+        return update_settings(new_settings)
 
     def load_settings(self) -> None:
         """
         makes sure that upon opening the settings dialog, the previously saved settings will be displayed.
         :return: None
         """
-        try:
-            with open(self.settings_file, 'r') as f:
-                settings = json.load(f)
-                self.ip_line_edit.setText(settings.get("ip-address", ""))
-                self.port_edit.setText(settings.get("port", ""))
-        except FileNotFoundError:
-            pass
+        self.ip_line_edit.setText(setting_text("ip-address"))
+        self.port_edit.setText(setting_text("port"))
+        self.ingest_checkbox.setChecked(settings_store.get("process-ingest"))
+        self.restore_session_checkbox.setChecked(settings_store.get("restore-last-session"))
 
 
 class FilterSettingsDialog(QDialog):
@@ -111,7 +151,6 @@ class FilterSettingsDialog(QDialog):
     def __init__(self, field_style, button_style):
         super().__init__()
         self.setWindowTitle("Filter Settings")
-        self.settings_file = "settings.json"
         self.field_style = field_style
         self.button_style = button_style
         self.setup()
@@ -147,6 +186,11 @@ class FilterSettingsDialog(QDialog):
         self.sampling_frequency.setStyleSheet(self.field_style)
         self.filter_layout.addWidget(self.sampling_frequency)
 
+        # Checkbox for estimating the sampling frequency from the x column instead of using the one above
+        self.estimate_sampling_frequency = QCheckBox("estimate sampling frequency from the x column")
+        self.estimate_sampling_frequency.toggled.connect(lambda checked: self.sampling_frequency.setEnabled(not checked))
+        self.filter_layout.addWidget(self.estimate_sampling_frequency)
+
         # Line edit for order
         self.order = QLineEdit(self.filter_widget)
         self.order.setPlaceholderText("order")
@@ -163,16 +207,16 @@ class FilterSettingsDialog(QDialog):
 
     def save_settings_on_close(self) -> None:
         """
-        saves the settings upon closing the dialog
+        saves the settings upon closing the dialog, the dialog stays open if a setting is invalid
         :return: None
         """
-        self.save_settings()
-        self.close()
+        if self.save_settings():
+            self.close()
 
-    def save_settings(self) -> None:
+    def save_settings(self) -> bool:
         """
-        fetches the settings from the dialog and writes them to the jason file
-        :return: None
+        fetches the settings from the dialog and stores them in the settings store
+        :return: whether the settings were valid
         """
         filter_type = self.filter_type.currentText()
         cutoff = self.cutoff.text()
@@ -182,25 +226,23 @@ class FilterSettingsDialog(QDialog):
         new_settings = {
             "filter-type": filter_type,
             "sampling-frequency": sampling_frequency,
+            "estimate-sampling-frequency": self.estimate_sampling_frequency.isChecked(),
             "filter-cutoff": cutoff,
             "filter-order": order
         }
-        update_json_file(self.settings_file, new_settings)
+        return update_settings(new_settings)
 
     def load_settings(self) -> None:
         """
         makes sure that upon opening the settings dialog, the previously saved settings will be displayed.
         :return: None
         """
-        try:
-            with open(self.settings_file, 'r') as f:
-                settings = json.load(f)
-                self.filter_type.setCurrentText(settings.get("filter-type", "low"))
-                self.order.setText(settings.get("filter-order", ""))
-                self.cutoff.setText(settings.get("filter-cutoff", ""))
-                self.sampling_frequency.setText(settings.get("sampling-frequency", ""))
-        except FileNotFoundError:
-            pass
+        self.filter_type.setCurrentText(settings_store.get("filter-type"))
+        self.order.setText(setting_text("filter-order"))
+        self.cutoff.setText(setting_text("filter-cutoff"))
+        self.sampling_frequency.setText(setting_text("sampling-frequency"))
+        self.estimate_sampling_frequency.setChecked(settings_store.get("estimate-sampling-frequency"))
+        self.sampling_frequency.setEnabled(not self.estimate_sampling_frequency.isChecked())
 
 
 class DeviceSettings(QDialog):
@@ -212,7 +254,6 @@ class DeviceSettings(QDialog):
     def __init__(self, available_ports, field_style, button_style):
         super().__init__()
         self.setWindowTitle("Device Settings")
-        self.settings_file = "settings.json"
         self.available_ports = available_ports
         self.field_style = field_style
         self.button_style = button_style
@@ -298,15 +339,10 @@ class DeviceSettings(QDialog):
         makes sure that upon opening the settings dialog, the previously saved settings will be displayed.
         :return: None
         """
-        try:
-            with open(self.settings_file, 'r') as f:
-                settings = json.load(f)
-                self.ip_line_edit.setText(settings.get("ip-address", ""))
-                self.port_edit.setText(settings.get("port", ""))
-                current_baud_rate_index = self.baud_rate_box.findText(settings.get("baud-rate", "1200"))
-                self.baud_rate_box.setCurrentIndex(current_baud_rate_index)
-        except FileNotFoundError:
-            pass
+        self.ip_line_edit.setText(setting_text("ip-address"))
+        self.port_edit.setText(setting_text("port"))
+        current_baud_rate_index = self.baud_rate_box.findText(setting_text("baud-rate"))
+        self.baud_rate_box.setCurrentIndex(current_baud_rate_index)
 
     def get_connect_internet_button(self):
         """
@@ -11,7 +11,8 @@ class SidebarWidget:
         self.datalabel_widget: QWidget
         self.toggle_button: QPushButton
         self.load_data_button: QPushButton
-        self.loaded_data: list['DataCard']
+        self.loaded_data: list['DataCard'] = []
+        self.memory_label: QLabel
         # set up the widget
         self.setup(module_name)
 
@@ -55,6 +56,14 @@ class SidebarWidget:
             toggle_button.setIcon(self.toggledown_icon)
         toggle_button.setText(name)
         module_layout.addWidget(toggle_button)
+        # memory used by the module, filled in once the module is created
+        self.memory_label = QLabel(main_widget)
+        font = QFont()
+        font.setPointSize(8)
+        self.memory_label.setFont(font)
+        self.memory_label.setStyleSheet(u"color:#a0a0a0; padding-left:5px")
+        self.memory_label.hide()
+        module_layout.addWidget(self.memory_label)
 
         # set up the dropdown widget if the module can load data
         if self.can_load_data:
@@ -97,14 +106,16 @@ class SidebarWidget:
         load_data_button.setText(u"+")
         toggle_widget_layout.addWidget(load_data_button)
 
-    def add_datacard(self, filename: str) -> 'DataCard':
+    def add_datacard(self, filename: str, is_volume: bool = False) -> 'DataCard':
         """
         Adds a data card with the filename to the dropdown widget.
         :param filename: the name of the file to be added
+        :param is_volume: whether the file is a directory containing DICOM files for a volume
         :return: the DataCard object itself.
         """
-        datacard = DataCard(self.datalabel_widget, filename)
+        datacard = DataCard(self.datalabel_widget, filename, is_volume)
         self.datalabel_widget.layout().addWidget(datacard)
+        self.loaded_data.append(datacard)
         return datacard
 
     def remove_datacard(self, datacard: 'DataCard') -> None:
@@ -114,6 +125,23 @@ class SidebarWidget:
         :return: None
         """
         self.datalabel_widget.layout().removeWidget(datacard)
+        if datacard in self.loaded_data:
+            self.loaded_data.remove(datacard)
+
+    def get_datacards(self) -> list['DataCard']:
+        """
+        :return: the data cards in the dropdown widget
+        """
+        return self.loaded_data
+
+    def set_memory_usage(self, text: str) -> None:
+        """
+        shows the memory usage of the module below the toggle button.
+        :param text: the memory usage, for example "12.0 MB (peak 30.0 MB)"
+        :return: None
+        """
+        self.memory_label.setText(text)
+        self.memory_label.show()
 
     def get_load_data_button(self) -> QPushButton:
         """
@@ -157,9 +185,10 @@ class DataCard(QWidget):
     class for a widget displaying a file alongside a trash icon to delete that file from the UI.
     The data cards will be displayed in the dropdown widget.
     """
-    def __init__(self, parent_widget, filename):
+    def __init__(self, parent_widget, filename, is_volume=False):
         super().__init__(parent_widget)
         self.filename = filename
+        self.is_volume = is_volume
         # main frame that holds the button and label
         self.setStyleSheet(u"background-color:#transparent")
         loaded_data_layout = QHBoxLayout(self)
@@ -171,6 +200,11 @@ class DataCard(QWidget):
         datalabel.setText(filename)
         loaded_data_layout.addWidget(datalabel, 0, Qt.AlignLeft)
 
+        # the label with the memory the file uses
+        self.memory_label = QLabel(self)
+        self.memory_label.setStyleSheet(u"color:#a0a0a0")
+        loaded_data_layout.addWidget(self.memory_label, 0, Qt.AlignRight)
+
         # button to delete the loaded data
         self.delete_data_button = QPushButton(self)
         self.delete_data_button.setStyleSheet(u"background-color:transparent;")
@@ -186,6 +220,16 @@ class DataCard(QWidget):
         """
         return self.delete_data_button
 
+    def set_memory_usage(self, text: str, details: str = "") -> None:
+        """
+        shows the memory the file uses.
+        :param text: the total memory usage
+        :param details: how the total is made up, shown as tooltip
+        :return: None
+        """
+        self.memory_label.setText(text)
+        self.memory_label.setToolTip(details)
+
     def get_filename(self):
         """
         :return: the filename of this data card
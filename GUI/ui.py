@@ -1,26 +1,39 @@
-from PySide2.QtCore import (QMetaObject, QSize, Qt)
-from PySide2.QtGui import QIcon
+import os
+from typing import Union
+
+from PySide2.QtCore import (QMetaObject, QSize, Qt, QTimer)
+from PySide2.QtGui import QIcon, QGuiApplication
 from PySide2.QtWidgets import *
 
 from GUI.settings import SettingsDialog
+from GUI.profiler_overlay import ProfilerOverlay
 
 
-# modules
+# modules, the actual modules are imported when they are first toggled on
+from GUI.popups import ErrorDialog
 from modules.abstract_module import AbstractModule
-from modules.vtk_module import VTKModule
-from modules.matplotlib_module import MatPlotLibModule
-from modules.connection_module import ConnectionModule
+from modules.lazy_module import LazyModule
+from modules.module_registry import ModuleRegistry
 # data manager
 from data_manager import DataManager
+from event_bus import event_bus, ErrorEvent, FilesLoadedEvent
+from profiler import profiler
+from session import SessionWriter, SessionReader
+from settings_store import settings_store
+
+# the session that is saved when the application is closed and restored when it is started again
+LAST_SESSION_PATH = "last_session.ivs"
 
 
 class UiMainWindow(object):
     def __init__(self) -> None:
+        # the settings are read once, after this they are kept in memory
+        self.settings_errors: list[str] = settings_store.load()
         self.data_manager = DataManager()
-        self.vtk = VTKModule(self.data_manager)
-        self.mpl = MatPlotLibModule(self.data_manager)
-        self.con = ConnectionModule(self.data_manager, self.mpl.image_widget)
-        self.modules: list[AbstractModule] = [self.vtk, self.mpl, self.con]
+        # the builtin modules and the plugins are registered with their metadata, they are imported on first use
+        self.module_registry = ModuleRegistry(self.data_manager)
+        self.plugin_errors: list[str] = self.module_registry.discover()
+        self.modules: list[LazyModule] = self.module_registry.get_lazy_modules()
 
     ###############################################################################################################
     ###############################################################################################################
@@ -72,6 +85,20 @@ class UiMainWindow(object):
         MainWindow.setCentralWidget(self.centralwidget)
         MainWindow.setWindowTitle(u"IntraVision")
         QMetaObject.connectSlotsByName(MainWindow)
+        self.setup_event_bus()
+        self.profiler_overlay = ProfilerOverlay(self.centralwidget, {"event queue": event_bus.get_queue_depth})
+        # the memory usage in the sidebar is refreshed every second
+        self.memory_timer = QTimer()
+        self.memory_timer.timeout.connect(lambda: self.update_memory_usage())
+        self.memory_timer.start(1000)
+        if self.plugin_errors:
+            ErrorDialog("The following modules could not be registered:\n" + "\n".join(self.plugin_errors))
+        # the folder that was watched during the previous run is watched again
+        if settings_store.get("watch-folder"):
+            self.watch_folder(settings_store.get("watch-folder"))
+        if self.settings_errors:
+            ErrorDialog("The following settings are invalid, their defaults are used:\n" +
+                        "\n".join(self.settings_errors))
 
     # setupUi
     def setup_sidebar(self) -> None:
@@ -102,7 +129,70 @@ class UiMainWindow(object):
         self.settings_button = QPushButton(icon, "", self.leftMenu)
         self.settings_button.setStyleSheet("background-color: #3a3b3d")
         self.settings_button.clicked.connect(self.set_settings_callback())
-        self.left_menu_layout.addWidget(self.settings_button, 0, Qt.AlignLeft)
+
+        # session buttons next to the settings button
+        self.save_session_button = QPushButton("save session", self.leftMenu)
+        self.save_session_button.setStyleSheet("background-color: #3a3b3d; color: #ffffff")
+        self.save_session_button.clicked.connect(lambda: self.save_session_dialog())
+        self.open_session_button = QPushButton("open session", self.leftMenu)
+        self.open_session_button.setStyleSheet("background-color: #3a3b3d; color: #ffffff")
+        self.open_session_button.clicked.connect(lambda: self.open_session_dialog())
+        self.watch_folder_button = QPushButton("watch folder", self.leftMenu)
+        self.watch_folder_button.setStyleSheet("background-color: #3a3b3d; color: #ffffff")
+        self.watch_folder_button.clicked.connect(lambda: self.toggle_watch_folder())
+        self.bottom_buttons = QWidget(self.leftMenu)
+        bottom_buttons_layout = QHBoxLayout(self.bottom_buttons)
+        bottom_buttons_layout.setContentsMargins(0, 0, 0, 0)
+        bottom_buttons_layout.addWidget(self.settings_button)
+        bottom_buttons_layout.addWidget(self.save_session_button)
+        bottom_buttons_layout.addWidget(self.open_session_button)
+        bottom_buttons_layout.addWidget(self.watch_folder_button)
+        self.left_menu_layout.addWidget(self.bottom_buttons, 0, Qt.AlignLeft)
+
+    def setup_event_bus(self) -> None:
+        """
+        drains the event bus once per refresh interval of the screen, so the events of worker threads are handled on
+        the GUI thread. Errors are shown in an error dialog.
+        :return: None
+        """
+        event_bus.subscribe(ErrorEvent, lambda event: self.show_error(event.message))
+        event_bus.subscribe(FilesLoadedEvent, lambda event: self.add_watched_files(event))
+        screen = QGuiApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None and screen.refreshRate() > 0 else 60.0
+        self.error_dialog: Union[ErrorDialog, None] = None
+        self.event_timer = QTimer()
+        self.event_timer.timeout.connect(lambda: self.drain_event_bus())
+        self.event_timer.start(int(1000 / refresh_rate))
+
+    def show_error(self, message: str) -> None:
+        """
+        shows an error of a worker thread without blocking, so the event bus keeps being drained in order while the
+        dialog is open. Errors that arrive while the dialog is open are added to it instead of opening another one.
+        :param message: the error message
+        :return: None
+        """
+        if self.error_dialog is not None and self.error_dialog.is_open():
+            self.error_dialog.add_message(message)
+        else:
+            self.error_dialog = ErrorDialog(message, blocking=False)
+
+    def drain_event_bus(self) -> None:
+        """
+        handles the events that worker threads published since the last frame.
+        :return: None
+        """
+        with profiler.measure("event_bus.drain", "events"):
+            drained = event_bus.drain()
+        if drained:
+            profiler.count("events", drained)
+
+    def update_memory_usage(self) -> None:
+        """
+        updates the memory usage that the modules show in the sidebar. Modules that were not created yet use none.
+        :return: None
+        """
+        for module in self.module_registry.get_loaded_modules():
+            module.update_memory_usage()
 
     def setup_image_widget(self) -> None:
         """
@@ -146,15 +236,189 @@ class UiMainWindow(object):
         :return: None
         """
         self.settings_dialog = SettingsDialog()
+        self.settings_dialog.get_profiling_checkbox().toggled.connect(lambda checked: self.set_profiling(checked))
+        self.settings_dialog.get_export_trace_button().clicked.connect(lambda: self.export_trace())
         self.settings_dialog.exec_()
 
-    def set_toggle_callback(self, module: AbstractModule):
+    def set_profiling(self, enabled: bool) -> None:
+        """
+        switches profiling on or off, together with the overlay that shows the results.
+        :param enabled: whether profiling should be on
+        :return: None
+        """
+        profiler.set_enabled(enabled)
+        self.profiler_overlay.set_visible(enabled)
+
+    def export_trace(self) -> None:
+        """
+        asks for a file and writes the recorded profile to it as a Chrome trace, which can be opened in
+        chrome://tracing or Perfetto.
+        :return: None
+        """
+        path, _ = QFileDialog.getSaveFileName(self.centralwidget, "Export trace", "trace.json", "Trace (*.json)")
+        if not path:
+            return
+        try:
+            profiler.export_chrome_trace(path)
+        except OSError as e:
+            ErrorDialog(f"could not export the trace: {e}")
+
+    def save_session_dialog(self) -> None:
+        """
+        asks for a file and saves the session to it.
+        :return: None
+        """
+        path, _ = QFileDialog.getSaveFileName(self.centralwidget, "Save session", "session.ivs",
+                                              "Session (*.ivs)")
+        if not path:
+            return
+        try:
+            self.save_session(path)
+        except (OSError, ValueError) as e:
+            ErrorDialog(f"could not save the session: {e}")
+
+    def open_session_dialog(self) -> None:
+        """
+        asks for a session file and restores it.
+        :return: None
+        """
+        path, _ = QFileDialog.getOpenFileName(self.centralwidget, "Open session", "", "Session (*.ivs)")
+        if not path:
+            return
+        try:
+            self.open_session(path)
+        except (OSError, ValueError) as e:
+            ErrorDialog(f"could not open the session: {e}")
+
+    def save_session(self, path: str) -> None:
+        """
+        saves the loaded data and the state of every module that was used to a session file.
+        :param path: the path of the session file
+        :return: None
+        """
+        module_states = {}
+        for module in self.modules:
+            state = module.get_session_state()
+            if state is not None:
+                module_states[module.module_name] = state
+        SessionWriter().write(path, self.data_manager, module_states)
+
+    def open_session(self, path: str) -> None:
+        """
+        restores a session. Only the header of the session is read, the data of a file is read once it is used and
+        modules that were not created yet restore their state once they are toggled on.
+        :param path: the path of the session file
+        :return: None
+        """
+        reader = SessionReader(path)
+        reader.restore_data(self.data_manager)
+        module_states = reader.get_module_states()
+        for module in self.modules:
+            if module.module_name in module_states:
+                module.restore_session_state(module_states[module.module_name])
+
+    def save_last_session(self) -> None:
+        """
+        saves the session when the application is closed, so it can be restored on the next start. Only when the
+        restore-last-session setting is on.
+        :return: None
+        """
+        if not settings_store.get("restore-last-session"):
+            return
+        try:
+            self.save_session(LAST_SESSION_PATH)
+        except (OSError, ValueError):
+            pass    # the application is closing, there is nobody left to show the error to
+
+    def open_last_session(self) -> None:
+        """
+        restores the session of the previous run of the application, if there is one and the restore-last-session
+        setting is on.
+        :return: None
+        """
+        if not settings_store.get("restore-last-session") or not os.path.exists(LAST_SESSION_PATH):
+            return
+        try:
+            self.open_session(LAST_SESSION_PATH)
+        except (OSError, ValueError) as e:
+            ErrorDialog(f"could not restore the previous session: {e}")
+
+    def toggle_watch_folder(self) -> None:
+        """
+        asks for a folder and starts watching it for new files, or stops watching the folder that is watched.
+        :return: None
+        """
+        if self.data_manager.folder_watchers:
+            self.data_manager.stop_watching()
+            settings_store.set("watch-folder", "")
+            self.watch_folder_button.setText("watch folder")
+            return
+        directory = QFileDialog.getExistingDirectory(self.centralwidget, "Watch folder", "",
+                                                     QFileDialog.ShowDirsOnly)
+        if directory:   # returns an empty string if the dialog was closed
+            self.watch_folder(directory)
+
+    def watch_folder(self, directory: str) -> None:
+        """
+        starts loading the new files in a folder, with the modules that accept their file type.
+        :param directory: the folder to watch
+        :return: None
+        """
+        try:
+            self.data_manager.watch_folder(directory, self.module_registry.get_file_types())
+        except OSError as e:
+            ErrorDialog(f"could not watch {directory}: {e}")
+            return
+        settings_store.set("watch-folder", directory)
+        self.watch_folder_button.setText("stop watching")
+
+    def add_watched_files(self, event: FilesLoadedEvent) -> None:
+        """
+        adds the files that were read from a watched folder to the DataManager and to the first module that accepts
+        their file type. DICOM directories go to the modules that accept DICOM files.
+        :param event: the event with the files that were read
+        :return: None
+        """
+        for path, data, is_volume in event.files:
+            modules = self.module_registry.find_modules_for_file(path + ".dcm" if is_volume else path)
+            if not modules:
+                continue
+            module = self.load_module(modules[0].name)
+            if module is None:
+                continue
+            filename = self.data_manager.add_data(path if is_volume else os.path.basename(path), data, path)
+            module.add_file_to_widgets(filename, is_volume)
+
+    def load_module(self, name: str) -> Union[AbstractModule, None]:
+        """
+        creates a module the first time it is needed. A plugin that cannot be imported or created is left off and the
+        error is shown.
+        :param name: the name of the module
+        :return: the module, or None if it could not be created
+        """
+        try:
+            return self.module_registry.load(name)
+        except (ImportError, TypeError) as e:
+            self.show_error(f"could not load the {name} module: {e}")
+            return None
+
+    def set_toggle_callback(self, module: LazyModule):
+        """
+        callback for toggling a module on or off. The module is created the first time it is toggled.
+        :param module: the module to be toggled
+        :return: None
+        """
+        return lambda: self.toggle_lazy_module(module)
+
+    def toggle_lazy_module(self, module: LazyModule) -> None:
         """
-        callback for toggling a module on or off.
+        creates the module if needed and toggles it, a module that could not be created stays off.
         :param module: the module to be toggled
         :return: None
         """
-        return lambda: self.toggle_module(module)
+        loaded_module = self.load_module(module.module_name)
+        if loaded_module is not None:
+            self.toggle_module(loaded_module)
 
     def toggle_module(self, module: AbstractModule) -> None:
         """
@@ -211,8 +475,10 @@ class UiMainWindow(object):
 
     def stop_threads_upon_close(self) -> None:
         """
-        calls the stop thread method in the connection module on closing the application.
+        calls the stop thread method of every module that was created, on closing the application.
         :return: None
         """
-        self.con.stop_thread()
+        for module in self.module_registry.get_loaded_modules():
+            module.stop_thread()
+        self.data_manager.stop_watching()
 
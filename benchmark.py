@@ -0,0 +1,457 @@
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+# the benchmarks run without a window, Qt widgets that are needed for the live ingestion are never shown
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# the size of the synthetic datasets for every scale
+SCALES = {
+    "small": {"rows": 10_000, "volume": 64, "mesh": 100, "live": 5_000},
+    "medium": {"rows": 200_000, "volume": 128, "mesh": 400, "live": 20_000},
+    "large": {"rows": 1_000_000, "volume": 256, "mesh": 1000, "live": 50_000},
+}
+SAMPLING_FREQUENCY = 1000.0
+MAX_EXCEL_ROWS = 50_000     # writing larger Excel files takes longer than all other benchmarks together
+
+
+###############################################################################################################
+# synthetic datasets
+###############################################################################################################
+
+def make_signal(rows: int) -> pd.DataFrame:
+    """
+    creates an ECG like signal: a beat every 0.8 seconds on top of baseline wander and noise.
+    :param rows: the number of samples
+    :return: a DataFrame with the time in seconds and the signal
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(rows) / SAMPLING_FREQUENCY
+    beats = np.exp(-((t % 0.8) - 0.4) ** 2 / (2 * 0.01 ** 2))
+    signal = beats + 0.2 * np.sin(2 * np.pi * 0.3 * t) + 0.05 * rng.standard_normal(rows)
+    return pd.DataFrame({"time": t, "signal": signal})
+
+
+def write_volume(path: str, size: int) -> None:
+    """
+    writes a CT like volume as MetaImage: air around a body of soft tissue with a few bright vessels, as 16 bit
+    integers like DICOM data.
+    :param path: the path of the .mhd file, the voxels are written next to it
+    :param size: the number of voxels along every axis
+    :return: None
+    """
+    from vtkmodules.util.numpy_support import numpy_to_vtk
+    from vtkmodules.vtkCommonDataModel import vtkImageData
+    from vtkmodules.vtkIOImage import vtkMetaImageWriter
+
+    rng = np.random.default_rng(0)
+    z, y, x = np.mgrid[0:size, 0:size, 0:size] / size - 0.5
+    voxels = np.full((size, size, size), -1000, dtype=np.int16)
+    voxels[x ** 2 + y ** 2 < 0.4 ** 2] = 40
+    for cx, cy in rng.uniform(-0.25, 0.25, (5, 2)):
+        voxels[(x - cx) ** 2 + (y - cy) ** 2 < 0.02 ** 2] = 400
+    voxels += rng.integers(-20, 20, voxels.shape, dtype=np.int16)
+
+    image = vtkImageData()
+    image.SetDimensions(size, size, size)
+    image.SetSpacing(0.5, 0.5, 0.5)
+    image.GetPointData().SetScalars(numpy_to_vtk(voxels.ravel(), deep=True))
+    writer = vtkMetaImageWriter()
+    writer.SetFileName(path)
+    writer.SetCompression(False)
+    writer.SetInputData(image)
+    writer.Write()
+
+
+def write_mesh(path: str, resolution: int) -> None:
+    """
+    writes a sphere mesh, the format follows from the extension (.stl or .ply).
+    :param path: the path of the mesh
+    :param resolution: the number of subdivisions around and along the sphere, the mesh has about 2 * resolution ** 2
+    triangles
+    :return: None
+    """
+    from vtkmodules.vtkFiltersSources import vtkSphereSource
+    from vtkmodules.vtkIOGeometry import vtkSTLWriter
+    from vtkmodules.vtkIOPLY import vtkPLYWriter
+
+    sphere = vtkSphereSource()
+    sphere.SetThetaResolution(resolution)
+    sphere.SetPhiResolution(resolution)
+    writer = vtkSTLWriter() if path.endswith(".stl") else vtkPLYWriter()
+    writer.SetFileName(path)
+    writer.SetInputConnection(sphere.GetOutputPort())
+    writer.SetFileTypeToBinary()
+    writer.Write()
+
+
+def generate_datasets(directory: str, scale: Dict[str, int]) -> Dict[str, Union[str, pd.DataFrame]]:
+    """
+    writes the synthetic datasets of a scale to a directory.
+    :param directory: the directory the files are written to
+    :param scale: the sizes of the datasets, see SCALES
+    :return: the signal and the path of every file, files that could not be written are left out
+    """
+    signal = make_signal(scale["rows"])
+    datasets = {"signal": signal, "csv": os.path.join(directory, "signal.csv"),
+                "volume": os.path.join(directory, "volume.mhd"), "stl": os.path.join(directory, "mesh.stl"),
+                "ply": os.path.join(directory, "mesh.ply")}
+    signal.to_csv(datasets["csv"], index=False)
+    write_volume(datasets["volume"], scale["volume"])
+    write_mesh(datasets["stl"], scale["mesh"])
+    write_mesh(datasets["ply"], scale["mesh"])
+    try:
+        datasets["xlsx"] = os.path.join(directory, "signal.xlsx")
+        signal.iloc[:MAX_EXCEL_ROWS].to_excel(datasets["xlsx"], index=False)
+    except ImportError:     # writing Excel files needs openpyxl
+        del datasets["xlsx"]
+    return datasets
+
+
+###############################################################################################################
+# benchmarks
+###############################################################################################################
+
+def benchmark_load(path: str, prepare_meshes: bool = False, cache_directory: str = None) -> Callable[[], None]:
+    """
+    :param path: the file to load
+    :param prepare_meshes: whether meshes go through the mesh preparation
+    :param cache_directory: the directory of the prepared mesh cache
+    :return: a function that loads the file in a new DataManager
+    """
+    from data_manager import DataManager
+
+    def run():
+        data_manager = DataManager()
+        data_manager.mesh_preparation.enabled = prepare_meshes
+        if cache_directory is not None:
+            data_manager.mesh_preparation.cache_directory = cache_directory
+        if data_manager.load_data(path) is None:
+            raise RuntimeError(f"could not load {path}")
+    return run
+
+
+def benchmark_filter(signal: pd.DataFrame) -> Callable[[], None]:
+    """
+    :param signal: the signal to filter
+    :return: a function that band-pass filters the signal like the filter button of the matplotlib module
+    """
+    import custom_math as cm
+    return lambda: cm.filter_data(signal, "bandpass", [0.5, 40.0], SAMPLING_FREQUENCY, 5)
+
+
+def benchmark_convolution(signal: pd.DataFrame) -> Callable[[], None]:
+    """
+    :param signal: the signal to convolve
+    :return: a function that convolves the signal with a one second long kernel
+    """
+    import custom_math as cm
+    values = signal["signal"].to_numpy()
+    kernel = np.hanning(int(SAMPLING_FREQUENCY))
+    return lambda: cm.convolve_data(values, kernel)
+
+
+def benchmark_streaming_resample(signal: pd.DataFrame, batch_size: int = 37,
+                                 target_fs: float = 300.0) -> Callable[[], None]:
+    """
+    :param signal: the signal to resample
+    :param batch_size: the amount of samples per batch, like the batches of a live device
+    :param target_fs: the new sampling rate, 300 Hz needs both up and down sampling, which exercises every phase
+    :return: a function that resamples the signal batch by batch. It checks that the result equals resampling the
+    whole signal in one batch, so a benchmark of wrong output fails instead of being timed
+    """
+    import custom_math as cm
+    values = signal["signal"].to_numpy()
+    expected = cm.StreamingResampler(SAMPLING_FREQUENCY, target_fs).process(values)
+
+    def run():
+        resampler = cm.StreamingResampler(SAMPLING_FREQUENCY, target_fs)
+        output = np.concatenate([resampler.process(values[start:start + batch_size])
+                                 for start in range(0, len(values), batch_size)])
+        if output.shape != expected.shape or not np.allclose(output, expected, atol=1e-5):
+            raise RuntimeError("the resampled batches differ from resampling the whole signal")
+    return run
+
+
+def benchmark_plot(signal: pd.DataFrame) -> Callable[[], None]:
+    """
+    :param signal: the signal to plot
+    :return: a function that plots the signal in an offscreen matplotlib figure and draws it
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    def run():
+        figure = Figure(figsize=(8, 4), dpi=100)
+        canvas = FigureCanvasAgg(figure)
+        figure.add_subplot(111).plot(signal["time"].to_numpy(), signal["signal"].to_numpy())
+        canvas.draw()
+    return run
+
+
+def benchmark_render(path: str, output_directory: str) -> Callable[[], None]:
+    """
+    :param path: the dataset to render
+    :param output_directory: the directory the snapshot is written to
+    :return: a function that renders a snapshot of the dataset offscreen
+    """
+    from offscreen_renderer import render_dataset, use_software_rendering_without_display
+    use_software_rendering_without_display()
+    return lambda: render_dataset(path, output_directory, size=(800, 600))
+
+
+def serve_samples(server: socket.socket, samples: int) -> None:
+    """
+    sends "x,y" lines to the first client that connects, like a device that streams its measurements.
+    :param server: the listening socket
+    :param samples: the number of lines to send
+    :return: None
+    """
+    server.settimeout(10)
+    try:
+        connection, _ = server.accept()
+    except socket.timeout:
+        return
+    signal = make_signal(samples)
+    lines = "".join(f"{x:.4f},{y:.5f}\n" for x, y in zip(signal["time"], signal["signal"]))
+    with connection:
+        connection.sendall(lines.encode("utf-8"))
+        # keep the connection open until the reader is done, a closed socket would end the stream early
+        connection.settimeout(30)
+        try:
+            connection.recv(1)
+        except OSError:
+            pass
+
+
+def benchmark_live_ingestion(samples: int) -> Callable[[], None]:
+    """
+    :param samples: the number of samples that are streamed
+    :return: a function that streams the samples over a loopback TCP connection into a PlotThread, with beat
+    detection and the rms envelope enabled, and drains the event bus until the stream is done
+    """
+    from PySide2.QtWidgets import QApplication
+    from GUI.control_widgets.connection_control_widget import ConnectionControlWidget
+    from connections import InternetConnection
+    from data_manager import DataManager
+    from event_bus import event_bus, DataBatchEvent
+    from modules.connection_module import PlotThread
+
+    application = QApplication.instance() or QApplication([])
+
+    def run():
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        sender = threading.Thread(target=serve_samples, args=(server, samples), daemon=True)
+        sender.start()
+        connection = InternetConnection("127.0.0.1", str(server.getsockname()[1]))
+        connection.connect()
+        control_widget = ConnectionControlWidget()
+        control_widget.add_device(connection.device_name)
+        device = control_widget.get_device(connection.device_name)
+        for checkbox in (device.checkbox, device.beats_checkbox, device.rms_checkbox):
+            checkbox.setChecked(True)
+
+        received = []
+        last_batch = [time.perf_counter()]
+
+        def count_samples(event):
+            if event.name == connection.device_name:
+                received.append(len(event.x))
+                last_batch[0] = time.perf_counter()
+        event_bus.subscribe(DataBatchEvent, count_samples)
+        thread = PlotThread(connection, DataManager(), control_widget, sample_rate=0.01,
+                            sampling_frequency=SAMPLING_FREQUENCY)
+        thread.start()
+        try:
+            # the GUI thread drains the bus once per frame, the stream is done when no data arrived for half a second
+            while sum(received) < samples and time.perf_counter() - last_batch[0] < 0.5:
+                event_bus.drain()
+                application.processEvents()
+                time.sleep(1 / 60)
+        finally:
+            thread.stop()
+            connection.close()
+            event_bus.unsubscribe(DataBatchEvent, count_samples)
+            sender.join()
+            server.close()
+        if not received:
+            raise RuntimeError("no samples were received")
+    return run
+
+
+def get_benchmarks(datasets: Dict[str, Union[str, pd.DataFrame]], scale: Dict[str, int],
+                   directory: str) -> Dict[str, Callable[[], Callable[[], None]]]:
+    """
+    :param datasets: the synthetic datasets of the scale
+    :param scale: the sizes of the datasets
+    :param directory: a directory for the files the benchmarks write
+    :return: a function per benchmark that sets it up and returns the function to time
+    """
+    benchmarks = {
+        "load csv": lambda: benchmark_load(datasets["csv"]),
+        "load volume": lambda: benchmark_load(datasets["volume"]),
+        "load stl": lambda: benchmark_load(datasets["stl"]),
+        "load ply": lambda: benchmark_load(datasets["ply"]),
+        "load stl prepared": lambda: benchmark_load(datasets["stl"], True, os.path.join(directory, "mesh_cache")),
+        "filter": lambda: benchmark_filter(datasets["signal"]),
+        "convolution": lambda: benchmark_convolution(datasets["signal"]),
+        "streaming resample": lambda: benchmark_streaming_resample(datasets["signal"]),
+        "plot": lambda: benchmark_plot(datasets["signal"]),
+        "live ingestion": lambda: benchmark_live_ingestion(scale["live"]),
+        "render volume": lambda: benchmark_render(datasets["volume"], directory),
+        "render mesh": lambda: benchmark_render(datasets["stl"], directory),
+    }
+    if "xlsx" in datasets:
+        benchmarks["load xlsx"] = lambda: benchmark_load(datasets["xlsx"])
+    return benchmarks
+
+
+def time_benchmark(setup: Callable[[], Callable[[], None]], repeats: int) -> Dict[str, Union[List[float], str]]:
+    """
+    times a benchmark. It runs once before the measurements, so caches and lazy imports do not count.
+    :param setup: the function that sets up the benchmark and returns the function to time
+    :param repeats: the number of measurements
+    :return: the durations in seconds, or the error if the benchmark could not run here
+    """
+    try:
+        run = setup()
+        run()
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        return {"times": times}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def get_metadata() -> Dict[str, str]:
+    """
+    :return: the commit, the time and the machine of the run
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {"commit": commit, "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(),
+            "cpus": str(os.cpu_count())}
+
+
+def run_benchmarks(scales: List[str], repeats: int, only: List[str] = None) -> dict:
+    """
+    generates the datasets and runs the benchmarks for every scale.
+    :param scales: the names of the scales, see SCALES
+    :param repeats: the number of measurements per benchmark
+    :param only: the names of the benchmarks to run, None for all of them
+    :return: the metadata of the run and the results per benchmark, keyed by "benchmark/scale"
+    """
+    results = {}
+    for scale_name in scales:
+        with tempfile.TemporaryDirectory(prefix=f"benchmark_{scale_name}_") as directory:
+            print(f"generating the {scale_name} datasets", file=sys.stderr)
+            datasets = generate_datasets(directory, SCALES[scale_name])
+            for name, setup in get_benchmarks(datasets, SCALES[scale_name], directory).items():
+                if only and name not in only:
+                    continue
+                result = time_benchmark(setup, repeats)
+                results[f"{name}/{scale_name}"] = result
+                summary = f"{1000 * np.mean(result['times']):10.1f} ms" if "times" in result else result["error"]
+                print(f"{name + '/' + scale_name:<30} {summary}", file=sys.stderr)
+    return {"metadata": get_metadata(), "results": results}
+
+
+###############################################################################################################
+# comparison
+###############################################################################################################
+
+def compare_results(baseline: dict, current: dict, alpha: float = 0.05, threshold: float = 0.05) -> List[dict]:
+    """
+    compares two runs with Welch's t-test per benchmark. A change counts when it is significant and larger than the
+    threshold, so small but consistent differences in noise do not show up as regressions.
+    :param baseline: the results of the old run
+    :param current: the results of the new run
+    :param alpha: the significance level
+    :param threshold: the smallest relative change that counts
+    :return: per benchmark that ran in both runs: the means in milliseconds, the relative change, the p-value and
+    the verdict, which is "slower", "faster" or "unchanged"
+    """
+    from scipy.stats import ttest_ind
+
+    comparison = []
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name, {}).get("times")
+        new = result.get("times")
+        if not old or not new:
+            continue
+        change = np.mean(new) / np.mean(old) - 1
+        p_value = ttest_ind(old, new, equal_var=False).pvalue if len(old) > 1 and len(new) > 1 else 1.0
+        if np.isnan(p_value):    # identical measurements
+            p_value = 1.0
+        verdict = "unchanged"
+        if p_value < alpha and abs(change) > threshold:
+            verdict = "slower" if change > 0 else "faster"
+        comparison.append({"benchmark": name, "baseline (ms)": 1000 * np.mean(old), "current (ms)": 1000 * np.mean(new),
+                           "change": change, "p-value": p_value, "verdict": verdict})
+    return comparison
+
+
+def format_comparison(comparison: List[dict]) -> str:
+    """
+    :param comparison: the result of compare_results
+    :return: the comparison as a table
+    """
+    width = max([len(row["benchmark"]) for row in comparison] + [len("benchmark")])
+    lines = [f"{'benchmark':<{width}}  {'baseline (ms)':>13}  {'current (ms)':>12}  {'change':>8}  {'p':>6}  verdict"]
+    for row in comparison:
+        lines.append(f"{row['benchmark']:<{width}}  {row['baseline (ms)']:13.1f}  {row['current (ms)']:12.1f}  "
+                     f"{row['change']:+8.1%}  {row['p-value']:6.3f}  {row['verdict']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmarks for loading, processing, live ingestion and rendering")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and write the results as JSON")
+    run_parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    run_parser.add_argument("--repeats", type=int, default=5)
+    run_parser.add_argument("--only", nargs="+", help="the names of the benchmarks to run, such as 'load csv'")
+    run_parser.add_argument("--output", help="the JSON file, by default benchmark_<commit>.json")
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--alpha", type=float, default=0.05)
+    compare_parser.add_argument("--threshold", type=float, default=0.05)
+    arguments = parser.parse_args()
+
+    if arguments.command == "run":
+        run = run_benchmarks(arguments.scales, arguments.repeats, arguments.only)
+        output = arguments.output or f"benchmark_{run['metadata']['commit'][:10]}.json"
+        with open(output, "w") as f:
+            json.dump(run, f, indent=4)
+        print(output)
+    else:
+        with open(arguments.baseline) as f:
+            baseline_run = json.load(f)
+        with open(arguments.current) as f:
+            current_run = json.load(f)
+        rows = compare_results(baseline_run, current_run, arguments.alpha, arguments.threshold)
+        print(format_comparison(rows))
+        # a non-zero exit code lets a CI job fail on regressions
+        sys.exit(1 if any(row["verdict"] == "slower" for row in rows) else 0)
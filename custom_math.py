@@ -1,14 +1,19 @@
-from typing import Union
+from collections import deque
+from fractions import Fraction
+from functools import lru_cache
+from typing import Union, Dict, Tuple, Iterator, List
 
 import numpy as np
 import pandas as pd
-from scipy.signal import butter, filtfilt
+from scipy import fft as sp_fft
+from scipy.ndimage import maximum_filter1d, minimum_filter1d, uniform_filter1d
+from scipy.signal import butter, filtfilt, get_window, sosfilt, sosfiltfilt, find_peaks, firwin, resample_poly
 from pandas import DataFrame
 
-from GUI.popups import ErrorDialog
-from GUI.settings import PlotSettingsDialog
+from profiler import profiled
 
 
+@profiled("custom_math.convolve_data", "math")
 def convolve_data(vector1: np.ndarray, vector2: np.ndarray) -> Union[DataFrame, None]:
     """
     Computes the convolution of two one-dimensional vectors with each other.
@@ -18,6 +23,7 @@ def convolve_data(vector1: np.ndarray, vector2: np.ndarray) -> Union[DataFrame,
     """
     # Ensure that the input vectors are one-dimensional numpy arrays
     if vector1.ndim != 1 or vector2.ndim != 1:
+        from GUI.popups import ErrorDialog     # the dialogs are imported when needed, so workers do not load Qt
         ErrorDialog("Both input vectors must be one-dimensional arrays.")
         return
 
@@ -33,19 +39,19 @@ def convolve_data(vector1: np.ndarray, vector2: np.ndarray) -> Union[DataFrame,
     return convolved_df
 
 
-def limit_data(data: DataFrame, min_value: float, max_value: float) -> DataFrame:
+@profiled("custom_math.limit_data", "math")
+def limit_data(data: DataFrame, min_value: float, max_value: float) -> Dict:
     """
-    limits a dataset by a minimal and maximal value.
+    limits a dataset by a minimal and maximal value. The DataFrame itself is not changed.
     :param data: A pandas DataFrame containing the data to be limited
     :param min_value:
     :param max_value:
-    :return: the new DataFrame with the limited y values
+    :return: a dictionary with the label of the selected column as key and the limited values as value
     """
     col = fetch_column_from_user(data)
     y_data = df_column_to_numpy(data, col)
     limited_vector = np.clip(y_data, min_value, max_value)
-    data.iloc[:, col] = limited_vector
-    return data
+    return {data.columns[col]: limited_vector}
 
 
 def butter_filter(data: np.ndarray, filter_type: str, cutoff: Union[list, tuple, float], fs: float,
@@ -66,23 +72,23 @@ def butter_filter(data: np.ndarray, filter_type: str, cutoff: Union[list, tuple,
     return y
 
 
+@profiled("custom_math.filter_data", "math")
 def filter_data(data: pd.DataFrame, filter_type: str, cutoff: Union[list, tuple, float], fs: float,
-                order: int = 5) -> pd.DataFrame:
+                order: int = 5) -> Dict:
     """
-    filter the data using the provided settings
+    filter the data using the provided settings. The DataFrame itself is not changed.
     :param data: The DataFrame
     :param filter_type: the filter type, for example: low-pass, band-pass, etc.
     :param cutoff: the cutoff of the filter
     :param fs: the sampling frequency of the data
     :param order: the order of the filter, 5 by default
-    :return: the new data frame with the filter applied to the y data
+    :return: a dictionary with the label of the selected column as key and the filtered values as value
     """
     col = fetch_column_from_user(data)
     y_data = df_column_to_numpy(data, col)
 
     filtered_vector = butter_filter(y_data, filter_type, cutoff, fs, order)
-    data.iloc[:, col] = filtered_vector
-    return data
+    return {data.columns[col]: filtered_vector}
 
 
 def df_column_to_numpy(df: DataFrame, column_index: int) -> np.ndarray:
@@ -104,8 +110,891 @@ def fetch_column_from_user(data) -> int:
     if column_count < 2:
         selected_col = -1
     if column_count > 2:
+        from GUI.settings import PlotSettingsDialog
         dialog = PlotSettingsDialog(plot_labels[1:])
         result = dialog.exec()
         if result == dialog.Accepted:
             selected_col = data.columns.get_loc(dialog.get_selected_option())
     return selected_col
+
+
+###############################################################################################################
+# spectral analysis
+###############################################################################################################
+
+# frequency bands that are used for the band power when no other bands are provided
+DEFAULT_BANDS: Dict[str, Tuple[float, float]] = {
+    "delta": (0.5, 4.0),
+    "theta": (4.0, 8.0),
+    "alpha": (8.0, 13.0),
+    "beta": (13.0, 30.0),
+    "gamma": (30.0, 100.0),
+}
+
+# windows are reused between calls, keyed by (window name, segment length)
+_window_cache: Dict[Tuple[str, int], np.ndarray] = {}
+
+
+def get_cached_window(window: str, nperseg: int) -> np.ndarray:
+    """
+    Returns a float32 window of the given type and length. The window is only computed the first time it is requested.
+    The FFT plans themselves are cached by scipy.fft, so reusing the same segment length reuses the same plan.
+    :param window: the name of the window, for example: hann, hamming, etc.
+    :param nperseg: the length of the window in samples
+    :return: the window as a float32 numpy array
+    """
+    key = (window, nperseg)
+    cached = _window_cache.get(key)
+    if cached is None:
+        cached = get_window(window, nperseg).astype(np.float32)
+        _window_cache[key] = cached
+    return cached
+
+
+def to_float32_block(data: np.ndarray) -> np.ndarray:
+    """
+    Converts data to a contiguous float32 block with samples on the first axis and channels on the second axis.
+    NaN values are replaced by zeros so a single missing sample does not spoil a whole segment.
+    :param data: a one- or two-dimensional array
+    :return: a two-dimensional float32 array of shape (samples, channels)
+    """
+    # nan_to_num copies, so read-only columns from the data history are never written to
+    block = np.nan_to_num(np.asarray(data, dtype=np.float32))
+    if block.ndim == 1:
+        block = block[:, np.newaxis]
+    return np.ascontiguousarray(block)
+
+
+def _segment_step(nperseg: int, overlap: float) -> int:
+    """
+    computes the hop size between two segments.
+    :param nperseg: the length of a segment
+    :param overlap: the fraction of overlap between two segments, between 0 and 1
+    :return: the hop size in samples, at least 1
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError("overlap must be between 0 and 1")
+    return max(1, int(round(nperseg * (1 - overlap))))
+
+
+def spectrogram_chunks(data: np.ndarray, fs: float, nperseg: int = 256, overlap: float = 0.5,
+                       window: str = "hann", chunk_frames: int = 1024) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Computes the power spectral density of sliding segments chunk by chunk, so the memory used per step stays bounded
+    on hour-long recordings. All channels are transformed at once.
+    :param data: the data, either one-dimensional or of shape (samples, channels)
+    :param fs: the sampling frequency of the data
+    :param nperseg: the length of each segment
+    :param overlap: the fraction of overlap between two segments
+    :param window: the window that is applied to each segment
+    :param chunk_frames: the amount of segments that are transformed at once
+    :return: a generator that yields the segment centre times and a float32 array of shape (frames, freqs, channels)
+    """
+    block = to_float32_block(data)
+    n_samples = block.shape[0]
+    if n_samples < nperseg:
+        raise ValueError(f"the data has {n_samples} samples, which is less than the segment length of {nperseg}")
+    step = _segment_step(nperseg, overlap)
+    win = get_cached_window(window, nperseg)
+    # one-sided density scaling, the DC and nyquist bins only occur once in the full spectrum
+    scale = np.float32(1.0 / (fs * np.sum(win.astype(np.float64) ** 2)))
+    one_sided = np.full(nperseg // 2 + 1, 2.0, dtype=np.float32)
+    one_sided[0] = 1.0
+    if nperseg % 2 == 0:
+        one_sided[-1] = 1.0
+    one_sided *= scale
+
+    # zero-copy view of all segments: shape (frames, channels, nperseg)
+    frames = np.lib.stride_tricks.sliding_window_view(block, nperseg, axis=0)[::step]
+    n_frames = frames.shape[0]
+    for start in range(0, n_frames, chunk_frames):
+        chunk = frames[start:start + chunk_frames]
+        # remove the mean of every segment before windowing
+        segments = (chunk - chunk.mean(axis=-1, keepdims=True)) * win
+        spectrum = sp_fft.rfft(segments, axis=-1, workers=-1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2) * one_sided
+        times = (np.arange(start, start + chunk.shape[0]) * step + nperseg / 2) / fs
+        yield times, np.transpose(power, (0, 2, 1)).astype(np.float32, copy=False)
+
+
+def stft_spectrogram(data: np.ndarray, fs: float, nperseg: int = 256, overlap: float = 0.5, window: str = "hann",
+                     chunk_frames: int = 1024) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes a spectrogram of one or more channels.
+    :param data: the data, either one-dimensional or of shape (samples, channels)
+    :param fs: the sampling frequency of the data
+    :param nperseg: the length of each segment
+    :param overlap: the fraction of overlap between two segments
+    :param window: the window that is applied to each segment
+    :param chunk_frames: the amount of segments that are transformed at once
+    :return: the segment times, the frequencies and the power of shape (frames, freqs, channels)
+    """
+    freqs = sp_fft.rfftfreq(nperseg, 1 / fs)
+    times, powers = [], []
+    for chunk_times, chunk_power in spectrogram_chunks(data, fs, nperseg, overlap, window, chunk_frames):
+        times.append(chunk_times)
+        powers.append(chunk_power)
+    return np.concatenate(times), freqs, np.concatenate(powers, axis=0)
+
+
+def welch_psd(data: np.ndarray, fs: float, nperseg: int = 256, overlap: float = 0.5, window: str = "hann",
+              chunk_frames: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimates the power spectral density with welch's method by averaging the spectra of overlapping segments.
+    :param data: the data, either one-dimensional or of shape (samples, channels)
+    :param fs: the sampling frequency of the data
+    :param nperseg: the length of each segment
+    :param overlap: the fraction of overlap between two segments
+    :param window: the window that is applied to each segment
+    :param chunk_frames: the amount of segments that are transformed at once
+    :return: the frequencies and the power spectral density of shape (freqs, channels)
+    """
+    freqs = sp_fft.rfftfreq(nperseg, 1 / fs)
+    total = None
+    n_frames = 0
+    for _, chunk_power in spectrogram_chunks(data, fs, nperseg, overlap, window, chunk_frames):
+        # accumulate in float64 so long recordings do not lose precision
+        chunk_sum = chunk_power.sum(axis=0, dtype=np.float64)
+        total = chunk_sum if total is None else total + chunk_sum
+        n_frames += chunk_power.shape[0]
+    return freqs, (total / n_frames).astype(np.float32)
+
+
+def band_power(data: np.ndarray, fs: float, bands: Dict[str, Tuple[float, float]] = None, nperseg: int = 256,
+               overlap: float = 0.5, window: str = "hann",
+               chunk_frames: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the power inside frequency bands over time.
+    :param data: the data, either one-dimensional or of shape (samples, channels)
+    :param fs: the sampling frequency of the data
+    :param bands: a dictionary with the band name as key and (low, high) frequencies as value, DEFAULT_BANDS by default
+    :param nperseg: the length of each segment
+    :param overlap: the fraction of overlap between two segments
+    :param window: the window that is applied to each segment
+    :param chunk_frames: the amount of segments that are transformed at once
+    :return: the segment times and the band power of shape (frames, bands, channels)
+    """
+    if bands is None:
+        bands = DEFAULT_BANDS
+    freqs = sp_fft.rfftfreq(nperseg, 1 / fs)
+    df = freqs[1] - freqs[0]
+    # a (bands, freqs) matrix that sums the bins of each band in one matrix product
+    band_matrix = np.zeros((len(bands), len(freqs)), dtype=np.float32)
+    for i, (low, high) in enumerate(bands.values()):
+        band_matrix[i, (freqs >= low) & (freqs < high)] = df
+    times, powers = [], []
+    for chunk_times, chunk_power in spectrogram_chunks(data, fs, nperseg, overlap, window, chunk_frames):
+        times.append(chunk_times)
+        powers.append(np.einsum("bf,tfc->tbc", band_matrix, chunk_power))
+    return np.concatenate(times), np.concatenate(powers, axis=0)
+
+
+def numeric_y_columns(data: DataFrame) -> list:
+    """
+    Returns the labels of all columns after the x column that contain numeric data.
+    :param data: the DataFrame
+    :return: a list of column labels
+    """
+    y_data = data.iloc[:, 1:]
+    return [label for label in y_data.columns
+            if pd.api.types.is_numeric_dtype(y_data[label]) and y_data[label].notna().any()]
+
+
+@profiled("custom_math.psd_data", "math")
+def psd_data(data: DataFrame, fs: float, nperseg: int = 256, overlap: float = 0.5) -> DataFrame:
+    """
+    Computes the power spectral density of every numeric y column of a DataFrame.
+    :param data: the DataFrame, of which the first column holds the x values
+    :param fs: the sampling frequency of the data
+    :param nperseg: the length of each segment
+    :param overlap: the fraction of overlap between two segments
+    :return: a DataFrame with the frequency as first column and the density of each channel in the other columns
+    """
+    columns = numeric_y_columns(data)
+    freqs, psd = welch_psd(data[columns].values, fs, nperseg, overlap)
+    result = pd.DataFrame(psd, columns=columns)
+    result.insert(0, "frequency", freqs)
+    return result
+
+
+@profiled("custom_math.band_power_data", "math")
+def band_power_data(data: DataFrame, fs: float, bands: Dict[str, Tuple[float, float]] = None, nperseg: int = 256,
+                    overlap: float = 0.5) -> DataFrame:
+    """
+    Computes the band power over time of every numeric y column of a DataFrame.
+    :param data: the DataFrame, of which the first column holds the x values
+    :param fs: the sampling frequency of the data
+    :param bands: a dictionary with the band name as key and (low, high) frequencies as value
+    :param nperseg: the length of each segment
+    :param overlap: the fraction of overlap between two segments
+    :return: a DataFrame with the time as first column and a column for each combination of channel and band
+    """
+    if bands is None:
+        bands = DEFAULT_BANDS
+    columns = numeric_y_columns(data)
+    times, powers = band_power(data[columns].values, fs, bands, nperseg, overlap)
+    n_frames = powers.shape[0]
+    # channels vary slowest so the columns of one channel stay together
+    flat = np.transpose(powers, (0, 2, 1)).reshape(n_frames, -1)
+    labels = [f"{column} {band}" for column in columns for band in bands]
+    result = pd.DataFrame(flat, columns=labels)
+    result.insert(0, "time", times)
+    return result
+
+
+@profiled("custom_math.spectrogram_data", "math")
+def spectrogram_data(data: DataFrame, fs: float, nperseg: int = 256, overlap: float = 0.5) -> DataFrame:
+    """
+    Computes the spectrogram of a column that is selected by the user.
+    :param data: the DataFrame, of which the first column holds the x values
+    :param fs: the sampling frequency of the data
+    :param nperseg: the length of each segment
+    :param overlap: the fraction of overlap between two segments
+    :return: a DataFrame with the time as first column and a column with the power of every frequency bin
+    """
+    col = fetch_column_from_user(data)
+    times, freqs, power = stft_spectrogram(df_column_to_numpy(data, col), fs, nperseg, overlap)
+    result = pd.DataFrame(power[:, :, 0], columns=[f"{f:.2f} Hz" for f in freqs])
+    result.insert(0, "time", times)
+    return result
+
+
+###############################################################################################################
+# event detection
+###############################################################################################################
+
+# suffixes of the columns that are added by the event detection
+EVENT_COLUMN_SUFFIX = " R-peaks"
+HEART_RATE_COLUMN_SUFFIX = " heart rate"
+
+
+@lru_cache(maxsize=16)
+def design_band_pass(fs: float, low: float, high: float, order: int = 2) -> np.ndarray:
+    """
+    Designs a butterworth band-pass filter in second order sections. Designs are cached per set of parameters.
+    :param fs: the sampling frequency of the data
+    :param low: the lower cutoff frequency
+    :param high: the upper cutoff frequency, clipped to just below the nyquist frequency
+    :param order: the order of the filter
+    :return: the second order sections of the filter
+    """
+    high = min(high, 0.45 * fs)
+    return butter(order, (low, high), btype="band", fs=fs, output="sos")
+
+
+def _refine_peaks(peaks: np.ndarray, signal: np.ndarray, search: int) -> np.ndarray:
+    """
+    moves each peak to the largest absolute value of the signal within the search window before it, since the moving
+    window integration delays the peak.
+    :param peaks: the indices of the detected peaks
+    :param signal: the band-passed signal of one channel
+    :param search: the amount of samples to search back
+    :return: the sorted, unique indices of the refined peaks
+    """
+    if peaks.size == 0:
+        return peaks
+    windows = np.clip(peaks[:, np.newaxis] + np.arange(-search, 1), 0, len(signal) - 1)
+    offsets = np.abs(signal[windows]).argmax(axis=1)
+    return np.unique(windows[np.arange(len(peaks)), offsets])
+
+
+def detect_r_peaks(data: np.ndarray, fs: float, band: Tuple[float, float] = (5.0, 15.0),
+                   integration_window: float = 0.15, refractory: float = 0.2, threshold_window: float = 2.0,
+                   threshold_ratio: float = 0.3) -> List[np.ndarray]:
+    """
+    Detects R-peaks in one or more ECG channels. The channels are band-passed, differentiated, squared and integrated
+    together, after which the peaks are picked against a threshold that adapts to the local signal level.
+    :param data: the data, either one-dimensional or of shape (samples, channels)
+    :param fs: the sampling frequency of the data
+    :param band: the pass band that keeps the QRS complex, (5, 15) Hz by default
+    :param integration_window: the length of the moving window integration in seconds
+    :param refractory: the minimal time between two beats in seconds
+    :param threshold_window: the length of the window over which the threshold adapts in seconds
+    :param threshold_ratio: the fraction of the local maximum that a peak should exceed
+    :return: a list with an array of peak indices for every channel
+    """
+    block = to_float32_block(data).astype(np.float64)
+    filtered = sosfiltfilt(design_band_pass(fs, *band), block, axis=0)
+    derivative = np.diff(filtered, axis=0, prepend=filtered[:1])
+    integrated = uniform_filter1d(derivative ** 2, size=max(1, int(integration_window * fs)), axis=0)
+    # the threshold follows the local maximum, but never drops below the mean so flat parts do not produce beats
+    local_max = maximum_filter1d(integrated, size=max(1, int(threshold_window * fs)), axis=0)
+    threshold = np.maximum(threshold_ratio * local_max, integrated.mean(axis=0))
+    distance = max(1, int(refractory * fs))
+    search = max(1, int(integration_window * fs))
+
+    peaks = []
+    for channel in range(block.shape[1]):
+        channel_peaks, _ = find_peaks(integrated[:, channel], height=threshold[:, channel], distance=distance)
+        peaks.append(_refine_peaks(channel_peaks, filtered[:, channel], search))
+    return peaks
+
+
+def heart_rate_from_peaks(peaks: np.ndarray, n_samples: int, fs: float) -> np.ndarray:
+    """
+    Computes the heart rate at every sample from the interval to the previous beat.
+    :param peaks: the sorted indices of the beats
+    :param n_samples: the amount of samples in the signal
+    :param fs: the sampling frequency of the data
+    :return: the heart rate in beats per minute, NaN before the second beat
+    """
+    heart_rate = np.full(n_samples, np.nan)
+    if len(peaks) < 2:
+        return heart_rate
+    rates = 60.0 * fs / np.diff(peaks)
+    # every sample takes the rate of the last interval that ended at or before it
+    interval = np.searchsorted(peaks[1:], np.arange(n_samples), side="right") - 1
+    valid = interval >= 0
+    heart_rate[valid] = rates[interval[valid]]
+    return heart_rate
+
+
+@profiled("custom_math.detect_events_data", "math")
+def detect_events_data(data: DataFrame, fs: float) -> Dict:
+    """
+    Detects R-peaks in all numeric y columns and computes the event markers and heart rate as new columns. If the
+    DataFrame has an empty Events column, it is filled with the beats of the first channel. The DataFrame itself is not
+    changed.
+    :param data: the DataFrame, of which the first column holds the x values
+    :param fs: the sampling frequency of the data
+    :return: a dictionary with the labels of the new columns as key and their values as value
+    """
+    columns = [column for column in numeric_y_columns(data)
+               if not str(column).endswith((EVENT_COLUMN_SUFFIX, HEART_RATE_COLUMN_SUFFIX))]
+    if not columns:
+        raise ValueError("no numeric columns to detect events in")
+    peaks = detect_r_peaks(data[columns].values, fs)
+    n_samples = len(data)
+    new_columns = {}
+    for column, channel_peaks in zip(columns, peaks):
+        markers = np.zeros(n_samples, dtype=np.int8)
+        markers[channel_peaks] = 1
+        new_columns[f"{column}{EVENT_COLUMN_SUFFIX}"] = markers
+        new_columns[f"{column}{HEART_RATE_COLUMN_SUFFIX}"] = heart_rate_from_peaks(channel_peaks, n_samples, fs)
+    if "Events" in data.columns and data["Events"].isna().all():
+        events = np.full(n_samples, None, dtype=object)
+        events[peaks[0]] = "R"
+        new_columns["Events"] = events
+    return new_columns
+
+
+class StreamingPeakDetector:
+    """
+    Detects R-peaks incrementally in a live signal. The filter, integration and threshold state is carried between
+    batches, so each batch only costs work proportional to its own length.
+    """
+    def __init__(self, fs: float, band: Tuple[float, float] = (5.0, 15.0), integration_window: float = 0.15,
+                 refractory: float = 0.2, learning_time: float = 2.0, rr_history: int = 8):
+        """
+        constructor for the streaming peak detector
+        :param fs: the sampling frequency of the live data
+        :param band: the pass band that keeps the QRS complex
+        :param integration_window: the length of the moving window integration in seconds
+        :param refractory: the minimal time between two beats in seconds
+        :param learning_time: the time in seconds that is used to initialise the threshold
+        :param rr_history: the amount of beat intervals that the heart rate is computed over
+        """
+        self.fs = fs
+        self.sos = design_band_pass(fs, *band)
+        self.zi = np.zeros((self.sos.shape[0], 2))
+        self.window_size = max(1, int(integration_window * fs))
+        self.refractory = max(1, int(refractory * fs))
+        self.learning_samples = int(learning_time * fs)
+        self.previous_filtered = 0.0
+        # the last squared samples, needed to continue the moving window integration over batch boundaries
+        self.squared_tail = np.zeros(self.window_size - 1)
+        # the last two integrated samples, needed to find local maxima on batch boundaries
+        self.integrated_tail = np.zeros(0)
+        self.samples_seen = 0
+        self.signal_level = 0.0
+        self.noise_level = 0.0
+        self.last_peak = None
+        self.intervals = deque(maxlen=rr_history)
+        self.heart_rate: Union[float, None] = None
+
+    @profiled("StreamingPeakDetector.process", "math")
+    def process(self, batch: np.ndarray) -> np.ndarray:
+        """
+        processes a batch of samples and updates the heart rate.
+        :param batch: the new samples
+        :return: the absolute sample indices of the beats that were detected in this batch
+        """
+        batch = np.nan_to_num(np.asarray(batch, dtype=np.float64).ravel())
+        if batch.size == 0:
+            return np.empty(0, dtype=np.int64)
+        filtered, self.zi = sosfilt(self.sos, batch, zi=self.zi)
+        derivative = np.diff(filtered, prepend=self.previous_filtered)
+        self.previous_filtered = filtered[-1]
+        squared = np.concatenate((self.squared_tail, derivative ** 2))
+        cumulative = np.concatenate(([0.0], np.cumsum(squared)))
+        integrated = (cumulative[self.window_size:] - cumulative[:-self.window_size]) / self.window_size
+        self.squared_tail = squared[len(squared) - (self.window_size - 1):]
+
+        start = self.samples_seen - len(self.integrated_tail)
+        self.samples_seen += batch.size
+        extended = np.concatenate((self.integrated_tail, integrated))
+        self.integrated_tail = extended[-2:]
+
+        if self.samples_seen <= self.learning_samples:
+            self.signal_level = max(self.signal_level, 0.25 * extended.max())
+            self.noise_level = 0.5 * extended.mean() if self.noise_level == 0 else \
+                0.5 * (self.noise_level + 0.5 * extended.mean())
+            return np.empty(0, dtype=np.int64)
+
+        # local maxima, the last sample is left for the next batch since its right neighbour is still unknown
+        middle = extended[1:-1]
+        candidates = np.flatnonzero((middle > extended[:-2]) & (middle >= extended[2:])) + 1
+        candidates = candidates[extended[candidates] > self.noise_level]
+        beats = []
+        for index in candidates:
+            value = extended[index]
+            position = start + index
+            # maxima inside the refractory period belong to the previous beat
+            if self.last_peak is not None and position - self.last_peak < self.refractory:
+                continue
+            threshold = self.noise_level + 0.25 * (self.signal_level - self.noise_level)
+            if value > threshold:
+                self.signal_level = 0.125 * value + 0.875 * self.signal_level
+                if self.last_peak is not None:
+                    self.intervals.append(position - self.last_peak)
+                self.last_peak = position
+                beats.append(position)
+            else:
+                self.noise_level = 0.125 * value + 0.875 * self.noise_level
+        if self.intervals:
+            self.heart_rate = 60.0 * self.fs / float(np.median(self.intervals))
+        return np.asarray(beats, dtype=np.int64)
+
+
+###############################################################################################################
+# resampling
+###############################################################################################################
+
+def x_to_seconds(x: np.ndarray) -> np.ndarray:
+    """
+    Converts an x column to seconds. Numeric columns are used as is, text columns such as 0:00:30.003 are parsed as a
+    duration.
+    :param x: the values of the x column
+    :return: the x values in seconds as a float64 array
+    """
+    if np.issubdtype(np.asarray(x).dtype, np.number):
+        return np.asarray(x, dtype=np.float64)
+    try:
+        return pd.to_timedelta(pd.Series(x)).dt.total_seconds().to_numpy()
+    except (ValueError, TypeError):
+        raise ValueError("the x column does not contain numbers or times")
+
+
+def estimate_sampling_rate(x: np.ndarray) -> float:
+    """
+    Estimates the sampling rate from the x column, using the median interval so a few gaps do not matter.
+    :param x: the values of the x column
+    :return: the sampling rate in samples per second
+    """
+    intervals = np.diff(x_to_seconds(x))
+    intervals = intervals[intervals > 0]
+    if intervals.size == 0:
+        raise ValueError("the x column does not increase, so no sampling rate can be estimated")
+    return float(1.0 / np.median(intervals))
+
+
+def is_uniformly_sampled(x: np.ndarray, tolerance: float = 0.01) -> bool:
+    """
+    checks whether the samples are evenly spaced.
+    :param x: the values of the x column
+    :param tolerance: the allowed deviation of an interval from the median interval, relative to the median interval
+    :return: True if all intervals are within the tolerance, else False
+    """
+    intervals = np.diff(x_to_seconds(x))
+    if intervals.size == 0:
+        return True
+    median = np.median(intervals)
+    return bool(median > 0 and np.all(np.abs(intervals - median) <= tolerance * median))
+
+
+def resampling_ratio(fs: float, target_fs: float, max_denominator: int = 1000) -> Tuple[int, int]:
+    """
+    approximates the ratio between two sampling rates as a fraction.
+    :param fs: the current sampling rate
+    :param target_fs: the new sampling rate
+    :param max_denominator: the largest down sampling factor that is allowed
+    :return: the up and down sampling factors
+    """
+    if fs <= 0 or target_fs <= 0:
+        raise ValueError("sampling rates must be positive")
+    ratio = Fraction(target_fs / fs).limit_denominator(max_denominator)
+    if ratio == 0:
+        raise ValueError(f"cannot resample from {fs} Hz to {target_fs} Hz")
+    return ratio.numerator, ratio.denominator
+
+
+@lru_cache(maxsize=16)
+def design_resampling_filter(up: int, down: int) -> np.ndarray:
+    """
+    Designs the anti-aliasing filter for polyphase resampling, the same filter scipy's resample_poly uses.
+    Designs are cached per ratio.
+    :param up: the up sampling factor
+    :param down: the down sampling factor
+    :return: the filter taps, scaled by the up sampling factor
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    taps = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up
+    taps.setflags(write=False)
+    return taps
+
+
+def resample_signal(data: np.ndarray, fs: float, target_fs: float) -> np.ndarray:
+    """
+    Resamples evenly spaced data to a new rate with a polyphase filter, which also removes the frequencies above the
+    new nyquist frequency. All channels are resampled at once.
+    :param data: the data, either one-dimensional or of shape (samples, channels)
+    :param fs: the current sampling rate
+    :param target_fs: the new sampling rate
+    :return: the resampled data as a float32 array of shape (samples, channels)
+    """
+    up, down = resampling_ratio(fs, target_fs)
+    block = to_float32_block(data)
+    if up == down:
+        return block
+    return resample_poly(block, up, down, axis=0, window=design_resampling_filter(up, down) / up)
+
+
+def resample_irregular(x: np.ndarray, data: np.ndarray, target_fs: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Resamples irregularly spaced data to an evenly spaced grid. The data is first interpolated at its median rate and
+    then resampled with the anti-aliasing filter, so down sampling does not alias.
+    :param x: the values of the x column
+    :param data: the data, either one-dimensional or of shape (samples, channels)
+    :param target_fs: the new sampling rate
+    :return: the new x values in seconds and the resampled data of shape (samples, channels)
+    """
+    seconds = x_to_seconds(x)
+    block = to_float32_block(data)
+    # sort the samples and drop duplicate timestamps
+    seconds, unique = np.unique(seconds, return_index=True)
+    block = block[unique]
+    native_fs = estimate_sampling_rate(seconds)
+    # interpolate on the native rate when down sampling, otherwise straight on the target rate
+    grid_fs = native_fs if target_fs < native_fs else target_fs
+    grid = seconds[0] + np.arange(int((seconds[-1] - seconds[0]) * grid_fs) + 1) / grid_fs
+    uniform = np.column_stack([np.interp(grid, seconds, block[:, channel]) for channel in range(block.shape[1])])
+    if grid_fs == target_fs:
+        return grid, uniform.astype(np.float32)
+    resampled = resample_signal(uniform, grid_fs, target_fs)
+    return seconds[0] + np.arange(resampled.shape[0]) / target_fs, resampled
+
+
+@profiled("custom_math.resample_data", "math")
+def resample_data(data: DataFrame, target_fs: float) -> DataFrame:
+    """
+    Resamples all numeric y columns of a DataFrame to a new rate. The rate of the data is estimated from the x column.
+    :param data: the DataFrame, of which the first column holds the x values
+    :param target_fs: the new sampling rate
+    :return: a new DataFrame with the time in seconds as first column and the resampled columns
+    """
+    columns = numeric_y_columns(data)
+    if not columns:
+        raise ValueError("no numeric columns to resample")
+    x = df_column_to_numpy(data, 0)
+    if is_uniformly_sampled(x):
+        seconds = x_to_seconds(x)
+        resampled = resample_signal(data[columns].values, estimate_sampling_rate(seconds), target_fs)
+        times = seconds[0] + np.arange(resampled.shape[0]) / target_fs
+    else:
+        times, resampled = resample_irregular(x, data[columns].values, target_fs)
+    result = pd.DataFrame(resampled, columns=columns)
+    result.insert(0, "time (s)", times)
+    return result
+
+
+class StreamingResampler:
+    """
+    Resamples a live signal batch by batch with the same polyphase filter as resample_signal. The last input samples
+    are kept between batches, so the output equals resampling the whole signal at once, delayed by the filter length.
+    """
+    def __init__(self, fs: float, target_fs: float, channels: int = 1):
+        """
+        constructor for the streaming resampler
+        :param fs: the sampling rate of the incoming data
+        :param target_fs: the new sampling rate
+        :param channels: the amount of channels in each batch
+        """
+        self.up, self.down = resampling_ratio(fs, target_fs)
+        taps = design_resampling_filter(self.up, self.down)
+        self.taps_per_phase = -(-len(taps) // self.up)
+        # the polyphase components, row p holds the taps that are used for output phase p, newest sample first
+        padded = np.zeros(self.taps_per_phase * self.up)
+        padded[:len(taps)] = taps
+        self.phases = padded.reshape(self.taps_per_phase, self.up).T.astype(np.float32)
+        self.history = np.zeros((self.taps_per_phase, channels), dtype=np.float32)
+        self.samples_seen = 0
+        self.next_output = 0
+
+    @profiled("StreamingResampler.process", "math")
+    def process(self, batch: np.ndarray) -> np.ndarray:
+        """
+        resamples a batch of samples.
+        :param batch: the new samples, either one-dimensional or of shape (samples, channels)
+        :return: the new output samples of shape (samples, channels), which may be empty for small batches
+        """
+        block = to_float32_block(batch)
+        buffer = np.concatenate((self.history, block))
+        buffer_start = self.samples_seen - len(self.history)
+        self.samples_seen += len(block)
+        # every output whose newest input sample has arrived can be computed: output m needs input
+        # (m * down) // up, which has arrived when m * down < samples_seen * up
+        last_output = (self.samples_seen * self.up - 1) // self.down
+        outputs = np.arange(self.next_output, last_output + 1)
+        self.history = buffer[len(buffer) - self.taps_per_phase:]
+        if outputs.size == 0:
+            return np.empty((0, block.shape[1]), dtype=np.float32)
+        self.next_output = last_output + 1
+        upsampled = outputs * self.down
+        newest = upsampled // self.up - buffer_start
+        # inputs before the start of the stream are zero, just like the zero history
+        indices = newest[:, np.newaxis] - np.arange(self.taps_per_phase)
+        valid = indices >= 0
+        gathered = buffer[np.where(valid, indices, 0)] * valid[:, :, np.newaxis]
+        return np.einsum("mk,mkc->mc", self.phases[upsampled % self.up], gathered)
+
+
+###############################################################################################################
+# rolling statistics
+###############################################################################################################
+
+ROLLING_STATISTICS = ("mean", "rms", "min", "max", "percentile")
+# the live statistics can also estimate a percentile over the whole stream instead of over the window
+STREAMING_STATISTICS = ROLLING_STATISTICS + ("stream-percentile",)
+
+
+def _rolling_sum(block: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    computes the sum over a trailing window with a cumulative sum, which costs O(1) per sample for any window length.
+    At the start of the data the window only holds the samples that are available.
+    :param block: the data of shape (samples, channels)
+    :param window: the length of the window in samples
+    :return: the windowed sums and the amount of samples in each window
+    """
+    # accumulate in float64 so the differences of large sums stay accurate
+    cumulative = np.cumsum(block, axis=0, dtype=np.float64)
+    sums = cumulative.copy()
+    sums[window:] -= cumulative[:-window]
+    counts = np.minimum(np.arange(1, block.shape[0] + 1), window)[:, np.newaxis]
+    return sums, counts
+
+
+def _rolling_percentile(block: np.ndarray, window: int, percentile: float, start: int = 0,
+                        chunk_values: int = 1 << 22) -> np.ndarray:
+    """
+    computes a percentile over a trailing window, interpolated like np.percentile. At the start of the data the window
+    only holds the samples that are available. The windows are sorted in chunks, so the memory used stays bounded.
+    :param block: the data of shape (samples, channels)
+    :param window: the length of the window in samples
+    :param percentile: the percentile between 0 and 100
+    :param start: the first sample of which the percentile is returned, the samples before it only fill the window
+    :param chunk_values: the amount of window values that are sorted at once
+    :return: the percentile at every sample from start on, of shape (samples - start, channels)
+    """
+    result = np.empty((block.shape[0] - start, block.shape[1]))
+    # the first samples have less than a full window before them
+    for i in range(start, min(window - 1, block.shape[0])):
+        result[i - start] = np.percentile(block[:i + 1], percentile, axis=0)
+    first_full = max(start, window - 1)
+    if first_full < block.shape[0]:
+        windows = np.lib.stride_tricks.sliding_window_view(block, window, axis=0)[first_full - window + 1:]
+        rows = max(1, chunk_values // (window * block.shape[1]))
+        for row in range(0, windows.shape[0], rows):
+            result[first_full - start + row:first_full - start + row + rows] = \
+                np.percentile(windows[row:row + rows], percentile, axis=-1)
+    return result
+
+
+def rolling_statistic(data: np.ndarray, window: int, statistic: str, percentile: float = 50.0) -> np.ndarray:
+    """
+    Computes a statistic over a trailing window for all channels at once. The mean and rms use cumulative sums and the
+    minimum and maximum use running filters, so their cost per sample does not grow with the window. The percentile
+    sorts the whole window at every sample and interpolates like np.percentile, so its cost per sample grows with the
+    window. At the start of the data every statistic only uses the samples that are available.
+    :param data: the data, either one-dimensional or of shape (samples, channels)
+    :param window: the length of the window in samples
+    :param statistic: one of ROLLING_STATISTICS
+    :param percentile: the percentile between 0 and 100, only used for the percentile statistic
+    :return: the statistic at every sample as a float32 array of shape (samples, channels)
+    """
+    if window < 1:
+        raise ValueError("the window should hold at least one sample")
+    block = to_float32_block(data)
+    # the origin moves the running filters from a centred window to a window that ends at the current sample
+    origin = (window - 1) // 2
+    if statistic == "mean":
+        sums, counts = _rolling_sum(block, window)
+        result = sums / counts
+    elif statistic == "rms":
+        sums, counts = _rolling_sum(np.square(block), window)
+        result = np.sqrt(np.maximum(sums / counts, 0))
+    elif statistic == "min":
+        result = minimum_filter1d(block, window, axis=0, origin=origin, mode="nearest")
+    elif statistic == "max":
+        result = maximum_filter1d(block, window, axis=0, origin=origin, mode="nearest")
+    elif statistic == "percentile":
+        result = _rolling_percentile(block, window, percentile)
+    else:
+        raise ValueError(f"unknown statistic: {statistic}")
+    return result.astype(np.float32, copy=False)
+
+
+@profiled("custom_math.rolling_statistics_data", "math")
+def rolling_statistics_data(data: DataFrame, window: float, fs: float, statistic: str,
+                            percentile: float = 50.0) -> DataFrame:
+    """
+    Computes a rolling statistic of every numeric y column of a DataFrame.
+    :param data: the DataFrame, of which the first column holds the x values
+    :param window: the length of the window in seconds
+    :param fs: the sampling frequency of the data
+    :param statistic: one of ROLLING_STATISTICS
+    :param percentile: the percentile between 0 and 100, only used for the percentile statistic
+    :return: a DataFrame with the original x column and a column with the statistic for every channel
+    """
+    columns = numeric_y_columns(data)
+    if not columns:
+        raise ValueError("no numeric columns to compute statistics of")
+    result = rolling_statistic(data[columns].values, max(1, int(round(window * fs))), statistic, percentile)
+    name = f"p{percentile:g}" if statistic == "percentile" else statistic
+    result = pd.DataFrame(result, columns=[f"{column} {name}" for column in columns])
+    result.insert(0, data.columns[0], df_column_to_numpy(data, 0))
+    return result
+
+
+class P2Quantile:
+    """
+    Estimates a quantile of a stream with the P-squared algorithm, which keeps five markers instead of the samples.
+    """
+    def __init__(self, quantile: float):
+        """
+        constructor for the quantile estimator
+        :param quantile: the quantile between 0 and 1
+        """
+        self.quantile = quantile
+        self.heights: List[float] = []
+        self.positions = np.arange(1, 6, dtype=np.float64)
+        self.desired = np.array([1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5])
+        self.increments = np.array([0, quantile / 2, quantile, (1 + quantile) / 2, 1])
+
+    def push(self, value: float) -> None:
+        """
+        adds a sample to the estimate.
+        :param value: the value of the sample
+        :return: None
+        """
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+        # find the cell of the new sample and move the outer markers if needed
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = next(i for i in range(4) if heights[i] <= value < heights[i + 1])
+        self.positions[cell + 1:] += 1
+        self.desired += self.increments
+        # adjust the three middle markers with a parabolic or linear prediction
+        for i in range(1, 4):
+            offset = self.desired[i] - self.positions[i]
+            if (offset >= 1 and self.positions[i + 1] - self.positions[i] > 1) or \
+                    (offset <= -1 and self.positions[i - 1] - self.positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not heights[i - 1] < candidate < heights[i + 1]:
+                    candidate = heights[i] + step * (heights[i + step] - heights[i]) / \
+                        (self.positions[i + step] - self.positions[i])
+                heights[i] = candidate
+                self.positions[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        """
+        predicts the new height of a marker with a piecewise parabolic formula.
+        :param i: the index of the marker
+        :param step: the direction in which the marker moves, 1 or -1
+        :return: the new height
+        """
+        h, n = self.heights, self.positions
+        return h[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (h[i + 1] - h[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - step) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self) -> Union[float, None]:
+        """
+        :return: the current estimate, or None if no samples were added yet
+        """
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            return float(np.quantile(self.heights, self.quantile))
+        return float(self.heights[2])
+
+
+class StreamingRollingStats:
+    """
+    Computes rolling statistics of a live signal batch by batch. The last samples of the window are kept, so every
+    batch is processed like the rolling statistics of a column: sums for the mean and rms, running filters for the
+    minimum and maximum and the sorted window for the percentile. The stream percentile is estimated over the whole
+    stream with a sketch instead, which runs per sample in Python.
+    """
+    def __init__(self, window: int, statistics: Tuple[str, ...] = ROLLING_STATISTICS, percentile: float = 50.0):
+        """
+        constructor for the streaming rolling statistics
+        :param window: the length of the window in samples
+        :param statistics: the statistics that are computed, from STREAMING_STATISTICS
+        :param percentile: the percentile between 0 and 100 of the percentile and stream percentile
+        """
+        unknown = [statistic for statistic in statistics if statistic not in STREAMING_STATISTICS]
+        if unknown:
+            raise ValueError(f"unknown statistic: {', '.join(unknown)}")
+        self.window = window
+        self.statistics = tuple(statistics)
+        self.percentile = percentile
+        self.tail = np.zeros(0)             # the last samples, to continue the window over batch boundaries
+        self.quantile = P2Quantile(percentile / 100) if "stream-percentile" in statistics else None
+        self.samples_seen = 0
+
+    @profiled("StreamingRollingStats.process", "math")
+    def process(self, batch: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        processes a batch of samples.
+        :param batch: the new samples
+        :return: a dictionary with the statistic name as key and the statistic at every new sample as value. The
+        stream percentile holds the single current estimate.
+        """
+        batch = np.nan_to_num(np.asarray(batch, dtype=np.float64).ravel())
+        start = len(self.tail)
+        extended = np.concatenate((self.tail, batch))[:, np.newaxis]
+        # at the start of the stream the window only holds the samples that were seen
+        counts = np.minimum(np.arange(self.samples_seen + 1, self.samples_seen + len(batch) + 1), self.window)
+        # the origin moves the running filters from a centred window to a window that ends at the current sample
+        origin = (self.window - 1) // 2
+        result = {}
+        for statistic in self.statistics:
+            if statistic == "mean":
+                result[statistic] = _rolling_sum(extended, self.window)[0][start:, 0] / counts
+            elif statistic == "rms":
+                squares = _rolling_sum(np.square(extended), self.window)[0][start:, 0]
+                result[statistic] = np.sqrt(np.maximum(squares / counts, 0))
+            elif statistic == "min":
+                result[statistic] = minimum_filter1d(extended[:, 0], self.window, origin=origin, mode="nearest")[start:]
+            elif statistic == "max":
+                result[statistic] = maximum_filter1d(extended[:, 0], self.window, origin=origin, mode="nearest")[start:]
+            elif statistic == "percentile":
+                result[statistic] = _rolling_percentile(extended, self.window, self.percentile, start)[:, 0]
+            else:
+                for value in batch:
+                    self.quantile.push(value)
+                result[statistic] = np.array([self.quantile.value()])
+        self.tail = extended[max(0, len(extended) - (self.window - 1)):, 0] if self.window > 1 else np.zeros(0)
+        self.samples_seen += len(batch)
+        return result
@@ -1,8 +1,19 @@
-from typing import Union, List
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import count
+from typing import Union, List, Dict, Hashable, Tuple, Callable
 import os
-import pandas as pd
-import vtk
-from GUI.popups import ErrorDialog
+import numpy as np
+from event_bus import event_bus, ErrorEvent
+from folder_watcher import FolderWatcher
+from profiler import profiled
+from startup import lazy_import
+# vtk and pandas are only imported once they are used, so they do not slow down the startup
+pd = lazy_import("pandas")
+vtk = lazy_import("vtk")
 
 
 class DataManager:
@@ -13,34 +24,60 @@ class DataManager:
 
     def __init__(self) -> None:
         self.loaded_data: List[Data] = []
+        # isosurfaces that were extracted before, keyed by (filename, volume modified time, iso-value, extent)
+        self.isosurface_cache: OrderedDict[tuple, vtk.vtkPolyData] = OrderedDict()
+        self.isosurface_cache_size: int = 8
+        # isosurfaces are extracted in a background thread, the lock guards the cache, not the extraction
+        self.isosurface_lock = threading.Lock()
+        # meshes are cleaned up once when they are loaded, the results are cached on disk
+        self.mesh_preparation = MeshPreparation()
+        # the folders that are watched for new files, keyed by their absolute path
+        self.folder_watchers: Dict[str, FolderWatcher] = {}
 
+    @profiled("DataManager.load_data", "data")
     def load_data(self, path: str) -> Union[str, None]:
         """
         Loads data into the data manager.
         :param path: the path to the data file
         :return: the name of the file if the data was loaded successfully. If an exception occurred, None is returned
         """
-        ext = os.path.splitext(path)[1].lower()
         try:
-            if ext in ['.csv', '.txt']:
-                data = self.read_csv(path)
-            elif ext in ['.xls', '.xlsx']:
-                data = self.read_excel(path)
-            else:
-                data = self.read_vtk_file(path, ext)
-
+            data = self.read_file(path)
             filename = os.path.basename(path)
-            new_filename = self.add_data(filename, data)
+            new_filename = self.add_data(filename, data, path)
             return new_filename
         except Exception as e:
+            from GUI.popups import ErrorDialog     # imported when needed, so processes without a GUI do not load Qt
             ErrorDialog(f"Error loading {path}: {e}")
             return
 
-    def add_data(self, filename: str, data: Union[pd.DataFrame, vtk.vtkDataObject]) -> str:
+    def read_file(self, path: str) -> Union[pd.DataFrame, vtk.vtkDataObject]:
+        """
+        reads a file, or a DICOM directory, with the reader that belongs to its extension. Errors are raised instead of
+        shown, so files can also be read outside the GUI thread.
+        :param path: the path to the file or directory
+        :return: the data
+        """
+        if os.path.isdir(path):
+            reader = vtk.vtkDICOMImageReader()
+            reader.SetDirectoryName(path)
+            return self.update_reader(reader, path)
+        ext = self.get_extension(path)
+        if ext in ['.csv', '.txt']:
+            return self.read_csv(path)
+        elif ext in ['.xls', '.xlsx']:
+            return self.read_excel(path)
+        elif ext in MeshPreparation.mesh_extensions and self.mesh_preparation.enabled:
+            return self.read_prepared_mesh(path, ext)
+        return self.read_vtk_file(path, ext)
+
+    def add_data(self, filename: str, data: Union[pd.DataFrame, vtk.vtkDataObject],
+                 source_path: Union[str, None] = None) -> str:
         """
         creates a Data object and appends it to the list of loaded data.
         :param filename: the filename of the file that will be added
         :param data: the data that got read from the file, in either vtk or panda format
+        :param source_path: the path of the file the data was read from, None for data that was computed
         :return: the filename if it did not exist yet, or filename_copy_number if there was already data present with
         that file name
         """
@@ -52,11 +89,57 @@ class DataManager:
             name, ext = os.path.splitext(filename)
             new_filename = f"{name}_({copy_number}){ext}"
         # create the data object
-        data_object = Data(new_filename, data)
+        data_object = Data(new_filename, data, source_path)
         # add it to the list of loaded data
         self.loaded_data.append(data_object)
         return new_filename
 
+    def add_deferred_data(self, filename: str, loader: Callable[[], Union[pd.DataFrame, vtk.vtkDataObject]],
+                          source_path: Union[str, None] = None, modified: bool = False) -> Union[str, None]:
+        """
+        adds data that is only read once it is used for the first time, such as the data of a restored session.
+        :param filename: the filename of the data, data that is already loaded under this name is kept instead
+        :param loader: the function that reads the data
+        :param source_path: the path of the file the data was read from, None for data that was computed
+        :param modified: whether the data was changed after it was read from the source path
+        :return: the filename, or None if data with the filename was loaded already
+        """
+        if self.get_data_object_by_filename(filename) is not None:
+            return None
+        data_object = Data(filename, None, source_path)
+        data_object.modified = modified
+        data_object.set_loader(loader)
+        self.loaded_data.append(data_object)
+        return filename
+
+    def watch_folder(self, directory: str, file_types: List[str], use_inotify: bool = True) -> FolderWatcher:
+        """
+        starts reading the new files in a folder in the background. The files are published as a FilesLoadedEvent,
+        they are added to the DataManager by the handler of that event on the GUI thread.
+        :param directory: the folder to watch
+        :param file_types: the file types that are read, without the dot
+        :param use_inotify: whether inotify is used when it is available, otherwise the folder is polled
+        :return: the watcher of the folder, an existing watcher if the folder was watched already
+        """
+        directory = os.path.abspath(directory)
+        if directory not in self.folder_watchers:
+            watcher = FolderWatcher(directory, self.read_file, file_types, use_inotify=use_inotify)
+            watcher.start()
+            self.folder_watchers[directory] = watcher
+        return self.folder_watchers[directory]
+
+    def stop_watching(self, directory: Union[str, None] = None) -> None:
+        """
+        stops watching a folder.
+        :param directory: the folder, or None to stop watching all folders
+        :return: None
+        """
+        directories = list(self.folder_watchers) if directory is None else [os.path.abspath(directory)]
+        for path in directories:
+            watcher = self.folder_watchers.pop(path, None)
+            if watcher is not None:
+                watcher.stop()
+
     def get_data_object_by_filename(self, filename: str) -> Union['Data', None]:
         """
         Returns the data of a file, by file name
@@ -70,7 +153,7 @@ class DataManager:
 
     def set_data_by_filename(self, filename: str, data: Union[pd.DataFrame, vtk.vtkDataObject]) -> bool:
         """
-        Sets the data of a file by file name.
+        Sets the data of a file by file name. For DataFrames the previous data is kept in the history of the file.
         :param filename: the file that should be changed
         :param data: the new data
         :return: true if successful, false if no file with the filename was found
@@ -81,6 +164,43 @@ class DataManager:
                 return True
         return False
 
+    def update_columns(self, filename: str, columns: Dict[Hashable, np.ndarray], operation: str) -> bool:
+        """
+        Replaces or adds columns of a file as a new version in its history. Columns that are not changed are shared with
+        the previous version.
+        :param filename: the file that should be changed
+        :param columns: a dictionary with the column label as key and the new values as value
+        :param operation: a short description of the operation, for example: limit
+        :return: true if successful, false if no file with the filename was found or the file has no history
+        """
+        data_object = self.get_data_object_by_filename(filename)
+        if data_object is None or data_object.history is None:
+            return False
+        data_object.history.commit(columns, operation)
+        return True
+
+    def undo(self, filename: str) -> bool:
+        """
+        Reverts the last operation on a file.
+        :param filename: the file of which the last operation should be reverted
+        :return: true if successful, false if the file was not found or there is nothing to undo
+        """
+        data_object = self.get_data_object_by_filename(filename)
+        if data_object is None or data_object.history is None:
+            return False
+        return data_object.history.undo()
+
+    def redo(self, filename: str) -> bool:
+        """
+        Applies the last reverted operation on a file again.
+        :param filename: the file of which the operation should be applied again
+        :return: true if successful, false if the file was not found or there is nothing to redo
+        """
+        data_object = self.get_data_object_by_filename(filename)
+        if data_object is None or data_object.history is None:
+            return False
+        return data_object.history.redo()
+
     def remove_data_by_filename(self, filename: str) -> bool:
         """
         removes data from the data manager by filename.
@@ -91,6 +211,10 @@ class DataManager:
             if data_object.filename == filename:
                 self.loaded_data.remove(data_object)
                 del data_object
+                # drop the isosurfaces of a removed volume
+                with self.isosurface_lock:
+                    for key in [key for key in self.isosurface_cache if key[0] == filename]:
+                        del self.isosurface_cache[key]
                 return True
         return False
 
@@ -100,11 +224,63 @@ class DataManager:
         :param path: the path to the directory
         :return: the name of the directory, possibly with a copy number if the directory was already loaded.
         """
-        reader = vtk.vtkDICOMImageReader()
-        reader.SetDirectoryName(path)
-        reader.Update()
-        data = reader.GetOutput()
-        return self.add_data(path, data)
+        return self.add_data(path, self.read_file(path), path)
+
+    def extract_isosurface(self, filename: str, iso_value: float,
+                           extent: Union[Tuple[int, int, int, int, int, int], None] = None,
+                           report: Callable[[float], None] = lambda fraction: None) -> vtk.vtkPolyData:
+        """
+        Extracts the surface at an iso-value from a volume with the multithreaded flying edges algorithm. Surfaces are
+        cached, so selecting the same iso-value again does not extract it again. This can run in a background thread.
+        :param filename: the name of the volume
+        :param iso_value: the scalar value of the surface
+        :param extent: the sub-volume (x min, x max, y min, y max, z min, z max) in voxels, None for the whole volume
+        :param report: the function to report the progress with, as a fraction between 0 and 1
+        :return: the surface as polydata
+        """
+        data_object = self.get_data_object_by_filename(filename)
+        if data_object is None or not isinstance(data_object.data, vtk.vtkImageData):
+            raise ValueError(f"{filename} is not a loaded volume")
+        volume = data_object.data
+        key = (filename, volume.GetMTime(), float(iso_value), tuple(extent) if extent is not None else None)
+        with self.isosurface_lock:
+            surface = self.isosurface_cache.get(key)
+            if surface is not None:
+                self.isosurface_cache.move_to_end(key)
+                return surface
+
+        flying_edges = vtk.vtkFlyingEdges3D()
+        if extent is not None:
+            # only extract the selected part of the volume
+            sub_volume = vtk.vtkExtractVOI()
+            sub_volume.SetInputData(volume)
+            sub_volume.SetVOI(*extent)
+            flying_edges.SetInputConnection(sub_volume.GetOutputPort())
+        else:
+            flying_edges.SetInputData(volume)
+        flying_edges.SetValue(0, iso_value)
+        flying_edges.ComputeNormalsOn()
+        flying_edges.ComputeScalarsOff()
+        flying_edges.AddObserver("ProgressEvent", lambda caller, event: report(caller.GetProgress()))
+        flying_edges.Update()
+        surface = vtk.vtkPolyData()
+        surface.ShallowCopy(flying_edges.GetOutput())
+
+        with self.isosurface_lock:
+            self.isosurface_cache[key] = surface
+            if len(self.isosurface_cache) > self.isosurface_cache_size:
+                self.isosurface_cache.popitem(last=False)
+        return surface
+
+    @staticmethod
+    def get_extension(path: str) -> str:
+        """
+        :param path: the path to a file
+        :return: the extension of the file in lower case, including the .nii of compressed NIfTI files
+        """
+        if path.lower().endswith(".nii.gz"):
+            return ".nii.gz"
+        return os.path.splitext(path)[1].lower()
 
     # Different kinds of file readers
     @staticmethod
@@ -117,54 +293,590 @@ class DataManager:
         """Reads an Excel file and returns a DataFrame."""
         return pd.read_excel(filepath)
 
+    def read_prepared_mesh(self, filepath: str, ext: str) -> Union[vtk.vtkDataObject, None]:
+        """
+        Reads a mesh and runs it through the mesh preparation. If the same file was prepared with the same settings
+        before, the cached result is read instead. Files that do not contain a mesh are returned as read.
+        :param filepath: the path to the mesh file
+        :param ext: the extension of the file
+        :return: the prepared mesh
+        """
+        cache_path = self.mesh_preparation.get_cache_path(filepath)
+        if os.path.exists(cache_path):
+            mesh = self.mesh_preparation.read_cache(cache_path)
+            if mesh is not None:
+                return mesh
+        data = self.read_vtk_file(filepath, ext)
+        if not isinstance(data, vtk.vtkPolyData) or data.GetNumberOfPoints() == 0:
+            return data
+        mesh = self.mesh_preparation.prepare(data)
+        self.mesh_preparation.write_cache(cache_path, mesh)
+        return mesh
+
     @staticmethod
-    def read_vtk_file(filepath: str, ext: str) -> Union[vtk.vtkDataObject, None]:
-        try:
-            """Reads a VTK file and returns a VTK data object."""
-            if ext == ".vtk":
-                reader = vtk.vtkGenericDataObjectReader()
-            elif ext == ".vtu":
-                reader = vtk.vtkXMLUnstructuredGridReader()
-            elif ext == ".vtp":
-                reader = vtk.vtkXMLPolyDataReader()
-            elif ext == ".vti":
-                reader = vtk.vtkXMLImageDataReader()
-            elif ext == ".stl":
-                reader = vtk.vtkSTLReader()
-            elif ext == ".obj":
-                reader = vtk.vtkOBJReader()
-            elif ext == ".ply":
-                reader = vtk.vtkPLYReader()
-            elif ext in [".jpg", ".jpeg"]:
-                reader = vtk.vtkJPEGReader()
-            elif ext == ".png":
-                reader = vtk.vtkPNGReader()
-            elif ext == ".tiff" or ext == ".tif":
-                reader = vtk.vtkTIFFReader()
-            elif ext == ".dicom" or ext == ".dcm":
-                reader = vtk.vtkDICOMImageReader()
-            elif ext in [".nii", ".nii.gz"]:
-                reader = vtk.vtkNIFTIImageReader()
-            elif ext == ".mhd":
-                reader = vtk.vtkMetaImageReader()
-            else:
-                ErrorDialog("Unsupported file format: {}".format(ext))
-                return
+    def read_vtk_file(filepath: str, ext: str) -> vtk.vtkDataObject:
+        """Reads a VTK file and returns a VTK data object, it raises a ValueError for unsupported formats."""
+        if ext == ".vtk":
+            reader = vtk.vtkGenericDataObjectReader()
+        elif ext == ".vtu":
+            reader = vtk.vtkXMLUnstructuredGridReader()
+        elif ext == ".vtp":
+            reader = vtk.vtkXMLPolyDataReader()
+        elif ext == ".vti":
+            reader = vtk.vtkXMLImageDataReader()
+        elif ext == ".stl":
+            reader = vtk.vtkSTLReader()
+        elif ext == ".obj":
+            reader = vtk.vtkOBJReader()
+        elif ext == ".ply":
+            reader = vtk.vtkPLYReader()
+        elif ext in [".jpg", ".jpeg"]:
+            reader = vtk.vtkJPEGReader()
+        elif ext == ".png":
+            reader = vtk.vtkPNGReader()
+        elif ext == ".tiff" or ext == ".tif":
+            reader = vtk.vtkTIFFReader()
+        elif ext == ".dicom" or ext == ".dcm":
+            reader = vtk.vtkDICOMImageReader()
+        elif ext in [".nii", ".nii.gz"]:
+            reader = vtk.vtkNIFTIImageReader()
+        elif ext == ".mhd":
+            reader = vtk.vtkMetaImageReader()
+        else:
+            raise ValueError("Unsupported file format: {}".format(ext))
 
-            reader.SetFileName(filepath)
-            reader.Update()
-            return reader.GetOutput()
-        except Exception as e:
-            ErrorDialog(f"Error reading VTK file: {e}")
+        reader.SetFileName(filepath)
+        return DataManager.update_reader(reader, filepath)
+
+    @staticmethod
+    def update_reader(reader: vtk.vtkAlgorithm, path: str) -> vtk.vtkDataObject:
+        """
+        runs a vtk reader. vtk readers report errors through an event instead of raising them, so they are raised here.
+        :param reader: the reader, with its file or directory set
+        :param path: the path that is read, for the error message
+        :return: the output of the reader
+        """
+        errors = []
+        reader.AddObserver("ErrorEvent", lambda caller, event: errors.append(f"could not read {path}"))
+        reader.Update()
+        if errors:
+            raise ValueError(errors[0])
+        return reader.GetOutput()
+
+
+class MeshPreparation:
+    """
+    The preparation stage that meshes go through when they are loaded: merging duplicate points, keeping the largest
+    connected component, decimating to a target number of cells and computing normals. Prepared meshes are cached as
+    binary .vtp files, keyed by a hash of the source file and the settings, so loading the same mesh again skips the
+    work.
+    """
+    mesh_extensions = [".stl", ".obj", ".ply", ".vtp", ".vtk"]
+    version: int = 1    # part of the cache key, increase it when the preparation itself changes
+
+    def __init__(self, enabled: bool = True, merge_points: bool = True, merge_tolerance: float = 0.0,
+                 largest_component: bool = False, target_cells: int = 0, compute_normals: bool = True,
+                 cache_directory: str = "mesh_cache"):
+        """
+        constructor for the mesh preparation
+        :param enabled: whether meshes are prepared at all
+        :param merge_points: whether points at the same position are merged
+        :param merge_tolerance: the distance below which points are merged, as a fraction of the size of the mesh
+        :param largest_component: whether only the largest connected part of the mesh is kept
+        :param target_cells: the number of cells larger meshes are decimated to, 0 to not decimate
+        :param compute_normals: whether point normals are computed
+        :param cache_directory: the directory the prepared meshes are cached in
+        """
+        self.enabled = enabled
+        self.merge_points = merge_points
+        self.merge_tolerance = merge_tolerance
+        self.largest_component = largest_component
+        self.target_cells = target_cells
+        self.compute_normals = compute_normals
+        self.cache_directory = cache_directory
+
+    def get_key(self) -> str:
+        """
+        :return: a string that describes the settings, which is part of the cache key
+        """
+        return (f"v{self.version}-merge{int(self.merge_points)}:{self.merge_tolerance}-"
+                f"largest{int(self.largest_component)}-cells{self.target_cells}-normals{int(self.compute_normals)}")
+
+    def get_cache_path(self, filepath: str) -> str:
+        """
+        hashes the source file together with the settings.
+        :param filepath: the path to the source file
+        :return: the path of the cached mesh
+        """
+        file_hash = hashlib.blake2b(self.get_key().encode(), digest_size=20)
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b""):
+                file_hash.update(chunk)
+        return os.path.join(self.cache_directory, file_hash.hexdigest() + ".vtp")
+
+    def prepare(self, mesh: vtk.vtkPolyData) -> vtk.vtkPolyData:
+        """
+        runs a mesh through the enabled steps of the preparation.
+        :param mesh: the mesh as it was read
+        :return: the prepared mesh
+        """
+        if self.merge_points:
+            clean = vtk.vtkCleanPolyData()
+            clean.SetInputData(mesh)
+            clean.PointMergingOn()
+            clean.SetTolerance(self.merge_tolerance)
+            clean.Update()
+            mesh = clean.GetOutput()
+        if self.largest_component:
+            connectivity = vtk.vtkPolyDataConnectivityFilter()
+            connectivity.SetInputData(mesh)
+            connectivity.SetExtractionModeToLargestRegion()
+            connectivity.Update()
+            clean = vtk.vtkCleanPolyData()  # removes the points of the other components
+            clean.SetInputData(connectivity.GetOutput())
+            clean.PointMergingOff()
+            clean.Update()
+            mesh = clean.GetOutput()
+        if 0 < self.target_cells < mesh.GetNumberOfCells():
+            triangles = vtk.vtkTriangleFilter()  # the decimation only works on triangles
+            triangles.SetInputData(mesh)
+            triangles.Update()
+            decimate = vtk.vtkQuadricDecimation()
+            decimate.SetInputData(triangles.GetOutput())
+            decimate.SetTargetReduction(1 - self.target_cells / triangles.GetOutput().GetNumberOfCells())
+            decimate.Update()
+            mesh = decimate.GetOutput()
+        if self.compute_normals and mesh.GetNumberOfPolys() > 0:
+            normals = vtk.vtkPolyDataNormals()
+            normals.SetInputData(mesh)
+            normals.SplittingOff()  # splitting sharp edges would duplicate points again
+            normals.Update()
+            mesh = normals.GetOutput()
+        prepared = vtk.vtkPolyData()
+        prepared.ShallowCopy(mesh)
+        return prepared
+
+    @staticmethod
+    def read_cache(cache_path: str) -> Union[vtk.vtkPolyData, None]:
+        """
+        reads a cached mesh.
+        :param cache_path: the path of the cached mesh
+        :return: the mesh, or None if the file could not be read
+        """
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.SetFileName(cache_path)
+        reader.Update()
+        if reader.GetErrorCode() != 0 or reader.GetOutput().GetNumberOfPoints() == 0:
+            return None
+        return reader.GetOutput()
+
+    def write_cache(self, cache_path: str, mesh: vtk.vtkPolyData) -> None:
+        """
+        writes a prepared mesh to the cache as a binary .vtp file with fast LZ4 compression. The file is written
+        under a temporary name first, so a half written file is never read as a cached mesh.
+        :param cache_path: the path of the cached mesh
+        :param mesh: the prepared mesh
+        :return: None
+        """
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+            writer = vtk.vtkXMLPolyDataWriter()
+            writer.SetFileName(temporary_path)
+            writer.SetInputData(mesh)
+            writer.SetDataModeToBinary()
+            writer.SetCompressorTypeToLZ4()
+            if writer.Write() == 1:
+                os.replace(temporary_path, cache_path)
+            elif os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        except OSError:
+            pass    # the cache is only an optimization, the mesh is still loaded
 
 
 class Data:
     """
     Represents data that will be loaded.
     A list of instances of this class will be present in the DataManager.
+    DataFrames are stored in a DataHistory, so every change can be undone. Other data is stored as is.
     """
 
-    def __init__(self, filename: str, data: Union[pd.DataFrame, vtk.vtkDataObject]):
+    def __init__(self, filename: str, data: Union[pd.DataFrame, vtk.vtkDataObject],
+                 source_path: Union[str, None] = None):
         self.filename = filename
+        self.source_path = source_path
+        # whether the data differs from the file at the source path in a way the history does not show, such as the
+        # changes of a restored session, whose history starts at the changed data
+        self.modified: bool = False
+        # reads the data the first time it is used, for data that is added before it is read
+        self._loader: Union[Callable[[], Union[pd.DataFrame, vtk.vtkDataObject]], None] = None
+        self._loader_lock = threading.Lock()
+        self.history: Union[DataHistory, None] = None
+        self._data = None
+        # statistics of a volume, together with the modification time of the volume they were computed for
+        self._volume_statistics: Union[VolumeStatistics, None] = None
+        self._volume_statistics_time: int = -1
+        # memory usage in bytes, together with the version of the data it was computed for
+        self._memory_usage: Dict[str, int] = {}
+        self._memory_usage_key = None
         self.data = data
 
+    @property
+    def data(self) -> Union[pd.DataFrame, vtk.vtkDataObject]:
+        """
+        :return: the data, for DataFrames this is the current version in the history
+        """
+        if self._loader is not None:
+            self.load()
+        if self.history is not None:
+            return self.history.get_frame()
+        return self._data
+
+    @data.setter
+    def data(self, data: Union[pd.DataFrame, vtk.vtkDataObject]) -> None:
+        """
+        sets the data. A DataFrame is added as a new version to the history instead of replacing the old data.
+        :param data: the new data
+        :return: None
+        """
+        if isinstance(data, pd.DataFrame):
+            if self.history is None:
+                self.history = DataHistory(data)
+            else:
+                self.history.commit_frame(data, "replace")
+            self._data = None
+        else:
+            self.history = None
+            self._data = data
+        self._volume_statistics = None
+
+    def set_loader(self, loader: Callable[[], Union[pd.DataFrame, vtk.vtkDataObject]]) -> None:
+        """
+        defers reading the data until it is used for the first time.
+        :param loader: the function that reads the data
+        :return: None
+        """
+        self._loader = loader
+
+    def is_loaded(self) -> bool:
+        """
+        :return: whether the data was read, which is always the case for data that was not deferred
+        """
+        return self._loader is None
+
+    def load(self) -> None:
+        """
+        reads deferred data. This can happen on any thread, so errors are shown through the event bus.
+        :return: None
+        """
+        with self._loader_lock:
+            if self._loader is None:
+                return  # another thread read the data in the meantime
+            try:
+                data = self._loader()
+            except Exception as e:
+                data = None
+                event_bus.publish(ErrorEvent(f"Error loading {self.filename}: {e}"))
+            self.data = data
+            self._loader = None
+
+    def get_memory_usage(self) -> Dict[str, int]:
+        """
+        computes the memory the data holds. For DataFrames this is the current version, measured with
+        memory_usage(deep=True), and the columns that only older versions in the history hold. For vtk data objects it
+        is the size vtk reports. The result is cached until the data changes, data that was not read yet uses nothing.
+        :return: the bytes held by the "data" and by the "history"
+        """
+        if not self.is_loaded():
+            return {"data": 0, "history": 0}
+        data = self.data
+        if self.history is not None:
+            key = (self.history.current.version_id, len(self.history.versions))
+        elif isinstance(data, vtk.vtkDataObject):
+            key = (id(data), data.GetMTime())
+        else:
+            key = id(data)
+        if key != self._memory_usage_key:
+            if self.history is not None:
+                self._memory_usage = {"data": int(data.memory_usage(deep=True).sum()),
+                                      "history": self.history.get_history_memory_usage()}
+            elif isinstance(data, vtk.vtkDataObject):
+                self._memory_usage = {"data": data.GetActualMemorySize() * 1024, "history": 0}
+            else:
+                self._memory_usage = {"data": 0, "history": 0}
+            self._memory_usage_key = key
+        return self._memory_usage
+
+    def get_volume_statistics(self) -> Union['VolumeStatistics', None]:
+        """
+        computes the statistics of a volume the first time they are needed and caches them until the volume changes.
+        :return: the statistics, or None if the data is not a volume with scalars
+        """
+        data = self.data
+        if not isinstance(data, vtk.vtkImageData) or data.GetPointData().GetScalars() is None:
+            return None
+        if self._volume_statistics is None or self._volume_statistics_time != data.GetMTime():
+            self._volume_statistics = VolumeStatistics(data)
+            self._volume_statistics_time = data.GetMTime()
+        return self._volume_statistics
+
+
+class VolumeStatistics:
+    """
+    Statistics of the scalars in a volume, computed with a single histogram pass over the voxels. Percentiles are
+    looked up in the cumulative histogram, so they do not need another pass or a sorted copy of the volume.
+    """
+    max_bins: int = 4096
+
+    def __init__(self, volume: vtk.vtkImageData):
+        """
+        constructor for the statistics
+        :param volume: the volume, only the first component of its scalars is used
+        """
+        from vtkmodules.util.numpy_support import vtk_to_numpy
+        values = vtk_to_numpy(volume.GetPointData().GetScalars())   # a view, the voxels are not copied
+        if values.ndim > 1:
+            values = values[:, 0]
+        self.minimum = float(values.min())
+        self.maximum = float(values.max())
+        bins = self.max_bins
+        if np.issubdtype(values.dtype, np.integer):
+            bins = int(min(bins, self.maximum - self.minimum + 1))   # at most one bin per integer value
+        self.counts, self.bin_edges = np.histogram(values, bins=max(bins, 1), range=(self.minimum, self.maximum))
+        self.cumulative_counts = np.cumsum(self.counts)
+
+    def percentile(self, q: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        estimates percentiles by interpolating linearly within the histogram bins.
+        :param q: the percentile or an array of percentiles, between 0 and 100
+        :return: the scalar value at each percentile
+        """
+        q = np.clip(np.asarray(q, dtype=float), 0, 100)
+        target = q / 100 * self.cumulative_counts[-1]
+        index = np.minimum(np.searchsorted(self.cumulative_counts, target), len(self.counts) - 1)
+        previous = self.cumulative_counts[index] - self.counts[index]
+        fraction = np.clip((target - previous) / np.maximum(self.counts[index], 1), 0, 1)
+        values = self.bin_edges[index] + fraction * (self.bin_edges[index + 1] - self.bin_edges[index])
+        return float(values) if values.ndim == 0 else values
+
+
+class DataVersion:
+    """
+    A single version of a DataFrame in the history. The columns are stored as read-only numpy arrays that are shared
+    by reference with the other versions, so a version only costs memory for the columns it changed.
+    """
+    _ids = count()
+
+    def __init__(self, columns: Dict[Hashable, np.ndarray], index: pd.Index, operation: str,
+                 parent: Union['DataVersion', None] = None):
+        """
+        constructor for a version
+        :param columns: the columns of this version in order, with the label as key and the values as value
+        :param index: the row index, which is shared between versions
+        :param operation: a short description of the operation that created this version
+        :param parent: the version this version was derived from, None for the original data
+        """
+        self.version_id: int = next(self._ids)
+        self.columns = columns
+        self.index = index
+        self.operation = operation
+        self.parent = parent
+
+    @staticmethod
+    def freeze(values) -> np.ndarray:
+        """
+        converts values to a read-only numpy view, without copying them and without changing the flags of the array of
+        the caller. The values are handed over to the history, the caller should not modify them afterwards.
+        :param values: the values of a column
+        :return: the read-only view
+        """
+        array = np.asarray(values)
+        if array.flags.writeable:
+            array = array.view()
+            array.setflags(write=False)
+        return array
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        :return: a DataFrame that references the arrays of this version without copying them
+        """
+        return pd.DataFrame(self.columns, index=self.index, copy=False)
+
+
+class DataHistory:
+    """
+    Keeps all versions of a DataFrame as a tree. Undo and redo move through the tree without copying data; applying an
+    operation after an undo starts a new branch, while the old branch stays available for comparison. Only the last
+    max_depth operations can be undone, older versions and the branches that start from them are dropped.
+    """
+
+    def __init__(self, frame: pd.DataFrame, max_depth: int = 100):
+        """
+        constructor for the history
+        :param frame: the original data
+        :param max_depth: the amount of operations that can be undone
+        """
+        self.max_depth = max_depth
+        columns = {label: DataVersion.freeze(frame[label].values) for label in frame.columns}
+        self.root = DataVersion(columns, frame.index, "load")
+        self.versions: Dict[int, DataVersion] = {self.root.version_id: self.root}
+        self.current: DataVersion = self.root
+        self.redo_stack: List[DataVersion] = []
+        self._frame: Union[pd.DataFrame, None] = None
+
+    def get_frame(self) -> pd.DataFrame:
+        """
+        :return: the DataFrame of the current version. It is built once per version and reused afterwards.
+        """
+        if self._frame is None:
+            self._frame = self.current.to_frame()
+        return self._frame
+
+    def get_history_memory_usage(self) -> int:
+        """
+        :return: the bytes held by the columns of older and other versions that the current version does not share
+        """
+        current = {id(values) for values in self.current.columns.values()}
+        arrays = {id(values): values for version in self.versions.values() for values in version.columns.values()
+                  if id(values) not in current}
+        return sum(int(pd.Series(values, copy=False).memory_usage(deep=True, index=False)) if values.dtype == object
+                   else values.nbytes for values in arrays.values())
+
+    def commit(self, changes: Dict[Hashable, np.ndarray], operation: str) -> DataVersion:
+        """
+        Creates a new version in which the given columns are replaced or added. All other columns are shared with the
+        current version.
+        :param changes: a dictionary with the column label as key and the new values as value
+        :param operation: a short description of the operation
+        :return: the new version
+        """
+        columns = dict(self.current.columns)
+        for label, values in changes.items():
+            if len(values) != len(self.current.index):
+                raise ValueError(f"column {label} has {len(values)} values, expected {len(self.current.index)}")
+            columns[label] = DataVersion.freeze(values)
+        return self._add_version(DataVersion(columns, self.current.index, operation, self.current))
+
+    def commit_frame(self, frame: pd.DataFrame, operation: str) -> DataVersion:
+        """
+        Creates a new version from a complete DataFrame. Columns that still hold the same arrays as the current version
+        are shared, all others are stored as new arrays.
+        :param frame: the new DataFrame
+        :param operation: a short description of the operation
+        :return: the new version
+        """
+        columns = {}
+        for label in frame.columns:
+            values = frame[label].values
+            previous = self.current.columns.get(label)
+            if previous is not None and (values is previous or
+                                         (values.shape == previous.shape and np.shares_memory(values, previous))):
+                columns[label] = previous
+            else:
+                columns[label] = DataVersion.freeze(values)
+        return self._add_version(DataVersion(columns, frame.index, operation, self.current))
+
+    def _add_version(self, version: DataVersion) -> DataVersion:
+        """
+        registers a version and makes it the current version. New operations clear the redo stack.
+        :param version: the new version
+        :return: the version
+        """
+        self.versions[version.version_id] = version
+        self.redo_stack.clear()
+        self._set_current(version)
+        self._trim()
+        return version
+
+    def _trim(self) -> None:
+        """
+        drops the versions that are more than max_depth operations before the current version, together with the
+        branches that start from them, so their columns can be freed.
+        :return: None
+        """
+        ancestors = [self.current]
+        while ancestors[-1].parent is not None and len(ancestors) <= self.max_depth:
+            ancestors.append(ancestors[-1].parent)
+        if ancestors[-1].parent is None:
+            return
+        self.root = ancestors[-1]
+        self.root.parent = None
+        # the versions of dropped branches still lead to the old root
+        kept = {}
+        for version_id, version in self.versions.items():
+            oldest = version
+            while oldest.parent is not None:
+                oldest = oldest.parent
+            if oldest is self.root:
+                kept[version_id] = version
+        self.versions = kept
+
+    def _set_current(self, version: DataVersion) -> None:
+        """
+        makes a version the current version and invalidates the cached DataFrame.
+        :param version: the version
+        :return: None
+        """
+        self.current = version
+        self._frame = None
+
+    def undo(self) -> bool:
+        """
+        moves back to the parent of the current version.
+        :return: true if successful, false if the current version is the original data
+        """
+        if self.current.parent is None:
+            return False
+        self.redo_stack.append(self.current)
+        self._set_current(self.current.parent)
+        return True
+
+    def redo(self) -> bool:
+        """
+        moves forward to the version that was last undone.
+        :return: true if successful, false if there is nothing to redo
+        """
+        if not self.redo_stack:
+            return False
+        self._set_current(self.redo_stack.pop())
+        return True
+
+    def checkout(self, version_id: int) -> bool:
+        """
+        makes any version in the tree the current version, for example the tip of another branch.
+        :param version_id: the id of the version
+        :return: true if successful, false if no version with that id exists
+        """
+        version = self.versions.get(version_id)
+        if version is None:
+            return False
+        self.redo_stack.clear()
+        self._set_current(version)
+        return True
+
+    def compare(self, version_id_a: int, version_id_b: int) -> Dict[str, List[Hashable]]:
+        """
+        Compares two versions. Columns that are shared by reference are equal without looking at their values.
+        :param version_id_a: the id of the first version
+        :param version_id_b: the id of the second version
+        :return: a dictionary with the labels of the changed, added and removed columns from a to b
+        """
+        columns_a = self.versions[version_id_a].columns
+        columns_b = self.versions[version_id_b].columns
+        return {
+            "changed": [label for label in columns_b if label in columns_a and columns_b[label] is not columns_a[label]],
+            "added": [label for label in columns_b if label not in columns_a],
+            "removed": [label for label in columns_a if label not in columns_b],
+        }
+
+    def get_operations(self) -> List[str]:
+        """
+        :return: the operations that lead from the original data to the current version, oldest first
+        """
+        operations = []
+        version = self.current
+        while version is not None:
+            operations.append(version.operation)
+            version = version.parent
+        return operations[::-1]
+
@@ -0,0 +1,175 @@
+from collections import deque, defaultdict
+from typing import Callable, Dict, List, Tuple, Type
+
+import numpy
+
+
+class Event:
+    """
+    Base class for the events that worker threads send to the GUI thread.
+    """
+    pass
+
+
+class DataBatchEvent(Event):
+    """
+    A batch of new samples for a realtime plot.
+    """
+    def __init__(self, name: str, x: numpy.ndarray, y: numpy.ndarray):
+        """
+        constructor for the data batch event
+        :param name: the name of the plot, which is the name of the device for realtime data
+        :param x: the new x values
+        :param y: the new y values
+        """
+        self.name = name
+        self.x = x
+        self.y = y
+
+
+class ErrorEvent(Event):
+    """
+    An error that should be shown to the user.
+    """
+    def __init__(self, message: str):
+        self.message = message
+
+
+class StatusEvent(Event):
+    """
+    A change in the status of a source, such as the heart rate that was detected in the data of a device.
+    """
+    def __init__(self, name: str, key: str, value):
+        """
+        constructor for the status event
+        :param name: the name of the source, such as the device name
+        :param key: what the status is about, for example "heart_rate"
+        :param value: the new value
+        """
+        self.name = name
+        self.key = key
+        self.value = value
+
+
+class FilesLoadedEvent(Event):
+    """
+    A batch of files that were read in the background, such as the new files in a watched folder.
+    """
+    def __init__(self, directory: str, files: List[Tuple[str, object, bool]]):
+        """
+        constructor for the files loaded event
+        :param directory: the directory the files were found in
+        :param files: the path, the data and whether it is a DICOM volume, for every file
+        """
+        self.directory = directory
+        self.files = files
+
+
+class EventBus:
+    """
+    Passes events from worker threads to the GUI thread. Worker threads publish events into a bounded queue without
+    touching any widget, and the GUI thread drains the queue once per frame and calls the subscribed handlers. Data
+    batches of the same plot that arrived within one frame are merged, so the widgets are updated once per frame.
+    When the GUI thread falls behind, the oldest events are dropped instead of the queue growing without limit.
+    """
+    def __init__(self, max_events: int = 10000):
+        """
+        constructor for the event bus
+        :param max_events: the maximum number of events that are kept until the next drain
+        """
+        # appending and popping on both ends of a deque are atomic, so publishing does not need a lock
+        self.events: deque = deque(maxlen=max_events)
+        self.handlers: Dict[Type[Event], List[Callable[[Event], None]]] = defaultdict(list)
+        self.published_count: int = 0
+        self.dropped_count: int = 0
+        self.draining: bool = False
+
+    def publish(self, event: Event) -> None:
+        """
+        adds an event to the queue. This can be called from any thread.
+        :param event: the event
+        :return: None
+        """
+        if len(self.events) == self.events.maxlen:
+            self.dropped_count += 1
+        self.events.append(event)
+        self.published_count += 1
+
+    def subscribe(self, event_type: Type[Event], handler: Callable[[Event], None]) -> None:
+        """
+        adds a handler that is called on the GUI thread for every drained event of the type.
+        :param event_type: the type of the events
+        :param handler: the function that handles the event
+        :return: None
+        """
+        self.handlers[event_type].append(handler)
+
+    def unsubscribe(self, event_type: Type[Event], handler: Callable[[Event], None]) -> None:
+        """
+        removes a handler that was subscribed before.
+        :param event_type: the type of the events
+        :param handler: the handler to remove
+        :return: None
+        """
+        if handler in self.handlers[event_type]:
+            self.handlers[event_type].remove(handler)
+
+    def drain(self) -> int:
+        """
+        handles the events that were published until now. This should only be called from the GUI thread.
+        :return: the number of events that were taken from the queue
+        """
+        # a handler that runs a modal dialog lets timers fire, which must not drain again before the older events
+        # are handled, otherwise newer batches would be handled before older ones
+        if self.draining:
+            return 0
+        events = []
+        # only the events that are present now are handled, events published meanwhile wait for the next frame
+        for _ in range(len(self.events)):
+            events.append(self.events.popleft())
+        self.draining = True
+        try:
+            for event in self.merge_data_batches(events):
+                for handler in list(self.handlers[type(event)]):
+                    handler(event)
+        finally:
+            self.draining = False
+        return len(events)
+
+    @staticmethod
+    def merge_data_batches(events: List[Event]) -> List[Event]:
+        """
+        merges the data batches of the same plot into one batch, at the position of the first batch of that plot.
+        The other events keep their order.
+        :param events: the events in the order they were published
+        :return: the events with one data batch per plot
+        """
+        merged = []
+        batches: Dict[str, List[DataBatchEvent]] = {}
+        for event in events:
+            if isinstance(event, DataBatchEvent):
+                if event.name not in batches:
+                    batches[event.name] = []
+                    merged.append(event.name)   # placeholder for the merged batch
+                batches[event.name].append(event)
+            else:
+                merged.append(event)
+        for index, item in enumerate(merged):
+            if isinstance(item, str):
+                parts = batches[item]
+                if len(parts) == 1:
+                    merged[index] = parts[0]
+                else:
+                    merged[index] = DataBatchEvent(item, numpy.concatenate([part.x for part in parts]),
+                                                   numpy.concatenate([part.y for part in parts]))
+        return merged
+
+    def get_queue_depth(self) -> int:
+        """
+        :return: the number of events that wait to be handled
+        """
+        return len(self.events)
+
+
+# the event bus of the application
+event_bus = EventBus()
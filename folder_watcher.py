@@ -0,0 +1,282 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
+
+from event_bus import event_bus, ErrorEvent, FilesLoadedEvent
+
+
+class InotifyBackend:
+    """
+    Reports the names of the entries of a directory that were created, written or moved into it, using inotify. Only
+    available on Linux.
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    event_header = struct.Struct("iIII")    # watch descriptor, mask, cookie, length of the name
+
+    def __init__(self, directory: str):
+        """
+        constructor for the backend, it starts watching the directory right away.
+        :param directory: the directory to watch
+        """
+        libc_name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(libc_name, use_errno=True) if libc_name else None
+        if libc is None or not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"cannot watch {directory}")
+
+    def wait(self, timeout: float) -> Set[str]:
+        """
+        waits for changes in the directory.
+        :param timeout: the longest time to wait in seconds
+        :return: the names of the entries that changed, empty if nothing changed within the timeout
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names = set()
+        offset = 0
+        while offset + self.event_header.size <= len(buffer):
+            _, _, _, length = self.event_header.unpack_from(buffer, offset)
+            offset += self.event_header.size
+            name = buffer[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self) -> None:
+        """
+        stops watching the directory.
+        :return: None
+        """
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """
+    Reports the names of the entries of a directory that were added or changed, by polling. The directory is only
+    listed again when its modification time changed, which happens when an entry is added, removed or renamed.
+    """
+    def __init__(self, directory: str):
+        """
+        constructor for the backend
+        :param directory: the directory to watch
+        """
+        self.directory = directory
+        self.directory_mtime: int = os.stat(directory).st_mtime_ns
+        self.entries: Dict[str, Tuple[int, int]] = self.list_entries()
+
+    def list_entries(self) -> Dict[str, Tuple[int, int]]:
+        """
+        :return: the size and modification time of every entry in the directory
+        """
+        entries = {}
+        for entry in os.scandir(self.directory):
+            try:
+                status = entry.stat()
+            except FileNotFoundError:
+                continue    # removed while listing
+            entries[entry.name] = (status.st_size, status.st_mtime_ns)
+        return entries
+
+    def wait(self, timeout: float) -> Set[str]:
+        """
+        waits for the timeout and checks the directory for changes.
+        :param timeout: the time to wait in seconds
+        :return: the names of the entries that were added or changed
+        """
+        time.sleep(timeout)
+        directory_mtime = os.stat(self.directory).st_mtime_ns
+        if directory_mtime == self.directory_mtime:
+            return set()
+        self.directory_mtime = directory_mtime
+        entries = self.list_entries()
+        changed = {name for name, signature in entries.items() if self.entries.get(name) != signature}
+        self.entries = entries
+        return changed
+
+    def close(self) -> None:
+        """
+        stops watching the directory.
+        :return: None
+        """
+        pass
+
+
+class FolderWatcher(threading.Thread):
+    """
+    Watches a directory for new files, such as the files that acquisition systems write to a shared folder, and reads
+    them in the background. A file is only read once its size and modification time did not change for the settle
+    time, so files that are still being written are skipped until they are complete. Subdirectories with DICOM files
+    are read as a volume, a new subdirectory is watched until DICOM files appear in it or the directory timeout
+    passes. The files that became ready together are read as one batch and published as a
+    FilesLoadedEvent, which the GUI thread adds to the DataManager. Files that were in the directory before it was
+    watched are ignored.
+    """
+    ignored_suffixes = (".tmp", ".part", ".partial", ".crdownload", "~")
+
+    def __init__(self, directory: str, read_file: Callable[[str], object], file_types: Iterable[str],
+                 settle_time: float = 0.3, poll_interval: float = 0.1, use_inotify: bool = True,
+                 directory_timeout: float = 60.0):
+        """
+        constructor for the folder watcher
+        :param directory: the directory to watch
+        :param read_file: the function that reads a file or a DICOM directory, such as DataManager.read_file. It is
+        called on the watcher thread, so it has to raise an exception when a file cannot be read instead of showing a
+        dialog
+        :param file_types: the file types that are read, without the dot
+        :param settle_time: the seconds a file has to stay unchanged before it is read
+        :param poll_interval: the seconds between checks of the files that are being written
+        :param use_inotify: whether inotify is used when it is available, otherwise the directory is polled
+        :param directory_timeout: the seconds a new subdirectory is watched for DICOM files before it is ignored
+        """
+        super().__init__(daemon=True)
+        self.directory = os.path.abspath(directory)
+        self.read_file = read_file
+        self.file_types = tuple("." + file_type.lower() for file_type in file_types)
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.directory_timeout = directory_timeout
+        self.backend: Union[InotifyBackend, PollingBackend, None] = None
+        if use_inotify:
+            try:
+                self.backend = InotifyBackend(self.directory)
+            except (OSError, AttributeError):
+                self.backend = None
+        if self.backend is None:
+            self.backend = PollingBackend(self.directory)
+        self.known: Set[str] = set(os.listdir(self.directory))
+        # the entries that are being written: their last signature, since when it did not change and when they appeared
+        self.pending: Dict[str, Tuple[tuple, float, float]] = {}
+        self._running = True
+
+    def accepts(self, name: str) -> bool:
+        """
+        :param name: the name of an entry in the directory
+        :return: whether the entry can be read: a file with one of the file types or a directory
+        """
+        if name.startswith(".") or name.lower().endswith(self.ignored_suffixes):
+            return False
+        return name.lower().endswith(self.file_types) or os.path.isdir(os.path.join(self.directory, name))
+
+    @staticmethod
+    def get_signature(path: str) -> Union[tuple, None]:
+        """
+        :param path: the path of a file or directory
+        :return: the size and modification time of a file, or the number of files, their total size and latest
+        modification time for a directory. None if the entry does not exist anymore
+        """
+        try:
+            if not os.path.isdir(path):
+                status = os.stat(path)
+                return status.st_size, status.st_mtime_ns
+            statuses = [entry.stat() for entry in os.scandir(path) if entry.is_file()]
+            return (len(statuses), sum(status.st_size for status in statuses),
+                    max((status.st_mtime_ns for status in statuses), default=0))
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def is_dicom_directory(path: str) -> bool:
+        """
+        :param path: the path of a directory
+        :return: whether the directory holds DICOM files
+        """
+        return any(entry.name.lower().endswith((".dcm", ".dicom")) for entry in os.scandir(path))
+
+    def run(self) -> None:
+        """
+        The main method that will be called by the thread. It waits for changes in the directory and reads the
+        entries that are complete.
+        :return: None
+        """
+        while self._running:
+            try:
+                changed = self.backend.wait(self.poll_interval)
+            except OSError as e:
+                event_bus.publish(ErrorEvent(f"stopped watching {self.directory}: {e}"))
+                break
+            now = time.perf_counter()
+            for name in changed:
+                if name not in self.known and name not in self.pending and self.accepts(name):
+                    self.pending[name] = (None, now, now)
+            ready = self.get_ready(now)
+            if ready:
+                self.load_batch(ready)
+        self.backend.close()
+
+    def get_ready(self, now: float) -> List[str]:
+        """
+        checks the entries that are being written, and takes the ones that did not change for the settle time. A
+        directory stays pending until it holds DICOM files, the files are often copied into it after it was created.
+        :param now: the current time
+        :return: the names of the entries that are complete
+        """
+        ready = []
+        for name, (signature, since, appeared) in list(self.pending.items()):
+            path = os.path.join(self.directory, name)
+            current = self.get_signature(path)
+            if current is None:
+                del self.pending[name]  # removed or renamed before it was complete
+            elif current != signature:
+                self.pending[name] = (current, now, appeared)
+            elif now - since >= self.settle_time:
+                if os.path.isdir(path) and not self.is_dicom_directory(path):
+                    if now - appeared < self.directory_timeout:
+                        continue
+                    del self.pending[name]  # no DICOM files arrived, the directory is ignored from now on
+                    self.known.add(name)
+                    continue
+                del self.pending[name]
+                self.known.add(name)
+                ready.append(name)
+        return ready
+
+    def load_batch(self, names: List[str]) -> None:
+        """
+        reads complete entries and publishes them together on the event bus.
+        :param names: the names of the entries
+        :return: None
+        """
+        files = []
+        for name in sorted(names):
+            path = os.path.join(self.directory, name)
+            is_volume = os.path.isdir(path)
+            if is_volume and not self.is_dicom_directory(path):
+                continue
+            try:
+                files.append((path, self.read_file(path), is_volume))
+            except Exception as e:
+                event_bus.publish(ErrorEvent(f"Error loading {path}: {e}"))
+        if files:
+            event_bus.publish(FilesLoadedEvent(self.directory, files))
+
+    def stop(self) -> None:
+        """
+        stop the thread
+        :return: None
+        """
+        self._running = False
+        if self.is_alive():
+            self.join()
@@ -1,21 +1,26 @@
+import logging
 import sys
-from GUI.ui import *
-
-
-class MainWindow(QMainWindow):
-    """
-    creates the main window and sets up the ui. It also makes sure threads are stopped when the application is closed.
-    """
-    def __init__(self):
-        QMainWindow.__init__(self)
-        self.ui = UiMainWindow()
-        self.ui.setupUi(self)
-
-        QApplication.instance().aboutToQuit.connect(lambda: self.ui.stop_threads_upon_close())
+from startup import startup_timer
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    # the startup report is logged on the info level, which is only shown when started with --startup-report
+    if "--startup-report" in sys.argv:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # the user interface is only imported here: worker processes are spawned from this script and import it again,
+    # without running this block, so they do not load Qt, vtk and the modules
+    with startup_timer.measure("import the user interface"):
+        from PySide2.QtCore import QTimer
+        from PySide2.QtWidgets import QApplication
+        from GUI.main_window import MainWindow
+    with startup_timer.measure("create the application"):
+        app = QApplication(sys.argv)
+    with startup_timer.measure("set up the main window"):
+        window = MainWindow()
     window.show()
+    startup_timer.mark("show the main window")
+    with startup_timer.measure("restore the previous session"):
+        window.ui.open_last_session()
+    # the report is logged once the event loop runs, which is when the window is actually drawn
+    QTimer.singleShot(0, lambda: logging.getLogger("startup").info(startup_timer.get_report()))
     sys.exit(app.exec_())
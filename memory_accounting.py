@@ -0,0 +1,90 @@
+import time
+from collections import deque
+from typing import Dict, Iterable
+
+
+def format_bytes(size: float) -> str:
+    """
+    :param size: a number of bytes
+    :return: the size in the largest unit that keeps it at or above 1, such as "12.3 MB"
+    """
+    for unit in ("B", "kB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def vtk_memory_usage(data_objects: Iterable) -> int:
+    """
+    :param data_objects: vtk data objects, objects that occur more than once and None are counted once or skipped
+    :return: the memory the objects hold in bytes, as reported by GetActualMemorySize
+    """
+    unique = {id(data_object): data_object for data_object in data_objects if data_object is not None}
+    return sum(data_object.GetActualMemorySize() * 1024 for data_object in unique.values())
+
+
+class MemoryTracker:
+    """
+    Keeps the current memory usage of every module together with its high-water mark, and the rate at which memory is
+    allocated by live streams, over the last seconds.
+    """
+    def __init__(self, rate_window: float = 5.0):
+        """
+        constructor for the tracker
+        :param rate_window: the number of seconds the allocation rate is averaged over
+        """
+        self.current: Dict[str, int] = {}
+        self.peak: Dict[str, int] = {}
+        self.rate_window = rate_window
+        self.allocations: Dict[str, deque] = {}     # (time, bytes) of the recent allocations per module
+
+    def update(self, name: str, size: int) -> None:
+        """
+        sets the current memory usage of a module.
+        :param name: the name of the module
+        :param size: the memory usage in bytes
+        :return: None
+        """
+        self.current[name] = size
+        self.peak[name] = max(self.peak.get(name, 0), size)
+
+    def record_allocation(self, name: str, size: int) -> None:
+        """
+        records that a module received new data, such as a batch of samples from a device.
+        :param name: the name of the module
+        :param size: the size of the new data in bytes
+        :return: None
+        """
+        if name not in self.allocations:
+            self.allocations[name] = deque()
+        self.allocations[name].append((time.perf_counter(), size))
+
+    def get_allocation_rate(self, name: str) -> float:
+        """
+        :param name: the name of the module
+        :return: the bytes per second that were allocated during the last seconds
+        """
+        allocations = self.allocations.get(name)
+        if not allocations:
+            return 0.0
+        now = time.perf_counter()
+        while allocations and allocations[0][0] < now - self.rate_window:
+            allocations.popleft()
+        return sum(size for _, size in allocations) / self.rate_window
+
+    def get_peak(self, name: str) -> int:
+        """
+        :param name: the name of the module
+        :return: the highest memory usage of the module since the start of the application in bytes
+        """
+        return self.peak.get(name, 0)
+
+    def get_total(self) -> int:
+        """
+        :return: the current memory usage of all modules together in bytes
+        """
+        return sum(self.current.values())
+
+
+# the memory accounting of the application
+memory_tracker = MemoryTracker()
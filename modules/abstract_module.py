@@ -5,6 +5,7 @@ from GUI.sidebar import SidebarWidget, DataCard
 from GUI.image_widgets.abstract_image_widget import AbstractImageWidget
 from GUI.control_widgets.abstract_control_widget import AbstractControlWidget
 from data_manager import DataManager
+from memory_accounting import memory_tracker, format_bytes
 
 
 class AbstractModule:
@@ -13,7 +14,8 @@ class AbstractModule:
     """
 
     def __init__(self, module_name: str, allowed_file_tpes: list[str] = None, has_image_widget=True,
-                 has_control_panel=True, can_load_data=True) -> None:
+                 has_control_panel=True, can_load_data=True, sidebar_widget: SidebarWidget = None) -> None:
+        self.module_name = module_name
         self.has_image_widget = has_image_widget
         self.has_control_panel = has_control_panel
         self.can_load_data = can_load_data
@@ -22,7 +24,9 @@ class AbstractModule:
         self.data_manager: DataManager
         self.image_widget: AbstractImageWidget
         self.control_widget: AbstractControlWidget
-        self.sidebar_widget: SidebarWidget = SidebarWidget(module_name, can_load_data)
+        # the sidebar widget can be created up front, when the module itself is only created once it is toggled on
+        self.sidebar_widget: SidebarWidget = sidebar_widget if sidebar_widget is not None else \
+            SidebarWidget(module_name, can_load_data)
         self.set_widgets()
         self.set_load_data_callback()
 
@@ -140,7 +144,7 @@ class AbstractModule:
                 self.control_widget.add_data(filename)
 
             # create a new datacard for the sidebar and connect its delete button
-            data_card = self.sidebar_widget.add_datacard(filename)
+            data_card = self.sidebar_widget.add_datacard(filename, is_volume)
             delete_button = data_card.get_delete_button()
             delete_button.clicked.connect(lambda: self.remove_file(data_card))
         else:
@@ -171,3 +175,55 @@ class AbstractModule:
         self.control_widget.remove_data_by_filename(filename)
         self.image_widget.remove_from_plot(filename)
         self.sidebar_widget.remove_datacard(datacard)
+
+    def update_memory_usage(self) -> None:
+        """
+        shows the memory every file uses in its data card: the data in the DataManager, the older versions in its
+        history and what the plot holds on top of that. The total of the module and its high-water mark are shown in
+        the sidebar.
+        :return: None
+        """
+        total = 0
+        for datacard in self.sidebar_widget.get_datacards():
+            data_object = self.data_manager.get_data_object_by_filename(datacard.get_filename())
+            if data_object is None:
+                continue
+            usage = dict(data_object.get_memory_usage())
+            usage["plot"] = self.image_widget.get_memory_usage(datacard.get_filename(), data_object.data) \
+                if self.has_image_widget else 0
+            datacard.set_memory_usage(format_bytes(sum(usage.values())),
+                                      "\n".join(f"{part}: {format_bytes(size)}" for part, size in usage.items()))
+            total += sum(usage.values())
+        memory_tracker.update(self.module_name, total)
+        self.sidebar_widget.set_memory_usage(f"{format_bytes(total)} (peak "
+                                             f"{format_bytes(memory_tracker.get_peak(self.module_name))})")
+
+    def get_session_state(self) -> dict:
+        """
+        :return: the files shown in the module and the state of its plot, as JSON compatible values
+        """
+        return {"files": [{"filename": datacard.get_filename(), "is_volume": datacard.is_volume}
+                          for datacard in self.sidebar_widget.get_datacards()],
+                "plot": self.image_widget.get_session_state() if self.has_image_widget else {}}
+
+    def restore_session_state(self, state: dict) -> None:
+        """
+        adds the files of a restored session to the widgets and plots them as they were plotted. The files need to be
+        in the DataManager already, files that are shown in the module already are skipped.
+        :param state: the state returned by get_session_state
+        :return: None
+        """
+        shown = {datacard.get_filename() for datacard in self.sidebar_widget.get_datacards()}
+        for file in state.get("files", []):
+            if file["filename"] not in shown and \
+                    self.data_manager.get_data_object_by_filename(file["filename"]) is not None:
+                self.add_file_to_widgets(file["filename"], file["is_volume"])
+        if self.has_image_widget:
+            self.image_widget.restore_session_state(state.get("plot", {}), self.data_manager)
+
+    def stop_thread(self) -> None:
+        """
+        stops the threads of the module when the application is closed. Modules with threads should override this.
+        :return: None
+        """
+        pass
@@ -1,4 +1,7 @@
+from typing import Union
+
 import serial.tools.list_ports
+from PySide2.QtCore import QTimer
 
 from GUI.popups import ErrorDialog
 from GUI.settings import DeviceSettings
@@ -9,22 +12,29 @@ import pandas as pd
 import threading
 import time
 
+import custom_math as cm
+
 from data_manager import DataManager
+from event_bus import event_bus, DataBatchEvent, ErrorEvent, StatusEvent
+from memory_accounting import memory_tracker, format_bytes
 from modules.abstract_module import AbstractModule
+from settings_store import settings_store
+from shared_ingest import ProcessIngest, SharedStatus
 
 
 class ConnectionModule(AbstractModule):
     """
     Module to establish connections with devices and handle the incomming data.
     """
-    def __init__(self, data_manager, matplotlib_image_widget):
+    ingest_connect_timeout = 10.0   # the seconds an ingest process may take to start and connect
+    def __init__(self, data_manager, matplotlib_image_widget, sidebar_widget=None):
         self.module_name: str = "Realtime data"
-        self.settings_file = "settings.json"
-        super().__init__(self.module_name, has_image_widget=False, can_load_data=False)
+        super().__init__(self.module_name, has_image_widget=False, can_load_data=False, sidebar_widget=sidebar_widget)
         self.connections = {}
         self.data_manager = data_manager
-        self.image_widget = matplotlib_image_widget
+        self.image_widget: MatPlotLibImageWidget = matplotlib_image_widget
         self.control_widget: ConnectionControlWidget
+        self.ingest_timer = QTimer()
         self.setup()
 
     def setup(self) -> None:
@@ -35,6 +45,82 @@ class ConnectionModule(AbstractModule):
         self.control_widget = ConnectionControlWidget()
         # callbacks
         self.control_widget.get_add_device_button().clicked.connect(lambda: self.open_connection_dialog())
+        # the plot threads publish their results on the event bus, which is drained on the GUI thread
+        event_bus.subscribe(DataBatchEvent, lambda event: self.add_data_batch(event))
+        event_bus.subscribe(StatusEvent, lambda event: self.update_status(event))
+        # the running threads pick up changes of the settings right away
+        settings_store.subscribe("sampling-frequency", lambda value: self.update_stream_settings())
+        settings_store.subscribe("rolling-window", lambda value: self.update_stream_settings())
+        # ingest processes cannot publish on the event bus, their connection state is checked periodically instead
+        self.ingest_timer.timeout.connect(lambda: self.check_ingest_connections())
+        self.ingest_timer.start(100)
+
+    def update_stream_settings(self) -> None:
+        """
+        passes the current sampling frequency and rms window to the threads of all connections.
+        :return: None
+        """
+        for resources in self.connections.values():
+            worker = resources['ingest'] if resources['ingest'] is not None else resources['thread']
+            worker.set_stream_settings(settings_store.get("sampling-frequency"), settings_store.get("rolling-window"))
+
+    def check_ingest_connections(self) -> None:
+        """
+        adds the devices whose ingest process connected, removes the ones that failed to connect, and removes and
+        reports the devices whose ingest process lost its connection. This runs on a timer, so the GUI thread never
+        waits for a process to start.
+        :return: None
+        """
+        for device_name, resources in list(self.connections.items()):
+            ingest = resources['ingest']
+            if ingest is None:
+                continue
+            if not resources['connected']:
+                if ingest.is_connected():
+                    resources['connected'] = True
+                    self.add_ingest_device(device_name, ingest, resources['options'])
+                elif not ingest.is_connecting() or \
+                        time.perf_counter() - resources['started'] > self.ingest_connect_timeout:
+                    del self.connections[device_name]
+                    ingest.stop()
+                    event_bus.publish(ErrorEvent(f"failed to connect to {device_name}"))
+            elif not ingest.is_connected() or not ingest.process.is_alive():
+                # the plot keeps the last samples of the device, the process and its shared memory are released
+                del self.connections[device_name]
+                self.image_widget.remove_shared_source(device_name)
+                ingest.stop()
+                self.control_widget.remove_device(device_name)
+                event_bus.publish(ErrorEvent(f"connection to {device_name} was lost"))
+
+    def add_data_batch(self, event: DataBatchEvent) -> None:
+        """
+        adds a batch of samples from a plot thread to the animations, and counts its size for the allocation rate.
+        :param event: the data batch event published by a plot thread
+        :return: None
+        """
+        memory_tracker.record_allocation(self.module_name, event.x.nbytes + event.y.nbytes)
+        self.image_widget.update_animation_data(event.name, event.x, event.y)
+
+    def update_memory_usage(self) -> None:
+        """
+        shows the memory held by the buffers of the animations, its high-water mark and the rate at which data
+        arrives from the devices.
+        :return: None
+        """
+        total = self.image_widget.get_animation_memory_usage()
+        memory_tracker.update(self.module_name, total)
+        self.sidebar_widget.set_memory_usage(f"{format_bytes(total)} (peak "
+                                             f"{format_bytes(memory_tracker.get_peak(self.module_name))}), "
+                                             f"{format_bytes(memory_tracker.get_allocation_rate(self.module_name))}/s")
+
+    def update_status(self, event: StatusEvent) -> None:
+        """
+        shows a status change of a device in the image widget.
+        :param event: the status event published by a plot thread
+        :return: None
+        """
+        if event.key == "heart_rate":
+            self.image_widget.update_heart_rate(event.name, event.value)
 
     def open_connection_dialog(self) -> None:
         """
@@ -55,21 +141,32 @@ class ConnectionModule(AbstractModule):
         :param dialog: the dialog that holds the settings such as ip and port
         :return: None
         """
-        ip_address = dialog.ip_line_edit.text()
-        port = dialog.port_edit.text()
+        self.connect_internet(dialog.ip_line_edit.text(), dialog.port_edit.text())
+
+    def connect_internet(self, ip_address: str, port: str) -> bool:
+        """
+        connects to a device over the network
+        :param ip_address: the ip address of the device
+        :param port: the port of the device
+        :return: whether the connection was made, or is being made by an ingest process
+        """
         device_name = ip_address + ":" + port
 
         if device_name in self.connections:
             ErrorDialog("Already connected to this device")
-            return
+            return False
+        config = {"type": "internet", "ip": ip_address, "port": port}
+        if settings_store.get("process-ingest"):
+            return self.start_ingest(device_name, config)
         # set up the connection
         connection = InternetConnection(ip_address, port)
         # try to connect to it
         if not connection.connect():
             ErrorDialog(f"failed to connect to {ip_address}:{port}")
-            return
+            return False
         # on success
-        self.add_connection(device_name, connection)
+        self.add_connection(device_name, connection, config)
+        return True
 
     def create_serial_connection(self, dialog) -> None:
         """
@@ -77,21 +174,32 @@ class ConnectionModule(AbstractModule):
         :param dialog: the dialog that holds the settings such as port and baud rate
         :return: None
         """
-        port = dialog.serial_port_box.currentText()
-        baud_rate = dialog.baud_rate_box.currentText()
+        self.connect_serial(dialog.serial_port_box.currentText(), dialog.baud_rate_box.currentText())
+
+    def connect_serial(self, port: str, baud_rate: str) -> bool:
+        """
+        connects to a serial device
+        :param port: the serial port of the device
+        :param baud_rate: the baud rate of the device
+        :return: whether the connection was made, or is being made by an ingest process
+        """
         device_name = port
 
         if device_name in self.connections:
             ErrorDialog("Already connected to this device")
-            return
+            return False
+        config = {"type": "serial", "port": port, "baud_rate": baud_rate}
+        if settings_store.get("process-ingest"):
+            return self.start_ingest(device_name, config)
         # set up the connection
         connection = SerialConnection(port, baud_rate)
         # try to connect to it
         if not connection.connect():
             ErrorDialog(f"failed to connect to {port} with baudrate {baud_rate}")
-            return
+            return False
         # on success
-        self.add_connection(device_name, connection)
+        self.add_connection(device_name, connection, config)
+        return True
 
     def refresh_on_close_callback(self, dialog) -> None:
         """
@@ -102,43 +210,154 @@ class ConnectionModule(AbstractModule):
         dialog.close()
         self.control_widget.refresh_device_list()
 
-    def add_connection(self, device_name: str, connection: AbstractConnection) -> None:
+    def add_connection(self, device_name: str, connection: AbstractConnection, config: dict = None) -> None:
         """
         Creates a thread that reads from the connection and adds the connection to the connections list.
         :param device_name: the name of the device
         :param connection: the connection object itself
+        :param config: the settings the connection was made with, so it can be made again when a session is restored
         :return: None
         """
-        # create a new thread for that connection:
-        thread = PlotThread(connection, self.data_manager, self.image_widget, self.control_widget, sample_rate=0.01)
+        # the sampling frequency of the device is needed for the beat detection and the rms envelope
+        thread = PlotThread(connection, self.data_manager, self.control_widget, sample_rate=0.01,
+                            sampling_frequency=settings_store.get("sampling-frequency"),
+                            rms_window=settings_store.get("rolling-window"))
         thread.start()
         # on success:
         self.connections[device_name] = {
             'connection': connection,
-            'thread': thread
+            'thread': thread,
+            'ingest': None,
+            'config': config,
+            'connected': True,
+            'options': None
         }
         self.control_widget.add_device(device_name)  # add to device list the control manager
         self.control_widget.refresh_device_list()  # refresh the device list
 
+    def start_ingest(self, device_name: str, config: dict) -> bool:
+        """
+        starts reading a device in a separate process, which writes the samples to shared memory that the image
+        widget plots directly. The process connects in the background, check_ingest_connections adds the device once
+        it is connected.
+        :param device_name: the name of the device
+        :param config: the settings of the connection
+        :return: True, failures to connect are reported on the event bus
+        """
+        ingest = ProcessIngest(device_name, config, settings_store.get("sampling-frequency"),
+                               settings_store.get("rolling-window"))
+        ingest.start()
+        self.connections[device_name] = {
+            'connection': None,
+            'thread': None,
+            'ingest': ingest,
+            'config': config,
+            'connected': False,
+            'started': time.perf_counter(),
+            'options': None     # the options to switch on once connected, for devices of a restored session
+        }
+        return True
+
+    def add_ingest_device(self, device_name: str, ingest: ProcessIngest, options: Union[dict, None]) -> None:
+        """
+        adds a device whose ingest process connected to the device list and the image widget. The options of the
+        device are passed to the process when their checkboxes change.
+        :param device_name: the name of the device
+        :param ingest: the ingest process of the device
+        :param options: which options to switch on, as stored in a session, or None to leave them off
+        :return: None
+        """
+        self.control_widget.add_device(device_name)
+        device = self.control_widget.get_device(device_name)
+        device.checkbox.toggled.connect(lambda checked: ingest.set_option(SharedStatus.ACTIVE, checked))
+        device.beats_checkbox.toggled.connect(lambda checked: ingest.set_option(SharedStatus.BEATS, checked))
+        device.rms_checkbox.toggled.connect(lambda checked: ingest.set_option(SharedStatus.RMS, checked))
+        self.image_widget.add_shared_source(device_name, ingest)
+        if options is not None:
+            self.set_device_options(device_name, options)
+        self.control_widget.refresh_device_list()
+
+    def set_device_options(self, device_name: str, options: dict) -> None:
+        """
+        switches the options of a device on or off.
+        :param device_name: the name of the device
+        :param options: whether the device is active, detects beats and computes the rms envelope
+        :return: None
+        """
+        device = self.control_widget.get_device(device_name)
+        device.checkbox.setChecked(options["active"])
+        device.beats_checkbox.setChecked(options["beats"])
+        device.rms_checkbox.setChecked(options["rms"])
+
+    def get_session_state(self) -> dict:
+        """
+        :return: the settings of the connected devices and which of their options are switched on
+        """
+        devices = []
+        for device_name, resources in self.connections.items():
+            if resources['config'] is None:
+                continue
+            if not resources['connected']:
+                # an ingest process that is still connecting keeps the options it should switch on
+                options = resources['options'] or {"active": False, "beats": False, "rms": False}
+                devices.append({**resources['config'], **options})
+                continue
+            device = self.control_widget.get_device(device_name)
+            devices.append({**resources['config'], "active": device.is_active(),
+                            "beats": device.is_detecting_beats(), "rms": device.is_computing_rms()})
+        return {"devices": devices}
+
+    def restore_session_state(self, state: dict) -> None:
+        """
+        connects to the devices of a restored session again and switches their options on as they were.
+        :param state: the state returned by get_session_state
+        :return: None
+        """
+        for config in state.get("devices", []):
+            if config["type"] == "internet":
+                device_name = config["ip"] + ":" + config["port"]
+                connected = device_name in self.connections or self.connect_internet(config["ip"], config["port"])
+            else:
+                device_name = config["port"]
+                connected = device_name in self.connections or self.connect_serial(config["port"], config["baud_rate"])
+            if not connected:
+                continue
+            options = {key: config[key] for key in ("active", "beats", "rms")}
+            if self.connections[device_name]['connected']:
+                self.set_device_options(device_name, options)
+            else:
+                self.connections[device_name]['options'] = options
+
     def stop_thread(self):
+        self.ingest_timer.stop()
         for device_name, resources in self.connections.items():
+            if resources['ingest'] is not None:
+                # the animations keep a copy of the samples before the shared memory is released
+                self.image_widget.remove_shared_source(device_name)
+                resources['ingest'].stop()
+                continue
             resources['connection'].close()
             resources['thread'].stop()
 
 
 class PlotThread(threading.Thread):
     """
-    A thread that will read data from a connection and plot it in the image widget.
+    A thread that will read data from a connection and publish it on the event bus, so it is plotted in the image
+    widget by the GUI thread.
     """
-    def __init__(self, connection, data_manager, image_widget, control_widget, sample_rate=1.0):
+    def __init__(self, connection, data_manager, control_widget, sample_rate=1.0,
+                 sampling_frequency=1000.0, rms_window=0.1):
         super().__init__()
         self._running = True
         self.lock = threading.Lock()
         self.data_manager: DataManager = data_manager
-        self.image_widget: MatPlotLibImageWidget = image_widget
         self.control_widget = control_widget
         self.connection = connection
         self.sample_rate = sample_rate
+        self.sampling_frequency = sampling_frequency
+        self.peak_detector: Union[cm.StreamingPeakDetector, None] = None
+        self.rms_window = max(1, int(rms_window * sampling_frequency))
+        self.rolling_stats: Union[cm.StreamingRollingStats, None] = None
 
     def run(self) -> None:
         """
@@ -148,8 +367,8 @@ class PlotThread(threading.Thread):
         while self._running:
             # check if the device is still connected
             if not self.connection.connected:
-                ErrorDialog(f"connection to {self.connection.device_name} was lost")
-                self.stop()
+                event_bus.publish(ErrorEvent(f"connection to {self.connection.device_name} was lost"))
+                self._running = False
                 return
             data_buffer = []  # Buffer data for this connection
             data = self.connection.read_data()
@@ -164,7 +383,7 @@ class PlotThread(threading.Thread):
 
     def plot_data(self, data_buffer, device_name) -> None:
         """
-        plot data from the buffer, by parsing the points and creating a dataframe out of it.
+        plot data from the buffer, by parsing the points and publishing them as a data batch.
         :param data_buffer: the buffer that holds the data points
         :param device_name: the name of the device, which will also be the name of the animation in the image widget
         :return: None
@@ -179,7 +398,57 @@ class PlotThread(threading.Thread):
                     continue
         if data_list:
             pd_data = pd.DataFrame(data_list)
-            self.image_widget.update_animation_data(device_name, pd_data)
+            event_bus.publish(DataBatchEvent(device_name, cm.df_column_to_numpy(pd_data, 0),
+                                             cm.df_column_to_numpy(pd_data, 1)))
+            with self.lock:
+                self.detect_beats(pd_data, device_name)
+                self.compute_rms(pd_data, device_name)
+
+    def set_stream_settings(self, sampling_frequency: float, rms_window: float) -> None:
+        """
+        changes the sampling frequency and rms window while the thread runs. The beat detector and rolling statistics
+        start over with the new settings. This is called from the GUI thread.
+        :param sampling_frequency: the sampling frequency of the device in Hz
+        :param rms_window: the length of the rms window in seconds
+        :return: None
+        """
+        with self.lock:
+            self.sampling_frequency = sampling_frequency
+            self.rms_window = max(1, int(rms_window * sampling_frequency))
+            self.peak_detector = None
+            self.rolling_stats = None
+
+    def detect_beats(self, data, device_name) -> None:
+        """
+        feeds the new samples to the beat detector if beat detection is enabled for the device, and passes the current
+        heart rate on the event bus.
+        :param data: the dataframe containing the newly obtained data from the connection
+        :param device_name: the name of the device, which will also be the name of the animation in the image widget
+        :return: None
+        """
+        if not self.control_widget.get_device(device_name).is_detecting_beats():
+            self.peak_detector = None  # start with a fresh state when detection is enabled again
+            return
+        if self.peak_detector is None:
+            self.peak_detector = cm.StreamingPeakDetector(self.sampling_frequency)
+        self.peak_detector.process(cm.df_column_to_numpy(data, 1))
+        event_bus.publish(StatusEvent(device_name, "heart_rate", self.peak_detector.heart_rate))
+
+    def compute_rms(self, data, device_name) -> None:
+        """
+        feeds the new samples to the rolling statistics if the rms envelope is enabled for the device, and plots the
+        envelope as a separate animation.
+        :param data: the dataframe containing the newly obtained data from the connection
+        :param device_name: the name of the device, the envelope is plotted as "device_name rms"
+        :return: None
+        """
+        if not self.control_widget.get_device(device_name).is_computing_rms():
+            self.rolling_stats = None  # start with a fresh window when the envelope is enabled again
+            return
+        if self.rolling_stats is None:
+            self.rolling_stats = cm.StreamingRollingStats(self.rms_window, statistics=("rms",))
+        rms = self.rolling_stats.process(cm.df_column_to_numpy(data, 1))["rms"]
+        event_bus.publish(DataBatchEvent(f"{device_name} rms", cm.df_column_to_numpy(data, 0), rms))
 
     def stop(self) -> None:
         """
@@ -0,0 +1,80 @@
+from typing import Callable, Union
+
+from PySide2.QtWidgets import QWidget, QPushButton
+
+from GUI.sidebar import SidebarWidget
+from modules.abstract_module import AbstractModule
+from startup import startup_timer
+
+
+class LazyModule:
+    """
+    Stands in for a module until it is toggled on for the first time. Until then only the sidebar widget of the module
+    exists, so the imports and widgets of the module, such as the VTK render window, do not slow down the startup.
+    The sidebar widget is handed to the module once it is created.
+    """
+    def __init__(self, module_name: str, create: Callable[[SidebarWidget], AbstractModule], can_load_data=True):
+        """
+        constructor for the lazy module
+        :param module_name: the name of the module shown in the sidebar
+        :param create: the function that imports and creates the module, using the given sidebar widget
+        :param can_load_data: whether the module can load data, which decides the look of the sidebar widget
+        """
+        self.module_name = module_name
+        self.create = create
+        self.sidebar_widget: SidebarWidget = SidebarWidget(module_name, can_load_data)
+        self.module: Union[AbstractModule, None] = None
+        # the state of a restored session, applied once the module is created
+        self.pending_session_state: Union[dict, None] = None
+
+    def load(self) -> AbstractModule:
+        """
+        creates the module the first time it is needed.
+        :return: the module
+        """
+        if self.module is None:
+            with startup_timer.measure(f"create the {self.module_name} module"):
+                self.module = self.create(self.sidebar_widget)
+            if self.pending_session_state is not None:
+                self.module.restore_session_state(self.pending_session_state)
+                self.pending_session_state = None
+        return self.module
+
+    def get_session_state(self) -> Union[dict, None]:
+        """
+        :return: the session state of the module, or the state that is still waiting for the module to be created.
+        None if the module was never used
+        """
+        if self.module is not None:
+            return self.module.get_session_state()
+        return self.pending_session_state
+
+    def restore_session_state(self, state: dict) -> None:
+        """
+        restores the state of a session in the module. A module that was not created yet is not created for this, the
+        state is applied once it is toggled on.
+        :param state: the state returned by get_session_state
+        :return: None
+        """
+        if self.module is not None:
+            self.module.restore_session_state(state)
+        else:
+            self.pending_session_state = state
+
+    def is_loaded(self) -> bool:
+        """
+        :return: whether the module was created already
+        """
+        return self.module is not None
+
+    def get_sidebar_widget(self) -> QWidget:
+        """
+        :return: the sidebar widget, which holds the dropdown button
+        """
+        return self.sidebar_widget.get_widget()
+
+    def get_toggle_button(self) -> QPushButton:
+        """
+        :return: The toggle button inside the sidebar widget
+        """
+        return self.sidebar_widget.get_toggle_button()
@@ -1,11 +1,11 @@
-import json
-
 from modules.abstract_module import AbstractModule
+from modules.module_registry import MPL_FILE_TYPES
 from GUI.image_widgets.MatPlotLib_image_widget import MatPlotLibImageWidget
 from GUI.control_widgets.matplotlib_control_widget import MatPlotLibControlWidget
 from GUI.popups import ErrorDialog
 
 from data_manager import Data
+from settings_store import settings_store
 
 import custom_math as cm
 
@@ -14,13 +14,13 @@ class MatPlotLibModule(AbstractModule):
     """
     Module to display 2-dimensional data.
     """
-    def __init__(self, data_manager):
-        self.allowed_file_types: list[str] = ["csv", "xlsx", "txt"]
+    def __init__(self, data_manager, sidebar_widget=None):
+        self.allowed_file_types: list[str] = MPL_FILE_TYPES
         self.module_name: str = "MPL"
         self.data_manager = data_manager
         self.image_widget: MatPlotLibImageWidget
         self.control_widget: MatPlotLibControlWidget
-        super().__init__(self.module_name, self.allowed_file_types)
+        super().__init__(self.module_name, self.allowed_file_types, sidebar_widget=sidebar_widget)
         self.setup()
 
     def setup(self):
@@ -41,6 +41,12 @@ class MatPlotLibModule(AbstractModule):
         self.control_widget.get_limit_button().clicked.connect(self.set_limit_callback())
         self.control_widget.get_filter_button().clicked.connect(self.set_filter_callback())
         self.control_widget.get_erase_button().clicked.connect(self.set_erase_callback())
+        self.control_widget.get_spectral_button().clicked.connect(self.set_spectral_callback())
+        self.control_widget.get_detect_events_button().clicked.connect(self.set_detect_events_callback())
+        self.control_widget.get_resample_button().clicked.connect(self.set_resample_callback())
+        self.control_widget.get_rolling_button().clicked.connect(self.set_rolling_callback())
+        self.control_widget.get_undo_button().clicked.connect(self.set_undo_callback())
+        self.control_widget.get_redo_button().clicked.connect(self.set_redo_callback())
 
     # callbacks:
     def set_title_callback(self):
@@ -106,6 +112,48 @@ class MatPlotLibModule(AbstractModule):
         """
         return lambda: self.image_widget.remove_from_plot(self.control_widget.get_choose_data_combo().currentText())
 
+    def set_spectral_callback(self):
+        """
+        computes the frequency content of data by calling the spectral_analysis method in this class.
+        :return:
+        """
+        return lambda: self.spectral_analysis()
+
+    def set_detect_events_callback(self):
+        """
+        detects R-peaks in the data by calling the detect_events method in this class.
+        :return:
+        """
+        return lambda: self.detect_events()
+
+    def set_resample_callback(self):
+        """
+        resamples data by calling the resample method in this class.
+        :return:
+        """
+        return lambda: self.resample()
+
+    def set_rolling_callback(self):
+        """
+        computes a rolling statistic of data by calling the rolling_statistics method in this class.
+        :return:
+        """
+        return lambda: self.rolling_statistics()
+
+    def set_undo_callback(self):
+        """
+        reverts the last operation on the selected data by calling the undo method in this class.
+        :return:
+        """
+        return lambda: self.undo()
+
+    def set_redo_callback(self):
+        """
+        applies the last reverted operation again by calling the redo method in this class.
+        :return:
+        """
+        return lambda: self.redo()
+
     # other functions
     def convolve(self) -> None:
         """
@@ -156,13 +204,10 @@ class MatPlotLibModule(AbstractModule):
             ErrorDialog("please fill in a valid number")
             return
         # limit the data
-        limited_data = cm.limit_data(data, min_value, max_value)
-        # change the data inside the DataManager for the selected file
-        self.data_manager.set_data_by_filename(df.filename, limited_data)
-        # remove the old plot and plot it again to update the values
-        if self.image_widget.is_plotted(filename):
-            self.image_widget.remove_from_plot(filename)
-            self.image_widget.plot(df)
+        limited_column = cm.limit_data(data, min_value, max_value)
+        # store the limited column as a new version of the selected file
+        self.data_manager.update_columns(filename, limited_column, "limit")
+        self.refresh_plot(df)
 
     def filter(self) -> None:
         """
@@ -177,32 +222,181 @@ class MatPlotLibModule(AbstractModule):
         filename = df.filename
         data = df.data
 
-        # grab the filter settings from the settings file
-        with open("settings.json", 'r') as f:
-            settings = json.load(f)
+        # grab the filter settings, which were validated when they were set
+        filter_type = settings_store.get("filter-type")
+        sampling_frequency = self.get_sampling_frequency(data)
+        filter_order = settings_store.get("filter-order")
+        cutoff_values = settings_store.get("filter-cutoff")
+        if filter_type in ("band", "stop"):
+            cutoff_values = cutoff_values or [0.2, 40.0]                # default cutoff = 0.2, 40.0
+            if len(cutoff_values) != 2:
+                ErrorDialog(f"a {filter_type} filter requires two cutoff frequencies")
+                return
+            filter_cutoff = tuple(cutoff_values)
+        else:
+            cutoff_values = cutoff_values or [0.2]                      # default cutoff = 0.2
+            if len(cutoff_values) != 1:
+                ErrorDialog(f"a {filter_type} filter requires a single cutoff frequency")
+                return
+            filter_cutoff = cutoff_values[0]
+        # apply the filter to the data, the cutoff has to be below the nyquist frequency of the sampling frequency
         try:
-            filter_type = settings.get("filter-type", "low")            # default filter type = low
-            sampling_frequency = float(settings.get("fs", 1000))        # default sampling frequency = 1000
-            filter_order = int(settings.get("filter-order", 5))         # default filter order = 5
-
-            if filter_type == "band":
-                cutoff_string = settings.get("filter-cutoff", "0.2, 40.0")  # default cutoff = 0.2, 40.0
-                cutoff_values = [float(c) for c in cutoff_string.split(",")]
-                if len(cutoff_values) != 2:
-                    raise ValueError("Bandpass filter requires two cutoff frequencies.")
-                lowcut, highcut = cutoff_values
-                filter_cutoff = (lowcut, highcut)
+            filtered_column = cm.filter_data(data, filter_type, filter_cutoff, sampling_frequency, filter_order)
+        except ValueError as e:
+            ErrorDialog(f"could not filter {filename} with a sampling frequency of {sampling_frequency:g} Hz: {e}")
+            return
+        # store the filtered column as a new version of the selected file
+        self.data_manager.update_columns(filename, filtered_column, "filter")
+        self.refresh_plot(df)
+
+
+    def spectral_analysis(self) -> None:
+        """
+        computes the power spectral density, spectrogram or band power of the selected data and adds the result as a
+        new file that is plotted.
+        :return:
+        """
+        df = self.data_manager.get_data_object_by_filename(self.control_widget.get_choose_data_combo().currentText())
+        if df is None:
+            ErrorDialog("please load a file")
+            return
+        analysis_type = self.control_widget.get_spectral_type_combo().currentText()
+
+        # grab the sampling frequency and segment length from the data and the settings
+        sampling_frequency = self.get_sampling_frequency(df.data)
+        nperseg = settings_store.get("spectral-segment-length")
+
+        try:
+            if analysis_type == "PSD":
+                result = cm.psd_data(df.data, sampling_frequency, nperseg)
+            elif analysis_type == "spectrogram":
+                result = cm.spectrogram_data(df.data, sampling_frequency, nperseg)
             else:
-                filter_cutoff = float(settings.get("filter-cutoff", 0.2))  # default cutoff = 0.2
-        except ValueError:
-            ErrorDialog("please fill in a number for the order, sampling frequency and cutoff")
+                result = cm.band_power_data(df.data, sampling_frequency, nperseg=nperseg)
+        except ValueError as e:
+            ErrorDialog(f"could not compute the {analysis_type} of {df.filename}: {e}")
+            return
+        # add the result to the data manager and the widgets, the data manager may add a copy number to the name
+        new_filename = self.data_manager.add_data(f"{df.filename}_{analysis_type.replace(' ', '_')}", result)
+        self.add_file_to_widgets(new_filename)
+        result_object = self.data_manager.get_data_object_by_filename(new_filename)
+        if analysis_type == "spectrogram":
+            self.image_widget.plot_spectrogram(result_object)
+        else:
+            self.image_widget.plot(result_object)
+
+    def detect_events(self) -> None:
+        """
+        detects R-peaks in all channels of the selected data and adds the event markers and heart rate as new columns.
+        :return:
+        """
+        df = self.data_manager.get_data_object_by_filename(self.control_widget.get_choose_data_combo().currentText())
+        if df is None:
+            ErrorDialog("please load a file")
+            return
+        filename = df.filename
+
+        # grab the sampling frequency from the data or the settings
+        sampling_frequency = self.get_sampling_frequency(df.data)
+
+        try:
+            event_columns = cm.detect_events_data(df.data, sampling_frequency)
+        except ValueError as e:
+            ErrorDialog(f"could not detect events in {filename}: {e}")
             return
-        # apply the filter to the data
-        filtered_data = cm.filter_data(data, filter_type, filter_cutoff, sampling_frequency, filter_order)
-        # change the data inside the DataManager for the selected file
-        self.data_manager.set_data_by_filename(df.filename, filtered_data)
-        # remove the old plot and plot if again to update the values
-        if self.image_widget.is_plotted(filename):
-            self.image_widget.remove_from_plot(filename)
-            self.image_widget.plot(df)
+        # store the new columns as a new version of the selected file
+        self.data_manager.update_columns(filename, event_columns, "detect R-peaks")
+        self.refresh_plot(df)
 
+    def resample(self) -> None:
+        """
+        resamples the selected data to the rate in the control panel and adds the result as a new file that is plotted.
+        :return:
+        """
+        df = self.data_manager.get_data_object_by_filename(self.control_widget.get_choose_data_combo().currentText())
+        if df is None:
+            ErrorDialog("please load a file")
+            return
+        try:
+            target_rate = float(self.control_widget.get_resample_rate_edit())
+            resampled_data = cm.resample_data(df.data, target_rate)
+        except ValueError as e:
+            ErrorDialog(f"could not resample {df.filename}: {e}")
+            return
+        new_filename = self.data_manager.add_data(f"{df.filename}_{target_rate:g}Hz", resampled_data)
+        self.add_file_to_widgets(new_filename)
+        self.image_widget.plot(self.data_manager.get_data_object_by_filename(new_filename))
+
+    def rolling_statistics(self) -> None:
+        """
+        computes the selected rolling statistic of the selected data and adds the result as a new file that is plotted.
+        :return:
+        """
+        df = self.data_manager.get_data_object_by_filename(self.control_widget.get_choose_data_combo().currentText())
+        if df is None:
+            ErrorDialog("please load a file")
+            return
+        statistic = self.control_widget.get_rolling_statistic_combo().currentText()
+
+        # grab the sampling frequency from the data and the percentile from the settings
+        percentile = settings_store.get("rolling-percentile")
+        sampling_frequency = self.get_sampling_frequency(df.data)
+        try:
+            window = float(self.control_widget.get_rolling_window_edit())
+            result = cm.rolling_statistics_data(df.data, window, sampling_frequency, statistic, percentile)
+        except ValueError as e:
+            ErrorDialog(f"could not compute the rolling {statistic} of {df.filename}: {e}")
+            return
+        new_filename = self.data_manager.add_data(f"{df.filename}_rolling_{statistic}", result)
+        self.add_file_to_widgets(new_filename)
+        self.image_widget.plot(self.data_manager.get_data_object_by_filename(new_filename))
+
+    @staticmethod
+    def get_sampling_frequency(data) -> float:
+        """
+        determines the sampling frequency of data. If estimating is switched on in the filter settings, it is estimated
+        from the x column when that holds numbers or times. Otherwise, such as for an x column that holds sample
+        numbers, the sampling frequency from the settings is used.
+        :param data: the DataFrame
+        :return: the sampling frequency
+        """
+        if settings_store.get("estimate-sampling-frequency"):
+            try:
+                return cm.estimate_sampling_rate(cm.df_column_to_numpy(data, 0))
+            except ValueError:
+                pass
+        return settings_store.get("sampling-frequency")
+
+    def undo(self) -> None:
+        """
+        reverts the last operation on the selected data.
+        :return:
+        """
+        df = self.data_manager.get_data_object_by_filename(self.control_widget.get_choose_data_combo().currentText())
+        if df is None:
+            ErrorDialog("please load a file")
+            return
+        if self.data_manager.undo(df.filename):
+            self.refresh_plot(df)
+
+    def redo(self) -> None:
+        """
+        applies the last reverted operation on the selected data again.
+        :return:
+        """
+        df = self.data_manager.get_data_object_by_filename(self.control_widget.get_choose_data_combo().currentText())
+        if df is None:
+            ErrorDialog("please load a file")
+            return
+        if self.data_manager.redo(df.filename):
+            self.refresh_plot(df)
+
+    def refresh_plot(self, data_object: Data) -> None:
+        """
+        removes the old plot of the data and plots it again to update the values.
+        :param data_object: the data object that changed
+        :return:
+        """
+        if self.image_widget.is_plotted(data_object.filename):
+            self.image_widget.remove_from_plot(data_object.filename)
+            self.image_widget.plot(data_object)
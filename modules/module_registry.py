@@ -0,0 +1,207 @@
+import importlib
+import json
+import os
+import sys
+from importlib.metadata import entry_points
+from typing import List, Dict, Union
+
+from data_manager import DataManager
+from GUI.sidebar import SidebarWidget
+from modules.abstract_module import AbstractModule
+from modules.lazy_module import LazyModule
+
+
+# the file types of the builtin modules, which the modules use as well, so the registry knows them without importing
+VTK_FILE_TYPES = ["vtk", "vtu", "vtp", "vti", "stl", "obj", "ply", "jpg", "jpeg", "png", "tif", "dicom", "nii",
+                  "nii.gz", "mhd", "DCM"]
+MPL_FILE_TYPES = ["csv", "xlsx", "txt"]
+
+# the modules that come with the application, in the order they are shown in the sidebar
+BUILTIN_MODULES = [
+    {"name": "VTK", "module": "modules.vtk_module", "class": "VTKModule", "allowed_file_types": VTK_FILE_TYPES},
+    {"name": "MPL", "module": "modules.matplotlib_module", "class": "MatPlotLibModule",
+     "allowed_file_types": MPL_FILE_TYPES},
+    {"name": "Realtime data", "module": "modules.connection_module", "class": "ConnectionModule",
+     "can_load_data": False, "has_image_widget": False, "requires": ["MPL"]},
+]
+
+
+class ModuleInfo:
+    """
+    The metadata of a module, which is known without importing the module itself.
+    """
+    def __init__(self, name: str, module: str, class_name: str, allowed_file_types: List[str] = None,
+                 can_load_data: bool = True, has_image_widget: bool = True, has_control_panel: bool = True,
+                 requires: List[str] = None, source: str = "builtin"):
+        """
+        constructor for the module info
+        :param name: the name of the module shown in the sidebar
+        :param module: the python module that holds the implementation, for example "modules.vtk_module"
+        :param class_name: the name of the AbstractModule subclass in that python module
+        :param allowed_file_types: the file types the module can load, without the dot
+        :param can_load_data: whether the module can load data
+        :param has_image_widget: whether the module has its own image widget
+        :param has_control_panel: whether the module has a control panel
+        :param requires: the names of the modules whose image widgets are passed to the constructor, in order
+        :param source: where the module was found: "builtin", the path of a manifest or an entry point
+        """
+        self.name = name
+        self.module = module
+        self.class_name = class_name
+        self.allowed_file_types = allowed_file_types or []
+        self.can_load_data = can_load_data
+        self.has_image_widget = has_image_widget
+        self.has_control_panel = has_control_panel
+        self.requires = requires or []
+        self.source = source
+
+    @staticmethod
+    def from_manifest(manifest: dict, source: str) -> 'ModuleInfo':
+        """
+        creates the module info from a manifest, which is a dictionary with the same keys as the constructor, except
+        that the class name is stored under "class".
+        :param manifest: the manifest
+        :param source: where the manifest was found
+        :return: the module info
+        """
+        missing = [key for key in ("name", "module", "class") if key not in manifest]
+        if missing:
+            raise ValueError(f"the manifest is missing {', '.join(missing)}")
+        return ModuleInfo(manifest["name"], manifest["module"], manifest["class"],
+                          allowed_file_types=manifest.get("allowed_file_types"),
+                          can_load_data=manifest.get("can_load_data", True),
+                          has_image_widget=manifest.get("has_image_widget", True),
+                          has_control_panel=manifest.get("has_control_panel", True),
+                          requires=manifest.get("requires"),
+                          source=source)
+
+    def accepts_file(self, filename: str) -> bool:
+        """
+        :param filename: the name of a file
+        :return: whether the module can load the file, based on its extension
+        """
+        return self.can_load_data and any(filename.lower().endswith("." + file_type.lower())
+                                          for file_type in self.allowed_file_types)
+
+
+class ModuleRegistry:
+    """
+    Keeps the modules of the application. Modules are registered with their metadata only; the implementation is
+    imported and constructed the first time the module is used, so many modules can be installed without slowing down
+    the startup. Next to the builtin modules, modules are discovered from JSON manifests in a plugin directory and
+    from the "intravision.modules" entry points of installed packages, which point to a manifest dictionary.
+    """
+    entry_point_group = "intravision.modules"
+
+    def __init__(self, data_manager: DataManager):
+        self.data_manager = data_manager
+        self.module_infos: Dict[str, ModuleInfo] = {}
+        self.lazy_modules: Dict[str, LazyModule] = {}
+
+    def register(self, info: ModuleInfo) -> None:
+        """
+        registers a module, a module with the same name is replaced.
+        :param info: the metadata of the module
+        :return: None
+        """
+        self.module_infos[info.name] = info
+        self.lazy_modules[info.name] = LazyModule(info.name, lambda sidebar_widget: self.create(info, sidebar_widget),
+                                                  info.can_load_data)
+
+    def discover(self, plugin_directory: str = "plugins") -> List[str]:
+        """
+        registers the builtin modules and the modules found in the plugin directory and the entry points.
+        :param plugin_directory: the directory with the manifests, which is also where the plugins are imported from
+        :return: an error message for every module that could not be registered
+        """
+        errors = []
+        for manifest in BUILTIN_MODULES:
+            self.register(ModuleInfo.from_manifest(manifest, "builtin"))
+
+        # plugin directory with a JSON manifest per module
+        if os.path.isdir(plugin_directory):
+            if os.path.abspath(plugin_directory) not in sys.path:
+                sys.path.append(os.path.abspath(plugin_directory))
+            for entry in sorted(os.scandir(plugin_directory), key=lambda entry: entry.name):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    with open(entry.path) as f:
+                        self.register(ModuleInfo.from_manifest(json.load(f), entry.path))
+                except (OSError, ValueError) as e:
+                    errors.append(f"{entry.path}: {e}")
+
+        # entry points of installed packages
+        all_entry_points = entry_points()
+        if hasattr(all_entry_points, "select"):
+            group = all_entry_points.select(group=self.entry_point_group)
+        else:
+            group = all_entry_points.get(self.entry_point_group, [])  # python 3.9
+        for entry_point in group:
+            try:
+                self.register(ModuleInfo.from_manifest(entry_point.load(), f"entry point {entry_point.value}"))
+            except Exception as e:
+                errors.append(f"entry point {entry_point.name}: {e}")
+        return errors
+
+    def create(self, info: ModuleInfo, sidebar_widget: SidebarWidget) -> AbstractModule:
+        """
+        imports and constructs a module. The modules it requires are loaded first.
+        :param info: the metadata of the module
+        :param sidebar_widget: the sidebar widget that was created for the module at startup
+        :return: the module
+        :raises ImportError: if the module or a module it requires cannot be imported
+        :raises TypeError: if the class is not an AbstractModule or does not accept the arguments of a module
+        """
+        try:
+            module_class = getattr(importlib.import_module(info.module), info.class_name)
+        except AttributeError:
+            raise ImportError(f"{info.module} has no class {info.class_name}")
+        if not isinstance(module_class, type) or not issubclass(module_class, AbstractModule):
+            raise TypeError(f"{info.module}.{info.class_name} is not an AbstractModule")
+        missing = [name for name in info.requires if name not in self.lazy_modules]
+        if missing:
+            raise ImportError(f"{info.name} requires {', '.join(missing)}, which is not installed")
+        required_widgets = [self.load(name).image_widget for name in info.requires]
+        return module_class(self.data_manager, *required_widgets, sidebar_widget=sidebar_widget)
+
+    def load(self, name: str) -> AbstractModule:
+        """
+        :param name: the name of the module
+        :return: the module, which is created if that did not happen yet
+        """
+        return self.lazy_modules[name].load()
+
+    def get_lazy_modules(self) -> List[LazyModule]:
+        """
+        :return: the modules in the order they were registered, most of them not created yet
+        """
+        return list(self.lazy_modules.values())
+
+    def get_loaded_modules(self) -> List[AbstractModule]:
+        """
+        :return: the modules that were created
+        """
+        return [lazy_module.module for lazy_module in self.lazy_modules.values() if lazy_module.is_loaded()]
+
+    def find_modules_for_file(self, filename: str) -> List[ModuleInfo]:
+        """
+        finds the modules that can load a file, without importing any of them.
+        :param filename: the name of the file
+        :return: the metadata of the modules that accept the file
+        """
+        return [info for info in self.module_infos.values() if info.accepts_file(filename)]
+
+    def get_file_types(self) -> List[str]:
+        """
+        :return: the file types that any of the modules can load, without the dot
+        """
+        return sorted({file_type.lower() for info in self.module_infos.values() if info.can_load_data
+                       for file_type in info.allowed_file_types})
+
+    def get_module_info(self, name: str) -> Union[ModuleInfo, None]:
+        """
+        :param name: the name of the module
+        :return: the metadata of the module, or None if it is not registered
+        """
+        return self.module_infos.get(name)
@@ -1,25 +1,28 @@
+import os
 from typing import Callable
 
 from PySide2.QtWidgets import QFileDialog
 
-from GUI.popups import ErrorDialog
+from GUI.popups import ErrorDialog, InfoDialog
 from modules.abstract_module import AbstractModule
+from modules.module_registry import VTK_FILE_TYPES
 from GUI.control_widgets.VTK_control_widget import VTKControlWidget
 from GUI.image_widgets.VTK_image_widget import VTKImageWidget
+from offscreen_renderer import find_datasets, render_snapshots
 
 
 class VTKModule(AbstractModule):
     """
     Module to display volumetric data.
     """
-    def __init__(self, data_manager):
-        self.allowed_file_types: list[str] = ["vtk", "vtu", "vtp", "vti", "stl", "obj", "ply", "jpg", "jpeg",
-                                              "png", "tif", "dicom", "nii", "nii.gz", "mhd", "DCM"]
+    def __init__(self, data_manager, sidebar_widget=None):
+        self.allowed_file_types: list[str] = VTK_FILE_TYPES
         self.module_name: str = "VTK"
         self.data_manager = data_manager
         self.image_widget: VTKImageWidget
         self.control_widget: VTKControlWidget
-        super().__init__(self.module_name, self.allowed_file_types)
+        self.snapshot_dialog = None     # keeps the non-blocking info dialog open
+        super().__init__(self.module_name, self.allowed_file_types, sidebar_widget=sidebar_widget)
         self.setup()
 
     def setup(self) -> None:
@@ -41,6 +44,21 @@ class VTKModule(AbstractModule):
         self.control_widget.get_open_dicom_directory_button().clicked.connect(self.set_open_dicom_directory_callback())
         self.control_widget.get_plot_volume_button().clicked.connect(self.set_plot_volume_callback())
         self.control_widget.get_erase_volume_button().clicked.connect(self.set_erase_volume_callback())
+        self.control_widget.get_lod_checkbox().toggled.connect(self.set_lod_callback())
+        self.control_widget.get_frame_rate_button().clicked.connect(self.set_frame_rate_callback())
+        self.control_widget.get_isosurface_button().clicked.connect(self.set_isosurface_callback())
+        self.image_widget.pipeline_signals.progress.connect(self.control_widget.set_progress)
+        self.control_widget.get_transfer_function_combo().currentTextChanged.connect(
+            self.set_transfer_function_callback())
+        self.control_widget.get_roi_checkbox().toggled.connect(self.set_roi_callback())
+        self.control_widget.get_crop_button().clicked.connect(self.set_crop_callback())
+        self.control_widget.get_clip_button().clicked.connect(self.set_clip_callback())
+        self.control_widget.get_reset_roi_button().clicked.connect(self.set_reset_roi_callback())
+        self.control_widget.get_reslice_button().clicked.connect(self.set_reslice_callback())
+        self.control_widget.get_export_button().clicked.connect(self.set_export_callback())
+        self.control_widget.get_erase_slices_button().clicked.connect(self.set_erase_slices_callback())
+        for orientation in ("axial", "coronal", "sagittal"):
+            self.control_widget.get_slice_slider(orientation).valueChanged.connect(self.set_slice_callback(orientation))
 
     def set_plot_callback(self) -> Callable[[], None]:
         """
@@ -117,6 +135,95 @@ class VTKModule(AbstractModule):
         """
         return lambda: self.image_widget.remove_from_plot(self.control_widget.get_dicom_combo().currentText())
 
+    def set_lod_callback(self) -> Callable[[bool], None]:
+        """
+        enables or disables the level of detail for meshes that are plotted afterwards.
+        :return:
+        """
+        return lambda checked: setattr(self.image_widget, "lod_enabled", checked)
+
+    def set_frame_rate_callback(self) -> Callable[[], None]:
+        """
+        sets the frame rate target by calling the set_frame_rate method in this class.
+        :return:
+        """
+        return lambda: self.set_frame_rate()
+
+    def set_isosurface_callback(self) -> Callable[[], None]:
+        """
+        extracts an isosurface by calling the extract_isosurface method in this class.
+        :return:
+        """
+        return lambda: self.extract_isosurface()
+
+    def set_roi_callback(self) -> Callable[[bool], None]:
+        """
+        shows or hides the region of interest by calling the toggle_roi method in this class.
+        :return:
+        """
+        return lambda checked: self.toggle_roi(checked)
+
+    def set_crop_callback(self) -> Callable[[], None]:
+        """
+        crops the selected volume by calling the crop_volume method in the image widget.
+        :return:
+        """
+        return lambda: self.image_widget.crop_volume(self.control_widget.get_dicom_combo().currentText(),
+                                                     self.get_selected_volume())
+
+    def set_clip_callback(self) -> Callable[[], None]:
+        """
+        clips the selected volume by calling the clip_volume method in the image widget.
+        :return:
+        """
+        return lambda: self.image_widget.clip_volume(self.control_widget.get_dicom_combo().currentText())
+
+    def set_reset_roi_callback(self) -> Callable[[], None]:
+        """
+        removes the cropping and clipping of the selected volume by calling the reset_roi method in the image widget.
+        :return:
+        """
+        return lambda: self.image_widget.reset_roi(self.control_widget.get_dicom_combo().currentText(),
+                                                   self.get_selected_volume())
+
+    def set_export_callback(self) -> Callable[[], None]:
+        """
+        renders snapshots of a directory of datasets by calling the export_snapshots method in this class.
+        :return:
+        """
+        return lambda: self.export_snapshots()
+
+    def set_reslice_callback(self) -> Callable[[], None]:
+        """
+        shows the slice views by calling the plot_slices method in this class.
+        :return:
+        """
+        return lambda: self.plot_slices()
+
+    def set_erase_slices_callback(self) -> Callable[[], None]:
+        """
+        removes the slice views by calling the remove_slices method in this class.
+        :return:
+        """
+        return lambda: self.remove_slices()
+
+    def set_slice_callback(self, orientation: str) -> Callable[[int], None]:
+        """
+        moves a slice view to the slice selected with its slider by calling the set_slice method in the image widget.
+        :param orientation: "axial", "coronal" or "sagittal"
+        :return:
+        """
+        return lambda index: self.image_widget.set_slice(orientation, index)
+
+    def set_transfer_function_callback(self) -> Callable[[str], None]:
+        """
+        switches the selected volume to another transfer function preset by calling the set_transfer_function_preset
+        method in the image widget.
+        :return:
+        """
+        return lambda preset: self.image_widget.set_transfer_function_preset(
+            self.control_widget.get_dicom_combo().currentText(), preset)
+
     # normal function
 
     def set_opacity(self) -> None:
@@ -128,6 +235,21 @@ class VTKModule(AbstractModule):
         filename = self.control_widget.get_choose_data_combo().currentText()
         self.image_widget.set_mesh_opacity(filename, opacity)
 
+    def set_frame_rate(self) -> None:
+        """
+        sets the frame rate that the image widget should reach while the camera is moving.
+        :return:
+        """
+        try:
+            frame_rate = float(self.control_widget.get_frame_rate_edit())
+        except ValueError:
+            ErrorDialog("please fill in a valid frame rate")
+            return
+        if frame_rate <= 0:
+            ErrorDialog("the frame rate should be larger than 0")
+            return
+        self.image_widget.set_target_frame_rate(frame_rate)
+
     def open_dicom_dialog(self) -> None:
         """
         loads a directory into the DataManager
@@ -145,8 +267,141 @@ class VTKModule(AbstractModule):
         :return:
         """
         file = self.control_widget.get_dicom_combo().currentText()
+        if not file:
+            ErrorDialog("load a dicom directory and select it")
+            return
+        self.image_widget.plot_volume(self.data_manager.get_data_object_by_filename(file))
+
+    def get_selected_volume(self):
+        """
+        :return: the volume selected in the dicom combo box, or None if there is none
+        """
+        data_object = self.data_manager.get_data_object_by_filename(self.control_widget.get_dicom_combo().currentText())
+        return data_object.data if data_object is not None else None
+
+    def toggle_roi(self, checked: bool) -> None:
+        """
+        shows the region of interest around the selected volume, or hides it.
+        :param checked: whether the region of interest should be shown
+        :return:
+        """
+        if not checked:
+            self.image_widget.hide_roi()
+            return
+        volume = self.get_selected_volume()
+        if volume is None:
+            ErrorDialog("load a dicom directory and select it")
+            self.control_widget.get_roi_checkbox().setChecked(False)
+            return
+        self.image_widget.show_roi(self.control_widget.get_dicom_combo().currentText(), volume.GetBounds())
+
+    def plot_slices(self) -> None:
+        """
+        shows the axial, coronal and sagittal slices of the selected volume and sets up the sliders to scroll through
+        them.
+        :return:
+        """
+        file = self.control_widget.get_dicom_combo().currentText()
         if not file:
             ErrorDialog("load a dicom directory and select it")
             return
         data = self.data_manager.get_data_object_by_filename(file).data
-        self.image_widget.plot_volume(data, file)
+        extent = self.image_widget.plot_slices(data, file)
+        self.control_widget.set_slice_ranges(extent)
+
+    def remove_slices(self) -> None:
+        """
+        removes the slice views and disables the sliders.
+        :return:
+        """
+        self.image_widget.remove_slices()
+        self.control_widget.set_slice_ranges(None)
+
+    def extract_isosurface(self) -> None:
+        """
+        extracts an isosurface from the selected volume in a background thread, like the other pipelines of the image
+        widget. Once it is done, the surface is added as a mesh to the DataManager and plotted.
+        :return:
+        """
+        volume_name = self.control_widget.get_dicom_combo().currentText()
+        if not volume_name:
+            ErrorDialog("load a dicom directory and select it")
+            return
+        try:
+            iso_value = float(self.control_widget.get_iso_value_edit())
+            sub_volume_text = self.control_widget.get_sub_volume_edit().strip()
+            extent = None
+            if sub_volume_text:
+                extent = tuple(int(value) for value in sub_volume_text.split(","))
+                if len(extent) != 6:
+                    raise ValueError("the sub-volume needs six voxel indices")
+        except ValueError as e:
+            ErrorDialog(f"please fill in a valid iso-value and sub-volume: {e}")
+            return
+        surface_name = f"{os.path.basename(volume_name)}_iso_{iso_value:g}" + (
+            "_" + "_".join(str(value) for value in extent) if extent is not None else "")
+        if surface_name in self.image_widget.pending_plots:
+            return  # this surface is being extracted already
+        self.image_widget.start_pipeline(
+            surface_name,
+            lambda report: {"surface": self.data_manager.extract_isosurface(volume_name, iso_value, extent, report)},
+            lambda name, result: self.add_isosurface(name, result["surface"]))
+
+    def add_isosurface(self, surface_name: str, surface) -> None:
+        """
+        adds an extracted isosurface as a mesh to the DataManager and plots it. If the same surface was extracted
+        before, the existing mesh is plotted instead.
+        :param surface_name: the name of the surface
+        :param surface: the surface as polydata
+        :return: None
+        """
+        # reuse the mesh if this surface is already loaded
+        data_object = self.data_manager.get_data_object_by_filename(surface_name)
+        if data_object is None or data_object.data is not surface:
+            surface_name = self.data_manager.add_data(surface_name, surface)
+            self.add_file_to_widgets(surface_name)
+        self.plot_data(self.image_widget, surface_name)
+
+    def export_snapshots(self) -> None:
+        """
+        renders a snapshot, or a turntable if a number of frames is filled in, of every dataset in a directory.
+        The datasets are rendered offscreen in a pool of processes, while the progress is shown in the control widget.
+        :return:
+        """
+        frames_text = self.control_widget.get_turntable_frames_edit().strip()
+        try:
+            turntable_frames = int(frames_text) if frames_text else 0
+        except ValueError:
+            ErrorDialog("please fill in a valid number of turntable frames")
+            return
+        input_directory = QFileDialog.getExistingDirectory(self.get_sidebar_widget(), "Directory with datasets")
+        if not input_directory:
+            return
+        output_directory = QFileDialog.getExistingDirectory(self.get_sidebar_widget(), "Directory for the snapshots")
+        if not output_directory:
+            return
+        paths = find_datasets(input_directory, self.allowed_file_types)
+        if not paths:
+            ErrorDialog(f"no datasets found in {input_directory}")
+            return
+        preset = self.control_widget.get_transfer_function_combo().currentText()
+        self.image_widget.start_pipeline(
+            "snapshots",
+            lambda report: render_snapshots(paths, output_directory, turntable_frames=turntable_frames,
+                                            preset=preset, report=report),
+            lambda name, results: self.report_snapshots(results, output_directory))
+
+    def report_snapshots(self, results: dict, output_directory: str) -> None:
+        """
+        shows how many images were written, and which datasets could not be rendered.
+        :param results: the written images, or the error message, for every dataset
+        :param output_directory: the directory the images were written to
+        :return:
+        """
+        failed = {path: error for path, error in results.items() if isinstance(error, str)}
+        images = sum(len(written) for written in results.values() if not isinstance(written, str))
+        if failed:
+            ErrorDialog(f"wrote {images} images to {output_directory}, but could not render:\n" +
+                        "\n".join(f"{os.path.basename(path)}: {error}" for path, error in failed.items()))
+        else:
+            self.snapshot_dialog = InfoDialog(f"wrote {images} images to {output_directory}")
@@ -0,0 +1,184 @@
+import ctypes
+import ctypes.util
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Tuple, Union, Callable
+
+from vtkmodules.vtkCommonColor import vtkNamedColors
+from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.vtkIOImage import vtkPNGWriter
+from vtkmodules.vtkRenderingCore import vtkRenderer, vtkRenderWindow, vtkWindowToImageFilter
+# importing these registers the OpenGL render window and volume mappers
+import vtkmodules.vtkRenderingOpenGL2  # noqa: F401
+import vtkmodules.vtkRenderingVolumeOpenGL2  # noqa: F401
+
+from data_manager import DataManager
+from folder_watcher import FolderWatcher
+from vtk_rendering import prepare_data, create_actor, build_volume_property, create_volume
+
+
+def use_software_rendering_without_display() -> None:
+    """
+    lets VTK render with its software OpenGL implementation (OSMesa) when there is no display to connect to, so the
+    renderer also works on headless machines. This has to be called before the first render window is created.
+    OSMesa is only chosen when its library can be loaded, otherwise VTK picks the window itself, such as EGL.
+    :return: None
+    """
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY") \
+            and is_osmesa_available():
+        os.environ.setdefault("VTK_DEFAULT_OPENGL_WINDOW", "vtkOSOpenGLRenderWindow")
+
+
+def is_osmesa_available() -> bool:
+    """
+    :return: whether the OSMesa library, which the software render window of VTK needs, can be loaded
+    """
+    library = ctypes.util.find_library("OSMesa")
+    if library is None:
+        return False
+    try:
+        ctypes.CDLL(library)
+    except OSError:
+        return False
+    return True
+
+
+def find_datasets(directory: str, extensions: List[str]) -> List[str]:
+    """
+    finds the datasets in a directory. Files with one of the extensions are datasets, and so are subdirectories with
+    DICOM files, which are read as DICOM series. Other subdirectories, such as the output directory, are skipped.
+    :param directory: the directory to search
+    :param extensions: the file extensions that can be rendered, without the dot
+    :return: the paths of the datasets, sorted by name
+    """
+    extensions = tuple("." + extension.lower() for extension in extensions)
+    datasets = []
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if entry.is_dir() and FolderWatcher.is_dicom_directory(entry.path) or \
+                entry.is_file() and entry.name.lower().endswith(extensions):
+            datasets.append(entry.path)
+    return datasets
+
+
+def load_dataset(path: str):
+    """
+    loads a dataset the same way the DataManager does. This runs in the worker processes, which have no
+    QApplication, so errors are raised and collected per dataset by render_snapshots instead of shown in a dialog.
+    :param path: the path to a file or a DICOM directory
+    :return: the data object
+    """
+    data_manager = DataManager()
+    if os.path.isdir(path):
+        data = data_manager.read_file(path)
+        filename = data_manager.add_data(path, data, path)
+    else:
+        data = data_manager.read_vtk_file(path, data_manager.get_extension(path))
+        filename = data_manager.add_data(os.path.basename(path), data)
+    return data_manager.get_data_object_by_filename(filename)
+
+
+def render_dataset(path: str, output_directory: str, size: Tuple[int, int] = (800, 600), turntable_frames: int = 0,
+                   preset: str = "default") -> List[str]:
+    """
+    renders a dataset in an offscreen render window and writes the images as png. Volumes are rendered with the
+    transfer functions of plot_volume, everything else with the actors of plot.
+    :param path: the path to a file or a DICOM directory
+    :param output_directory: the directory the images are written to
+    :param size: the width and height of the images in pixels
+    :param turntable_frames: the number of frames of a turntable around the dataset, 0 for a single snapshot
+    :param preset: the transfer function preset for volumes
+    :return: the paths of the written images
+    """
+    data_object = load_dataset(path)
+    data = data_object.data
+
+    renderer = vtkRenderer()
+    renderer.SetBackground(vtkNamedColors().GetColor3d('DimGray'))
+    render_window = vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(*size)
+    render_window.AddRenderer(renderer)
+
+    if isinstance(data, vtkImageData) and min(data.GetDimensions()) > 1:
+        volume_property = build_volume_property(data_object.get_volume_statistics(), preset)
+        renderer.AddVolume(create_volume(data, volume_property))
+    else:
+        prepared = prepare_data(data, lambda fraction: None)["data"]
+        renderer.AddActor(create_actor(prepared))
+    renderer.ResetCamera()
+
+    name = os.path.basename(os.path.normpath(path))
+    frames = max(turntable_frames, 1)
+    written = []
+    for frame in range(frames):
+        if frame > 0:
+            renderer.GetActiveCamera().Azimuth(360 / frames)
+        render_window.Render()
+        window_to_image = vtkWindowToImageFilter()
+        window_to_image.SetInput(render_window)
+        window_to_image.ReadFrontBufferOff()
+        window_to_image.Update()
+        if turntable_frames > 0:
+            image_path = os.path.join(output_directory, f"{name}_turntable_{frame:04d}.png")
+        else:
+            image_path = os.path.join(output_directory, f"{name}.png")
+        writer = vtkPNGWriter()
+        writer.SetFileName(image_path)
+        writer.SetInputConnection(window_to_image.GetOutputPort())
+        writer.Write()
+        # vtk only logs write errors, such as a missing output directory
+        if writer.GetErrorCode() != 0 or not os.path.exists(image_path):
+            raise OSError(f"could not write {image_path}")
+        written.append(image_path)
+    render_window.Finalize()
+    return written
+
+
+def render_snapshots(paths: List[str], output_directory: str, size: Tuple[int, int] = (800, 600),
+                     turntable_frames: int = 0, preset: str = "default", processes: Union[int, None] = None,
+                     report: Callable[[float], None] = lambda fraction: None) -> Dict[str, Union[List[str], str]]:
+    """
+    renders a list of datasets in a pool of processes, every process with its own offscreen render window.
+    The processes are spawned instead of forked, so they do not inherit the Qt and OpenGL state of the application.
+    :param paths: the paths to files or DICOM directories
+    :param output_directory: the directory the images are written to, it is created if it does not exist
+    :param size: the width and height of the images in pixels
+    :param turntable_frames: the number of frames of a turntable around every dataset, 0 for a single snapshot
+    :param preset: the transfer function preset for volumes
+    :param processes: the number of processes, None for the number of CPUs
+    :param report: the function to report the progress with, as a fraction between 0 and 1
+    :return: the written images for every path, or the error message if the dataset could not be rendered
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    results = {}
+    pending = list(paths)
+    processes = min(processes or os.cpu_count() or 1, len(paths) or 1)
+    isolated = False
+    while pending:
+        # after a render process crashed, the datasets that were not finished are rendered one per pool, so only the
+        # dataset that crashes its process fails
+        batch = pending[:1] if isolated else pending
+        unfinished = []
+        with ProcessPoolExecutor(max_workers=1 if isolated else processes,
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=use_software_rendering_without_display) as pool:
+            futures = {pool.submit(render_dataset, path, output_directory, size, turntable_frames, preset): path
+                       for path in batch}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except BrokenProcessPool:
+                    if not isolated:
+                        unfinished.append(path)
+                        continue
+                    results[path] = "the render process crashed"
+                except Exception as e:
+                    results[path] = str(e)
+                report(len(results) / len(paths))
+        pending = unfinished + pending[len(batch):]
+        isolated = isolated or bool(unfinished)
+    return results
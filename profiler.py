@@ -0,0 +1,224 @@
+import bisect
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Union
+
+
+class Histogram:
+    """
+    Histogram of durations with buckets that grow by a factor of two, from 10 microseconds up to 10 seconds. Recording
+    a value only increments a bucket, so the histogram has a fixed size however many values are recorded.
+    """
+    bounds: List[float] = [0.01 * 2 ** i for i in range(21)]    # upper bounds of the buckets in milliseconds
+
+    def __init__(self):
+        self.buckets: List[int] = [0] * (len(self.bounds) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.maximum: float = 0.0
+
+    def record(self, value: float) -> None:
+        """
+        adds a value to the histogram.
+        :param value: the duration in milliseconds
+        :return: None
+        """
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def percentile(self, q: float) -> float:
+        """
+        :param q: the percentile between 0 and 100
+        :return: the upper bound of the bucket that holds the percentile, or the maximum for the last bucket
+        """
+        if self.count == 0:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= target and bucket:
+                return min(self.bounds[index], self.maximum) if index < len(self.bounds) else self.maximum
+        return self.maximum
+
+    def get_statistics(self) -> dict:
+        """
+        :return: the count, mean, median, 95th percentile and maximum in milliseconds
+        """
+        return {"count": self.count,
+                "mean (ms)": self.total / self.count if self.count else 0.0,
+                "p50 (ms)": self.percentile(50),
+                "p95 (ms)": self.percentile(95),
+                "max (ms)": self.maximum}
+
+
+class Profiler:
+    """
+    Collects timers, counters and histograms for the hot paths of the application, such as loading data, the signal
+    processing in custom_math and drawing the plots. Profiling can be switched on and off while the application runs;
+    when it is off the instrumented code only checks a flag. Every measurement is also kept as a trace event, so the
+    last events can be exported as a Chrome trace and inspected in chrome://tracing or Perfetto.
+    """
+    def __init__(self, max_trace_events: int = 200000):
+        """
+        constructor for the profiler
+        :param max_trace_events: the number of trace events that are kept, older events are dropped
+        """
+        self.enabled: bool = False
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.trace_events: deque = deque(maxlen=max_trace_events)
+        self.thread_names: Dict[int, str] = {}
+        self.start: float = time.perf_counter()
+
+    def set_enabled(self, enabled: bool) -> None:
+        """
+        switches profiling on or off.
+        :param enabled: whether measurements should be recorded
+        :return: None
+        """
+        self.enabled = enabled
+
+    def reset(self) -> None:
+        """
+        removes everything that was recorded.
+        :return: None
+        """
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.trace_events.clear()
+
+    @contextmanager
+    def measure(self, name: str, category: str = "app") -> Iterator[None]:
+        """
+        context manager that records the duration of the code inside it.
+        :param name: the name of the timer
+        :param category: the category of the trace event, such as "data" or "plot"
+        :return: None
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_complete_event(name, category, start, time.perf_counter() - start)
+
+    def add_complete_event(self, name: str, category: str, start: float, duration: float) -> None:
+        """
+        records a duration that was measured elsewhere, such as the frame time of a render window.
+        :param name: the name of the timer
+        :param category: the category of the trace event
+        :param start: the start as a time.perf_counter() value
+        :param duration: the duration in seconds
+        :return: None
+        """
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].record(duration * 1000)
+            self.thread_names[thread.ident] = thread.name
+            self.trace_events.append({"name": name, "cat": category, "ph": "X",
+                                      "ts": (start - self.start) * 1e6, "dur": duration * 1e6,
+                                      "pid": os.getpid(), "tid": thread.ident})
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """
+        increases a counter, such as the number of samples that were received.
+        :param name: the name of the counter
+        :param amount: the amount to add
+        :return: None
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.trace_events.append({"name": name, "ph": "C", "ts": (time.perf_counter() - self.start) * 1e6,
+                                      "pid": os.getpid(), "args": {name: self.counters[name]}})
+
+    def get_statistics(self) -> Dict[str, Union[dict, int]]:
+        """
+        :return: the statistics of every timer and the value of every counter
+        """
+        with self.lock:
+            statistics = {name: histogram.get_statistics() for name, histogram in self.histograms.items()}
+            statistics.update(self.counters)
+        return statistics
+
+    def get_timer_totals(self) -> Dict[str, tuple]:
+        """
+        :return: the number of measurements and the total duration in milliseconds of every timer
+        """
+        with self.lock:
+            return {name: (histogram.count, histogram.total) for name, histogram in self.histograms.items()}
+
+    def export_chrome_trace(self, path: str) -> None:
+        """
+        writes the recorded trace events to a file in the Chrome trace event format.
+        :param path: the path of the JSON file
+        :return: None
+        """
+        with self.lock:
+            events = list(self.trace_events)
+            thread_names = dict(self.thread_names)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+                    for ident, name in thread_names.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+
+def get_memory_usage() -> int:
+    """
+    :return: the resident memory of the process in bytes, or the peak resident memory where the current value is not
+    available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:     # windows
+        return 0
+
+
+# the profiler of the application, it is off until it is switched on in the settings
+profiler = Profiler()
+
+
+def profiled(name: str, category: str = "app") -> Callable:
+    """
+    decorator that measures every call of a function with the profiler.
+    :param name: the name of the timer
+    :param category: the category of the trace event
+    :return: the decorator
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.add_complete_event(name, category, start, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+from datetime import datetime
+from typing import Dict, List, Union
+
+import numpy as np
+
+from data_manager import DataManager, Data
+from startup import lazy_import
+pd = lazy_import("pandas")
+vtk = lazy_import("vtk")
+
+# the XML writer and reader for every vtk data type that is not stored as raw voxels
+VTK_XML_FORMATS = {
+    "vtkPolyData": ("vtkXMLPolyDataWriter", "vtkXMLPolyDataReader"),
+    "vtkUnstructuredGrid": ("vtkXMLUnstructuredGridWriter", "vtkXMLUnstructuredGridReader"),
+    "vtkStructuredGrid": ("vtkXMLStructuredGridWriter", "vtkXMLStructuredGridReader"),
+    "vtkRectilinearGrid": ("vtkXMLRectilinearGridWriter", "vtkXMLRectilinearGridReader"),
+    "vtkImageData": ("vtkXMLImageDataWriter", "vtkXMLImageDataReader"),
+}
+
+
+def to_json_value(value):
+    """
+    :param value: a column label or another value from a DataFrame
+    :return: the value as a type that JSON can store
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class SessionWriter:
+    """
+    Writes a session to a single binary file: a JSON header with the metadata of every file in the DataManager and the
+    state of the modules, followed by the raw bytes of the arrays. Data that was read from a file and not changed since
+    is only referenced by its path, everything else is embedded. DataFrames are stored as their current version,
+    without the undo history.
+
+    The file starts with MAGIC, followed by the length of the header as an unsigned 64 bit little endian integer, the
+    header itself and the arrays, every array aligned to ALIGNMENT bytes.
+    """
+    MAGIC = b"IVSESSN\0"
+    VERSION = 1
+    ALIGNMENT = 64
+
+    def __init__(self, reference_files: bool = True):
+        """
+        constructor for the session writer
+        :param reference_files: whether unchanged data is referenced by the path of its file instead of embedded
+        """
+        self.reference_files = reference_files
+        self.blobs: List[Union[bytes, memoryview]] = []
+        self.size: int = 0
+
+    def add_blob(self, blob: Union[bytes, memoryview]) -> Dict[str, int]:
+        """
+        adds the bytes of an array to the session.
+        :param blob: the bytes
+        :return: the offset relative to the start of the arrays and the length of the blob
+        """
+        offset = -(-self.size // self.ALIGNMENT) * self.ALIGNMENT
+        if offset > self.size:
+            self.blobs.append(bytes(offset - self.size))
+        self.blobs.append(blob)
+        self.size = offset + len(blob)
+        return {"offset": offset, "length": len(blob)}
+
+    def add_array(self, values: np.ndarray) -> dict:
+        """
+        adds an array. Numeric arrays are stored as raw bytes, other arrays, such as strings, as a JSON list. Dates and
+        durations are stored as the raw bytes of their 64 bit integers, the header keeps their dtype.
+        :param values: the array
+        :return: the description of the array in the header
+        """
+        values = np.asarray(values)
+        if values.dtype.kind in "OUS":
+            blob = json.dumps([to_json_value(value) for value in values.tolist()]).encode("utf-8")
+            return {"dtype": "json", "shape": list(values.shape), **self.add_blob(blob)}
+        values = np.ascontiguousarray(values)
+        raw = values.view(np.int64) if values.dtype.kind in "Mm" else values
+        return {"dtype": values.dtype.str, "shape": list(values.shape),
+                **self.add_blob(memoryview(raw).cast("B"))}
+
+    def add_data(self, data_object: Data) -> Union[dict, None]:
+        """
+        adds a file of the DataManager to the session.
+        :param data_object: the data object
+        :return: the description of the data in the header, or None if the data cannot be stored
+        """
+        entry = {"filename": data_object.filename, "source": data_object.source_path}
+        unchanged = not data_object.modified and (data_object.history is None or
+                                                  data_object.history.current is data_object.history.root)
+        if self.reference_files and data_object.source_path is not None and unchanged \
+                and os.path.exists(data_object.source_path):
+            status = os.stat(data_object.source_path)
+            entry.update({"kind": "reference", "mtime": status.st_mtime_ns, "size": status.st_size})
+            return entry
+        data = data_object.data
+        if isinstance(data, pd.DataFrame):
+            entry["kind"] = "frame"
+            entry["columns"] = [{"label": to_json_value(label), **self.add_array(data[label].to_numpy())}
+                                for label in data.columns]
+            if isinstance(data.index, pd.RangeIndex):
+                entry["index"] = {"range": [data.index.start, data.index.stop, data.index.step]}
+            else:
+                entry["index"] = self.add_array(data.index.to_numpy())
+        elif isinstance(data, vtk.vtkImageData) and data.GetPointData().GetNumberOfArrays() == 1 \
+                and data.GetCellData().GetNumberOfArrays() == 0 and data.GetPointData().GetScalars() is not None:
+            # volumes are stored as raw voxels, so they are read back without parsing
+            from vtkmodules.util.numpy_support import vtk_to_numpy
+            scalars = data.GetPointData().GetScalars()
+            entry.update({"kind": "image", "dimensions": list(data.GetDimensions()), "spacing": list(data.GetSpacing()),
+                          "origin": list(data.GetOrigin()), "name": scalars.GetName(),
+                          "scalars": self.add_array(vtk_to_numpy(scalars))})
+        elif isinstance(data, vtk.vtkDataObject) and data.GetClassName() in VTK_XML_FORMATS:
+            writer = getattr(vtk, VTK_XML_FORMATS[data.GetClassName()][0])()
+            writer.SetInputData(data)
+            writer.SetDataModeToBinary()
+            writer.SetCompressorTypeToLZ4()
+            writer.WriteToOutputStringOn()
+            writer.Write()
+            entry.update({"kind": "vtk", "type": data.GetClassName(),
+                          "xml": self.add_blob(writer.GetOutputString().encode("ascii"))})
+        else:
+            return None
+        return entry
+
+    def write(self, path: str, data_manager: DataManager, module_states: Dict[str, dict]) -> None:
+        """
+        writes the session. The file is written next to the path first and then moved in place, so an existing
+        session is never left half written.
+        :param path: the path of the session file
+        :param data_manager: the data manager with the files of the session
+        :param module_states: the state of every module, keyed by the name of the module
+        :return: None
+        """
+        self.blobs = []
+        self.size = 0
+        entries = [self.add_data(data_object) for data_object in data_manager.loaded_data]
+        header = json.dumps({"version": self.VERSION, "created": datetime.now().isoformat(timespec="seconds"),
+                             "data": [entry for entry in entries if entry is not None],
+                             "modules": module_states}).encode("utf-8")
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            start = len(self.MAGIC) + 8 + len(header)
+            f.write(bytes(-start % self.ALIGNMENT))
+            for blob in self.blobs:
+                f.write(blob)
+        os.replace(temporary_path, path)
+
+
+class SessionReader:
+    """
+    Reads a session written by the SessionWriter. Opening a session only reads the header; the data of every file is
+    added to the DataManager as deferred data, which is read from the session or from the original file once it is
+    used.
+    """
+    def __init__(self, path: str):
+        """
+        constructor for the session reader, it reads the header of the session.
+        :param path: the path of the session file
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(SessionWriter.MAGIC)) != SessionWriter.MAGIC:
+                raise ValueError(f"{path} is not a session file")
+            header_length, = struct.unpack("<Q", f.read(8))
+            self.header: dict = json.loads(f.read(header_length).decode("utf-8"))
+            start = len(SessionWriter.MAGIC) + 8 + header_length
+            self.data_start: int = start + (-start % SessionWriter.ALIGNMENT)
+        if self.header.get("version") != SessionWriter.VERSION:
+            raise ValueError(f"{path} was written by an incompatible version")
+
+    def read_blob(self, blob: Dict[str, int]) -> bytes:
+        """
+        :param blob: the offset and length of the blob
+        :return: the bytes of the blob
+        """
+        with open(self.path, "rb") as f:
+            f.seek(self.data_start + blob["offset"])
+            return f.read(blob["length"])
+
+    def read_array(self, description: dict) -> np.ndarray:
+        """
+        :param description: the description of the array in the header
+        :return: the array
+        """
+        if description["dtype"] == "json":
+            return np.array(json.loads(self.read_blob(description).decode("utf-8")), dtype=object)
+        dtype = np.dtype(description["dtype"])
+        values = np.empty(description["shape"], dtype=np.int64 if dtype.kind in "Mm" else dtype)
+        with open(self.path, "rb") as f:
+            f.seek(self.data_start + description["offset"])
+            f.readinto(memoryview(values).cast("B"))
+        return values.view(dtype)
+
+    def read_data(self, entry: dict, data_manager: DataManager) -> Union[pd.DataFrame, vtk.vtkDataObject]:
+        """
+        reads the data of a file in the session.
+        :param entry: the description of the data in the header
+        :param data_manager: the data manager, whose readers are used for referenced files
+        :return: the data
+        """
+        if entry["kind"] == "reference":
+            status = os.stat(entry["source"])
+            if status.st_mtime_ns != entry["mtime"] or status.st_size != entry["size"]:
+                raise ValueError(f"{entry['source']} changed after the session was saved")
+            return data_manager.read_file(entry["source"])
+        if entry["kind"] == "frame":
+            if "range" in entry["index"]:
+                index = pd.RangeIndex(*entry["index"]["range"])
+            else:
+                index = pd.Index(self.read_array(entry["index"]))
+            return pd.DataFrame({column["label"]: self.read_array(column) for column in entry["columns"]},
+                                index=index)
+        if entry["kind"] == "image":
+            from vtkmodules.util.numpy_support import numpy_to_vtk
+            image = vtk.vtkImageData()
+            image.SetDimensions(*entry["dimensions"])
+            image.SetSpacing(*entry["spacing"])
+            image.SetOrigin(*entry["origin"])
+            scalars = numpy_to_vtk(self.read_array(entry["scalars"]), deep=True)
+            if entry["name"]:
+                scalars.SetName(entry["name"])
+            image.GetPointData().SetScalars(scalars)
+            return image
+        reader = getattr(vtk, VTK_XML_FORMATS[entry["type"]][1])()
+        reader.ReadFromInputStringOn()
+        reader.SetInputString(self.read_blob(entry["xml"]).decode("ascii"))
+        reader.Update()
+        return reader.GetOutput()
+
+    def restore_data(self, data_manager: DataManager) -> List[str]:
+        """
+        adds the files of the session to the DataManager without reading them. Files that are loaded already under
+        the same name are kept as they are.
+        :param data_manager: the data manager
+        :return: the names of the files that were added
+        """
+        added = []
+        for entry in self.header["data"]:
+            filename = data_manager.add_deferred_data(entry["filename"],
+                                                      lambda entry=entry: self.read_data(entry, data_manager),
+                                                      entry.get("source"), modified=entry["kind"] != "reference")
+            if filename is not None:
+                added.append(filename)
+        return added
+
+    def get_module_states(self) -> Dict[str, dict]:
+        """
+        :return: the state of every module in the session, keyed by the name of the module
+        """
+        return self.header.get("modules", {})
+
@@ -0,0 +1,277 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Union
+
+from event_bus import event_bus, ErrorEvent
+
+
+def text(value) -> str:
+    """
+    :param value: the value of a text setting
+    :return: the value as a string
+    """
+    return str(value)
+
+
+def number(kind: type, minimum: float = None, maximum: float = None,
+           include_minimum: bool = True) -> Callable[[Any], Union[int, float]]:
+    """
+    :param kind: int or float
+    :param minimum: the smallest allowed value, or None if there is no lower limit
+    :param maximum: the largest allowed value, or None if there is no upper limit
+    :param include_minimum: whether the minimum itself is allowed, False for values that have to be larger, such as
+    a sampling frequency that has to be larger than 0
+    :return: a function that converts a value, or the text of a field, to a number and checks its range
+    """
+    def parse(value) -> Union[int, float]:
+        number_value = kind(value)
+        if minimum is not None and not include_minimum and number_value <= minimum:
+            raise ValueError(f"{value} is not larger than {minimum}")
+        if (minimum is not None and number_value < minimum) or (maximum is not None and number_value > maximum):
+            raise ValueError(f"{value} is not between {minimum} and {maximum}")
+        return number_value
+    return parse
+
+
+def choice(options: List[str]) -> Callable[[Any], str]:
+    """
+    :param options: the allowed values
+    :return: a function that checks that a value is one of the options
+    """
+    def parse(value) -> str:
+        if value not in options:
+            raise ValueError(f"{value} is not one of {', '.join(options)}")
+        return value
+    return parse
+
+
+def boolean(value) -> bool:
+    """
+    :param value: a bool, or the text "true" or "false"
+    :return: the value as a bool
+    """
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("true", "false"):
+        return str(value).lower() == "true"
+    raise ValueError(f"{value} is not true or false")
+
+
+def float_list(value) -> List[float]:
+    """
+    :param value: a list of numbers, or the text of a field with comma separated numbers
+    :return: the numbers as floats
+    """
+    if isinstance(value, str):
+        value = value.split(",")
+    elif not isinstance(value, (list, tuple)):
+        value = [value]
+    return [float(item) for item in value]
+
+
+class Setting:
+    """
+    The definition of a setting: its default value and the function that converts and validates new values.
+    """
+    def __init__(self, default, parse: Callable[[Any], Any]):
+        """
+        constructor for a setting
+        :param default: the value that is used while the setting is not set, None for settings without a default
+        :param parse: the function that converts a value to the type of the setting. It raises a ValueError or
+        TypeError for invalid values
+        """
+        self.default = default
+        self.parse = parse
+
+
+# the settings the application knows, by their key in the settings file
+SETTINGS: Dict[str, Setting] = {
+    "ip-address": Setting("", text),
+    "port": Setting(None, number(int, 0, 65535)),
+    "baud-rate": Setting(1200, number(int, 1)),
+    "filter-type": Setting("low", choice(["low", "high", "band", "stop"])),
+    "filter-order": Setting(5, number(int, 1, 20)),
+    "filter-cutoff": Setting(None, float_list),     # the filter picks a default that fits its type
+    "sampling-frequency": Setting(1000.0, number(float, 0, include_minimum=False)),
+    "estimate-sampling-frequency": Setting(True, boolean),     # whether files use the rate of their x column
+    "spectral-segment-length": Setting(256, number(int, 2)),
+    "rolling-percentile": Setting(50.0, number(float, 0, 100)),
+    "rolling-window": Setting(0.1, number(float, 0, include_minimum=False)),
+    "watch-folder": Setting("", text),             # the folder whose new files are loaded automatically
+    "process-ingest": Setting(False, boolean),     # whether devices are read in a separate process
+    "restore-last-session": Setting(False, boolean),     # whether the session is saved on quit and restored on start
+}
+
+
+class SettingsStore:
+    """
+    Keeps the settings in memory. The settings file is read once, values are validated and converted to their type
+    when they are set, and changes are written to the file in the background a moment later, so a burst of changes
+    results in a single write. Modules subscribe to the settings they use to pick up changes right away.
+
+    Settings should be changed from the GUI thread, the handlers are called on the thread that changes the setting.
+    Reading settings is safe from any thread.
+    """
+    def __init__(self, path: str = "settings.json", write_delay: float = 0.5):
+        """
+        constructor for the settings store
+        :param path: the path to the settings file
+        :param write_delay: the seconds between a change and writing the settings file
+        """
+        self.path = path
+        self.write_delay = write_delay
+        self.values: Dict[str, Any] = {}
+        self.loaded: bool = False
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()      # makes sure writes of the file do not overlap
+        self.write_timer: Union[threading.Timer, None] = None
+        self.dirty: bool = False
+        self.handlers: Dict[str, List[Callable[[Any], None]]] = defaultdict(list)
+
+    def load(self) -> List[str]:
+        """
+        reads the settings file. Invalid values are left out, so their default is used instead. Settings the
+        application does not know are kept as they are.
+        :return: the errors of the settings that were left out
+        """
+        errors = []
+        try:
+            with open(self.path, "r") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = {}
+        except (OSError, ValueError) as e:
+            raw = {}
+            errors.append(f"could not read {self.path}: {e}")
+        values = {}
+        for key, value in raw.items():
+            if key not in SETTINGS:
+                values[key] = value
+                continue
+            try:
+                values[key] = self.parse(key, value)
+            except ValueError as e:
+                errors.append(str(e))
+        with self.lock:
+            self.values = values
+            self.loaded = True
+        return errors
+
+    @staticmethod
+    def parse(key: str, value):
+        """
+        converts a value to the type of a setting.
+        :param key: the key of the setting
+        :param value: the new value, None or an empty string unsets the setting so its default is used
+        :return: the converted value
+        """
+        if value is None or value == "":
+            return None
+        try:
+            return SETTINGS[key].parse(value)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"invalid value for {key}: {e}")
+
+    def get(self, key: str):
+        """
+        :param key: the key of the setting
+        :return: the value of the setting, or its default if it is not set
+        """
+        if not self.loaded:
+            self.load()
+        value = self.values.get(key)
+        if value is None and key in SETTINGS:
+            return SETTINGS[key].default
+        return value
+
+    def update(self, new_settings: Dict[str, Any]) -> None:
+        """
+        changes settings. All values are validated before any of them is changed, so either all or none of the
+        settings change. The handlers of the settings that changed are called, and the file is written a moment
+        later.
+        :param new_settings: the new value per key
+        :return: None
+        """
+        if not self.loaded:
+            self.load()
+        parsed = {key: self.parse(key, value) if key in SETTINGS else value for key, value in new_settings.items()}
+        with self.lock:
+            changed = {key: value for key, value in parsed.items() if self.values.get(key) != value}
+            self.values.update(changed)
+        if not changed:
+            return
+        for key in changed:
+            for handler in list(self.handlers[key]):
+                handler(self.get(key))
+        self.schedule_write()
+
+    def set(self, key: str, value) -> None:
+        """
+        changes a single setting, see update.
+        :param key: the key of the setting
+        :param value: the new value
+        :return: None
+        """
+        self.update({key: value})
+
+    def subscribe(self, key: str, handler: Callable[[Any], None]) -> None:
+        """
+        adds a handler that is called with the new value whenever the setting changes.
+        :param key: the key of the setting
+        :param handler: the function that handles the change
+        :return: None
+        """
+        self.handlers[key].append(handler)
+
+    def unsubscribe(self, key: str, handler: Callable[[Any], None]) -> None:
+        """
+        removes a handler that was subscribed before.
+        :param key: the key of the setting
+        :param handler: the handler to remove
+        :return: None
+        """
+        if handler in self.handlers[key]:
+            self.handlers[key].remove(handler)
+
+    def schedule_write(self) -> None:
+        """
+        writes the settings file after the write delay, unless a write is scheduled already.
+        :return: None
+        """
+        with self.lock:
+            self.dirty = True
+            if self.write_timer is not None:
+                return
+            self.write_timer = threading.Timer(self.write_delay, self.flush)
+            self.write_timer.daemon = True
+            self.write_timer.start()
+
+    def flush(self) -> None:
+        """
+        writes changed settings to the file right away. The file is written next to the settings file first and
+        then moved in place, so it is never left half written. This is called by the timer and when the application
+        is closed.
+        :return: None
+        """
+        with self.write_lock:
+            with self.lock:
+                if self.write_timer is not None:
+                    self.write_timer.cancel()
+                    self.write_timer = None
+                if not self.dirty:
+                    return
+                values = {key: value for key, value in self.values.items() if value is not None}
+                self.dirty = False
+            temporary_path = self.path + ".tmp"
+            try:
+                with open(temporary_path, "w") as f:
+                    json.dump(values, f, indent=4)
+                os.replace(temporary_path, self.path)
+            except OSError as e:
+                event_bus.publish(ErrorEvent(f"could not save the settings: {e}"))
+
+
+# the settings of the application
+settings_store = SettingsStore()
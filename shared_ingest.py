@@ -0,0 +1,365 @@
+import math
+import multiprocessing
+import socket
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, List, Tuple, Union
+
+import numpy as np
+
+
+class SharedRingBuffer:
+    """
+    A ring buffer of samples in shared memory, written by a single process and read by another without locks.
+    Every sample is stored twice, at its position in the ring and one capacity further, so the latest samples are
+    always a contiguous slice.
+
+    The memory starts with the number of samples whose writing started and the number of samples written so far, as
+    64 bit integers, followed by the channels. A reader compares the two counters before and after copying, so it
+    can leave out the samples that the writer overwrote in the meantime.
+    """
+    def __init__(self, capacity: int = 4096, channels: int = 2, name: Union[str, None] = None):
+        """
+        constructor for the ring buffer
+        :param capacity: the number of samples the ring holds
+        :param channels: the number of values per sample, such as x and y
+        :param name: the name of an existing ring buffer to attach to, or None to create a new one
+        """
+        self.capacity = capacity
+        self.channels = channels
+        self.shm = SharedMemory(name=name, create=name is None, size=16 + channels * 2 * capacity * 8)
+        self.started = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.count = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=8)
+        self.data = np.ndarray((channels, 2 * capacity), dtype=np.float64, buffer=self.shm.buf, offset=16)
+
+    @property
+    def name(self) -> str:
+        """
+        :return: the name of the shared memory, which other processes attach with
+        """
+        return self.shm.name
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :return: the size of the shared memory in bytes
+        """
+        return self.shm.size
+
+    def write(self, *columns: np.ndarray) -> None:
+        """
+        appends samples. Only the writing process may call this.
+        :param columns: the values of every channel, all of the same length
+        :return: None
+        """
+        values = np.asarray(columns, dtype=np.float64)[:, -self.capacity:]
+        count = int(self.count[0])
+        positions = (count + np.arange(values.shape[1])) % self.capacity
+        # a reader that copies while the samples are written sees the started count move and drops what it overlaps
+        self.started[0] = count + values.shape[1]
+        self.data[:, positions] = values
+        self.data[:, positions + self.capacity] = values
+        # the count is updated last, so a reader never sees samples that are not written yet
+        self.count[0] = count + values.shape[1]
+
+    def get_count(self) -> int:
+        """
+        :return: the number of samples written so far
+        """
+        return int(self.count[0])
+
+    def get_latest(self, n: int) -> np.ndarray:
+        """
+        :param n: the number of samples
+        :return: a copy of the latest samples with shape (channels, samples), fewer if fewer were written. The oldest
+        samples are left out if the writer overwrote them while they were copied, so old and new samples never mix
+        """
+        count = self.get_count()
+        n = min(n, count, self.capacity)
+        end = count % self.capacity + self.capacity
+        samples = self.data[:, end - n:end].copy()
+        # new samples overwrite the oldest samples of the slice once more than capacity - n of them were started
+        overwritten = int(self.started[0]) - count - (self.capacity - n)
+        return samples[:, max(0, overwritten):]
+
+    def close(self, unlink: bool = False) -> None:
+        """
+        detaches from the shared memory.
+        :param unlink: whether the shared memory is removed, which the creating process does
+        :return: None
+        """
+        self.started = None
+        self.count = None
+        self.data = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedStatus:
+    """
+    A few values in shared memory through which the GUI process controls an ingest process and reads its status.
+    """
+    # the index of every value
+    ACTIVE, BEATS, RMS, HEART_RATE, STATE, STOP, SAMPLING_FREQUENCY, RMS_WINDOW = range(8)
+    # the values of STATE
+    CONNECTING, CONNECTED, DISCONNECTED = 0.0, 1.0, -1.0
+
+    def __init__(self, name: Union[str, None] = None):
+        """
+        constructor for the status
+        :param name: the name of an existing status to attach to, or None to create a new one
+        """
+        self.shm = SharedMemory(name=name, create=name is None, size=8 * 8)
+        self.values = np.ndarray((8,), dtype=np.float64, buffer=self.shm.buf)
+        if name is None:
+            self.values[:] = 0.0
+            self.values[self.HEART_RATE] = math.nan
+
+    @property
+    def name(self) -> str:
+        """
+        :return: the name of the shared memory, which other processes attach with
+        """
+        return self.shm.name
+
+    def get(self, index: int) -> float:
+        """
+        :param index: the index of the value, such as SharedStatus.STATE
+        :return: the value
+        """
+        return float(self.values[index])
+
+    def set(self, index: int, value: float) -> None:
+        """
+        :param index: the index of the value, such as SharedStatus.ACTIVE
+        :param value: the new value
+        :return: None
+        """
+        self.values[index] = value
+
+    def close(self, unlink: bool = False) -> None:
+        """
+        detaches from the shared memory.
+        :param unlink: whether the shared memory is removed, which the creating process does
+        :return: None
+        """
+        self.values = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def parse_samples(lines: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    parses lines of "x,y" samples. All lines are converted at once, lines that cannot be parsed are only skipped
+    one by one when the fast path fails.
+    :param lines: the lines
+    :return: the x and y values
+    """
+    lines = [line for line in lines if "," in line]
+    joined = ",".join(lines)
+    try:
+        if joined.count(",") != 2 * len(lines) - 1:
+            raise ValueError("a line does not hold exactly two values")
+        values = np.array(joined.split(","), dtype=np.float64).reshape(-1, 2)
+        return values[:, 0], values[:, 1]
+    except ValueError:
+        samples = []
+        for line in lines:
+            try:
+                x, y = map(float, line.split(","))
+                samples.append((x, y))
+            except ValueError:
+                continue
+        values = np.array(samples, dtype=np.float64).reshape(-1, 2)
+        return values[:, 0], values[:, 1]
+
+
+def open_connection(config: dict) -> Tuple[Callable[[], bytes], Callable[[], None]]:
+    """
+    opens the connection of a device in the ingest process. The connection classes are not used here, since they
+    show dialogs, which a process without a GUI cannot do.
+    :param config: the settings of the connection, see ConnectionModule.connect_internet and connect_serial
+    :return: a function that reads the next bytes, which raises an OSError when the connection is lost, and a function
+    that closes the connection
+    """
+    if config["type"] == "internet":
+        sock = socket.create_connection((config["ip"], int(config["port"])), timeout=1)
+
+        def read() -> bytes:
+            data = sock.recv(64 * 1024)
+            if not data:
+                raise OSError("the device closed the connection")
+            return data
+        return read, sock.close
+    import serial
+    device = serial.Serial(config["port"], int(config["baud_rate"]), timeout=1)
+    return lambda: device.read(max(1, device.in_waiting)), device.close
+
+
+def run_ingest(config: dict, samples_name: str, rms_name: str, status_name: str, sample_rate: float) -> None:
+    """
+    the main function of an ingest process: it reads a device, parses the samples, detects beats and computes the rms
+    envelope, and writes the results to shared memory. It stops when the GUI process sets STOP or the connection is
+    lost.
+    :param config: the settings of the connection
+    :param samples_name: the name of the ring buffer for the samples
+    :param rms_name: the name of the ring buffer for the rms envelope
+    :param status_name: the name of the shared status
+    :param sample_rate: the seconds between reads
+    :return: None
+    """
+    samples = SharedRingBuffer(name=samples_name)
+    rms_samples = SharedRingBuffer(name=rms_name)
+    status = SharedStatus(status_name)
+    try:
+        read, close = open_connection(config)
+    except OSError:
+        status.set(SharedStatus.STATE, SharedStatus.DISCONNECTED)
+        return
+    status.set(SharedStatus.STATE, SharedStatus.CONNECTED)
+    # scipy takes a while to import, the device is connected first so the GUI does not wait for it
+    import custom_math as cm
+    remainder = ""
+    stream_settings = None
+    peak_detector = None
+    rolling_stats = None
+    try:
+        while not status.get(SharedStatus.STOP):
+            try:
+                data = read()
+            except OSError:
+                break
+            # lines can be split over two reads, the incomplete last line is kept for the next read
+            lines = (remainder + data.decode("utf-8", errors="ignore")).split("\n")
+            remainder = lines.pop()
+            if status.get(SharedStatus.ACTIVE) and lines:
+                x, y = parse_samples(lines)
+                if x.size:
+                    samples.write(x, y)
+                    # the detectors start over when the settings change or they are switched off
+                    settings = (status.get(SharedStatus.SAMPLING_FREQUENCY), status.get(SharedStatus.RMS_WINDOW))
+                    if settings != stream_settings:
+                        stream_settings = settings
+                        peak_detector = rolling_stats = None
+                    sampling_frequency, rms_window = stream_settings
+                    if status.get(SharedStatus.BEATS):
+                        if peak_detector is None:
+                            peak_detector = cm.StreamingPeakDetector(sampling_frequency)
+                        peak_detector.process(y)
+                        if peak_detector.heart_rate is not None:
+                            status.set(SharedStatus.HEART_RATE, peak_detector.heart_rate)
+                    else:
+                        peak_detector = None
+                    if status.get(SharedStatus.RMS):
+                        if rolling_stats is None:
+                            rolling_stats = cm.StreamingRollingStats(max(1, int(rms_window * sampling_frequency)),
+                                                                     statistics=("rms",))
+                        rms_samples.write(x, rolling_stats.process(y)["rms"])
+                    else:
+                        rolling_stats = None
+            time.sleep(sample_rate)
+    finally:
+        close()
+        status.set(SharedStatus.STATE, SharedStatus.DISCONNECTED)
+        samples.close()
+        rms_samples.close()
+        status.close()
+
+
+class ProcessIngest:
+    """
+    Reads a device in a separate process, so reading, parsing and the live analysis do not compete with the GUI for
+    the GIL. The process writes the samples and the rms envelope into shared memory ring buffers, from which the image
+    widget copies the latest samples every frame, and its status into a few shared values.
+    """
+    def __init__(self, device_name: str, config: dict, sampling_frequency: float, rms_window: float,
+                 capacity: int = 4096, sample_rate: float = 0.01):
+        """
+        constructor for the ingest process, the process is started with start
+        :param device_name: the name of the device
+        :param config: the settings of the connection
+        :param sampling_frequency: the sampling frequency of the device in Hz
+        :param rms_window: the length of the rms window in seconds
+        :param capacity: the number of samples the ring buffers hold
+        :param sample_rate: the seconds between reads
+        """
+        self.device_name = device_name
+        self.samples = SharedRingBuffer(capacity)
+        self.rms_samples = SharedRingBuffer(capacity)
+        self.status = SharedStatus()
+        self.set_stream_settings(sampling_frequency, rms_window)
+        # spawn starts a fresh interpreter, forking a process with a running Qt application is not safe
+        self.process = multiprocessing.get_context("spawn").Process(
+            target=run_ingest, args=(config, self.samples.name, self.rms_samples.name, self.status.name, sample_rate),
+            name=f"ingest {device_name}", daemon=True)
+
+    def start(self) -> None:
+        """
+        starts the ingest process
+        :return: None
+        """
+        self.process.start()
+
+    def is_connecting(self) -> bool:
+        """
+        :return: whether the process is still starting or connecting to the device
+        """
+        return self.status.get(SharedStatus.STATE) == SharedStatus.CONNECTING and \
+            (self.process.pid is None or self.process.is_alive())
+
+    def is_connected(self) -> bool:
+        """
+        :return: whether the process is connected to the device
+        """
+        return self.status.get(SharedStatus.STATE) == SharedStatus.CONNECTED
+
+    def set_option(self, index: int, enabled: bool) -> None:
+        """
+        switches an option of the process on or off.
+        :param index: SharedStatus.ACTIVE, SharedStatus.BEATS or SharedStatus.RMS
+        :param enabled: whether the option is on
+        :return: None
+        """
+        self.status.set(index, 1.0 if enabled else 0.0)
+        if index == SharedStatus.BEATS and not enabled:
+            self.status.set(SharedStatus.HEART_RATE, math.nan)
+
+    def set_stream_settings(self, sampling_frequency: float, rms_window: float) -> None:
+        """
+        changes the sampling frequency and rms window while the process runs.
+        :param sampling_frequency: the sampling frequency of the device in Hz
+        :param rms_window: the length of the rms window in seconds
+        :return: None
+        """
+        self.status.set(SharedStatus.SAMPLING_FREQUENCY, sampling_frequency)
+        self.status.set(SharedStatus.RMS_WINDOW, rms_window)
+
+    def get_heart_rate(self) -> Union[float, None]:
+        """
+        :return: the heart rate in beats per minute, or None if it is not known
+        """
+        heart_rate = self.status.get(SharedStatus.HEART_RATE)
+        return None if math.isnan(heart_rate) else heart_rate
+
+    def get_memory_usage(self) -> int:
+        """
+        :return: the bytes of shared memory held for the device
+        """
+        return self.samples.nbytes + self.rms_samples.nbytes + self.status.shm.size
+
+    def stop(self) -> None:
+        """
+        stops the process and removes the shared memory.
+        :return: None
+        """
+        self.status.set(SharedStatus.STOP, 1.0)
+        if self.process.pid is not None:    # the process was started
+            self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self.samples.close(unlink=True)
+        self.rms_samples.close(unlink=True)
+        self.status.close(unlink=True)
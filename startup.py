@@ -0,0 +1,73 @@
+import importlib.util
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+
+def lazy_import(name: str):
+    """
+    imports a module lazily: the module object is returned right away, but the module itself is only executed when
+    one of its attributes is used for the first time. This keeps heavy libraries such as vtk and pandas out of the
+    startup of the application when they are not needed yet.
+    :param name: the full name of the module
+    :return: the module
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class StartupTimer:
+    """
+    Measures how long the steps of the startup take, such as importing the user interface and creating a module,
+    so the report shows where the startup time goes.
+    """
+    def __init__(self):
+        self.start: float = time.perf_counter()
+        self.steps: List[Tuple[str, float, float]] = []    # (description, seconds since the start, duration)
+
+    @contextmanager
+    def measure(self, description: str) -> Iterator[None]:
+        """
+        context manager that measures the duration of the code inside it.
+        :param description: the description of the step in the report
+        :return: None
+        """
+        step_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.steps.append((description, end - self.start, end - step_start))
+
+    def mark(self, description: str) -> None:
+        """
+        adds a moment without a duration to the report, such as the window being shown.
+        :param description: the description of the moment in the report
+        :return: None
+        """
+        self.steps.append((description, time.perf_counter() - self.start, 0.0))
+
+    def get_report(self) -> str:
+        """
+        :return: a table with every step, the time since the start at which it finished and its duration
+        """
+        width = max([len(description) for description, _, _ in self.steps] + [len("step")])
+        lines = [f"{'step':<{width}}  {'at (s)':>8}  {'took (s)':>8}"]
+        for description, at, duration in self.steps:
+            took = f"{duration:8.3f}" if duration else ""
+            lines.append(f"{description:<{width}}  {at:8.3f}  {took:>8}")
+        return "\n".join(lines)
+
+
+# the timer of this run of the application, it starts when this module is first imported
+startup_timer = StartupTimer()
@@ -0,0 +1,136 @@
+# the actors, volumes and transfer functions that the vtk image widget and the offscreen renderer share. This module
+# does not use Qt, so the render processes of the offscreen renderer can import it without loading Qt.
+from typing import Callable
+
+import numpy as np
+
+from vtkmodules.vtkCommonDataModel import vtkPolyData, vtkImageData, vtkPiecewiseFunction
+from vtkmodules.vtkFiltersCore import vtkPolyDataNormals
+from vtkmodules.vtkRenderingCore import vtkPolyDataMapper, vtkDataSetMapper, vtkImageActor, vtkActor, vtkVolumeProperty, \
+    vtkColorTransferFunction, vtkVolume
+from vtkmodules.vtkRenderingLOD import vtkLODActor
+from vtkmodules.vtkRenderingVolumeOpenGL2 import vtkSmartVolumeMapper
+
+from data_manager import VolumeStatistics
+
+# transfer function presets for volumes. Every point is (percentile, opacity, (r, g, b)); the percentiles are taken from
+# the histogram of the volume, so a few outlier voxels do not shift the whole transfer function.
+TRANSFER_FUNCTION_PRESETS = {
+    "default": [(1, 0.0, (0.0, 0.0, 0.0)),           # Air, Black
+                (90, 0.1, (0.55, 0.25, 0.15)),       # Low-density tissue, Dark brownish-red
+                (97, 0.3, (0.75, 0.5, 0.4)),         # Soft tissue, Pinkish
+                (99, 0.6, (0.9, 0.75, 0.6)),         # Higher-density tissue, Light pink
+                (99.9, 0.85, (1.0, 1.0, 1.0))],      # Bone, White
+    "CT angio": [(95, 0.0, (0.3, 0.0, 0.0)),         # everything but the contrast agent is transparent
+                 (98, 0.15, (0.8, 0.1, 0.1)),        # smaller vessels, red
+                 (99.5, 0.6, (1.0, 0.5, 0.4)),       # larger vessels, light red
+                 (99.95, 0.9, (1.0, 1.0, 0.9))],     # calcifications and bone, white
+    "MR": [(50, 0.0, (0.0, 0.0, 0.0)),               # background noise
+           (75, 0.05, (0.3, 0.3, 0.3)),              # soft tissue, dark gray
+           (95, 0.3, (0.7, 0.7, 0.7)),               # brighter tissue, light gray
+           (99.5, 0.7, (1.0, 1.0, 1.0))],            # brightest structures, white
+    "bone": [(97, 0.0, (0.6, 0.5, 0.4)),             # soft tissue is transparent
+             (99, 0.5, (0.9, 0.85, 0.7)),            # bone, beige
+             (99.9, 0.9, (1.0, 1.0, 0.95))],         # dense bone, white
+}
+
+
+def prepare_data(data, report: Callable[[float], None]) -> dict:
+    """
+    prepares data for plotting. Meshes without normals get them computed, so they are shaded smoothly.
+    This runs in a background thread.
+    :param data: the data to prepare
+    :param report: the function to report the progress with
+    :return: a dictionary with the prepared "data"
+    """
+    if isinstance(data, vtkPolyData) and data.GetNumberOfPolys() > 0 and data.GetPointData().GetNormals() is None:
+        normals = vtkPolyDataNormals()
+        normals.SetInputData(data)
+        normals.SplittingOff()  # splitting sharp edges would duplicate points
+        normals.AddObserver("ProgressEvent", lambda caller, event: report(caller.GetProgress()))
+        normals.Update()
+        data = vtkPolyData()
+        data.ShallowCopy(normals.GetOutput())
+    return {"data": data}
+
+
+def create_actor(data, opacity: float = 1.0, use_lod: bool = False):
+    """
+    creates the correct mapper and actor for the data type.
+    :param data: the prepared data
+    :param opacity: the opacity of meshes
+    :param use_lod: whether a mesh gets an actor that can switch to a decimated mapper while the camera is moving
+    :return: the actor
+    """
+    if isinstance(data, vtkImageData):
+        actor = vtkImageActor()
+        actor.GetMapper().SetInputData(data)
+        return actor
+    mapper = vtkPolyDataMapper() if isinstance(data, vtkPolyData) else vtkDataSetMapper()
+    mapper.SetInputData(data)
+    actor = vtkLODActor() if use_lod else vtkActor()
+    actor.SetMapper(mapper)
+    if use_lod:
+        # a vtkLODActor without levels adds a point cloud and an outline as its own levels on the first render, the
+        # full resolution mapper is added as the first level instead, the decimated levels are added later
+        actor.AddLODMapper(mapper)
+    actor.GetProperty().SetOpacity(opacity)
+    return actor
+
+
+def build_volume_property(statistics: VolumeStatistics, preset: str) -> vtkVolumeProperty:
+    """
+    builds the volume property with the opacity and color transfer functions of a preset.
+    :param statistics: the statistics of the volume
+    :param preset: the name of the preset in TRANSFER_FUNCTION_PRESETS
+    :return: the volume property
+    """
+    volume_property = vtkVolumeProperty()
+    volume_property.ShadeOn()
+    volume_property.SetInterpolationTypeToLinear()
+    volume_property.SetScalarOpacity(vtkPiecewiseFunction())
+    volume_property.SetColor(vtkColorTransferFunction())
+    apply_transfer_function_preset(volume_property, statistics, preset)
+    return volume_property
+
+
+def apply_transfer_function_preset(volume_property: vtkVolumeProperty, statistics: VolumeStatistics,
+                                   preset: str) -> None:
+    """
+    replaces the points of the transfer functions of a volume property by those of a preset. The functions are
+    changed in place, so the mapper and the proxy volume that share them pick up the change at the next render.
+    :param volume_property: the volume property
+    :param statistics: the statistics of the volume
+    :param preset: the name of the preset in TRANSFER_FUNCTION_PRESETS
+    :return: None
+    """
+    points = TRANSFER_FUNCTION_PRESETS[preset]
+    scalars = statistics.percentile([point[0] for point in points])
+    # the points should be strictly increasing, which percentiles in a flat part of the histogram are not
+    minimum_step = max(statistics.maximum - statistics.minimum, 1.0) * 1e-6
+    scalars = np.maximum.accumulate(scalars + minimum_step * np.arange(len(scalars)))
+    opacity_transfer_function = volume_property.GetScalarOpacity()
+    color_transfer_function = volume_property.GetRGBTransferFunction()
+    opacity_transfer_function.RemoveAllPoints()
+    color_transfer_function.RemoveAllPoints()
+    for scalar, (percentile, opacity, color) in zip(scalars, points):
+        opacity_transfer_function.AddPoint(scalar, opacity)
+        color_transfer_function.AddRGBPoint(scalar, *color)
+
+
+def create_volume(volume: vtkImageData, volume_property: vtkVolumeProperty) -> vtkVolume:
+    """
+    creates the mapper and the volume actor for a volume.
+    :param volume: the volumetric data
+    :param volume_property: the volume property with the transfer functions
+    :return: the volume actor
+    """
+    # Create a volume mapper
+    volume_mapper = vtkSmartVolumeMapper()
+    volume_mapper.SetInputData(volume)
+
+    # Create the volume
+    volume_actor = vtkVolume()
+    volume_actor.SetMapper(volume_mapper)
+    volume_actor.SetProperty(volume_property)
+    return volume_actor